@@ -0,0 +1,101 @@
+"""
+Доступ к боту: пользователи с ролями и квоты на ресурсоемкие действия
+
+Каждое действие требует минимальную роль и стоит некоторое число токенов.
+У каждого пользователя своя корзина токенов, поэтому один клиент, даже
+авторизованный, не может непрерывными скриншотами или списками процессов
+загрузить управляемый компьютер.
+"""
+
+import time
+from typing import Dict, FrozenSet, List, Optional
+
+from metrics import registry
+from rate_limiter import TokenBucket
+
+# Роли по возрастанию прав
+VIEWER = "viewer"      # просмотр: скриншоты, списки, информация, статистика
+OPERATOR = "operator"  # управление без последствий: звук, окна, Wake-on-LAN, файлы, макросы
+ADMIN = "admin"        # питание, завершение процессов, настройка, журнал действий
+
+# Роли, права которых есть у роли: проверка права - поиск в множестве
+ROLE_PERMISSIONS: Dict[str, FrozenSet[str]] = {
+    VIEWER: frozenset({VIEWER}),
+    OPERATOR: frozenset({VIEWER, OPERATOR}),
+    ADMIN: frozenset({VIEWER, OPERATOR, ADMIN}),
+}
+
+# Стоимость действий в токенах квоты
+COST_LIGHT = 1.0    # меню, навигация, команды без нагрузки на компьютер
+COST_MEDIUM = 3.0   # перечисление процессов и окон, информация о системе
+COST_HEAVY = 10.0   # скриншоты, передача файлов, макросы
+
+access_denied = registry.counter(
+    "bot_access_denied_total", "Отклоненные запросы пользователей", ["reason"])
+
+
+def parse_users(spec: str) -> Dict[int, str]:
+    """Разбирает USERS вида "123456789:admin,987654321:viewer" (роль по умолчанию - operator)"""
+    users = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        user_id, _, role = item.partition(":")
+        role = role.strip() or OPERATOR
+        if not user_id.strip().isdigit() or role not in ROLE_PERMISSIONS:
+            raise ValueError(f"Некорректное описание пользователя: {item}")
+        users[int(user_id)] = role
+    return users
+
+
+class AccessControl:
+    """
+    Роли пользователей и их квоты
+
+    Если ни один пользователь не задан, бот, как и раньше, доступен всем
+    с правами администратора; квоты при этом все равно действуют.
+    """
+
+    def __init__(self, users: Dict[int, str], rate: float = 1.0, burst: float = 30.0):
+        for role in users.values():
+            if role not in ROLE_PERMISSIONS:
+                raise ValueError(f"Неизвестная роль: {role}")
+        self._roles = dict(users)
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[int, TokenBucket] = {}
+
+    def role(self, user_id: int) -> Optional[str]:
+        if not self._roles:
+            return ADMIN
+        return self._roles.get(user_id)
+
+    def is_authorized(self, user_id: int) -> bool:
+        return not self._roles or user_id in self._roles
+
+    def allows(self, user_id: int, required: str) -> bool:
+        """Есть ли у пользователя права роли required"""
+        role = self.role(user_id)
+        return role is not None and required in ROLE_PERMISSIONS[role]
+
+    def users_with_role(self, role: str) -> List[int]:
+        return [user_id for user_id, user_role in self._roles.items() if user_role == role]
+
+    def charge(self, user_id: int, cost: float) -> float:
+        """
+        Списывает cost токенов с квоты пользователя
+
+        Returns:
+            0, если токены списаны, иначе через сколько секунд их будет достаточно
+        """
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+        now = time.monotonic()
+        wait = bucket.delay(now, cost)
+        if wait > 0:
+            access_denied.inc(reason="quota")
+            return wait
+        bucket.take(now, cost)
+        return 0.0
@@ -0,0 +1,160 @@
+"""
+Реестр действий бота: поиск обработчика по callback_data и его выполнение
+"""
+
+import asyncio
+import inspect
+import logging
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+from access import COST_LIGHT, OPERATOR
+from metrics import track
+from resource_locks import ResourceLocks, resource_locks
+
+logger = logging.getLogger(__name__)
+
+# Способы выполнения обработчика
+INLINE = "inline"  # корутина (в т.ч. запуск программ через command_runner), выполняется в цикле событий
+THREAD = "thread"  # блокирующая функция, выполняется в пуле потоков
+
+RUN_MODES = (INLINE, THREAD)
+
+# Разделитель префикса и аргумента в callback_data: в ключах действий его нет,
+# поэтому аргумент может содержать что угодно, в том числе "_"
+ARG_SEPARATOR = ":"
+
+# Telegram принимает callback_data не длиннее 64 байт. Имена, которые попадают в
+# кнопки аргументом (макросы, компьютеры, агенты), ограничены так, чтобы с запасом
+# поместилось и подтверждение: confirm:<ключ действия>:<имя>
+MAX_CALLBACK_DATA = 64
+MAX_ARGUMENT_SIZE = 32
+
+
+class Action(NamedTuple):
+    """
+    Описание действия
+
+    key: callback_data кнопки; для prefix=True - префикс, а остаток после
+        ARG_SEPARATOR передается обработчику аргументом (kill_process:<pid>,
+        см. callback_data)
+    handler: обработчик. Обычное действие вызывается как handler() или
+        handler(arg) и возвращает текст результата. Действие с view=True само
+        рисует ответ, вызывается как handler(query) или handler(query, arg) и
+        возвращает итог для журнала аудита ("✅ ..." / "❌ ...")
+    title: название действия для запроса подтверждения ("выключение компьютера")
+    emoji: значок перед текстом результата
+    confirm: требуется ли подтверждение пользователем
+    mode: способ выполнения (INLINE или THREAD)
+    locks: ресурсы (resource_locks), которые действие захватывает на время выполнения
+    audit: записывать ли выполнение в журнал аудита (False для навигации по меню)
+    role: минимальная роль пользователя (access.VIEWER, OPERATOR или ADMIN)
+    cost: стоимость в токенах квоты пользователя (access.COST_LIGHT, COST_MEDIUM, COST_HEAVY)
+    """
+    key: str
+    handler: Callable[..., Any]
+    title: str = ""
+    emoji: str = ""
+    confirm: bool = False
+    mode: str = INLINE
+    prefix: bool = False
+    view: bool = False
+    locks: Tuple[str, ...] = ()
+    audit: bool = True
+    role: str = OPERATOR
+    cost: float = COST_LIGHT
+
+    @property
+    def name(self) -> str:
+        """Уникальное имя действия для метрик и журналов"""
+        return f"{self.key}{ARG_SEPARATOR}*" if self.prefix else self.key
+
+
+def callback_data(key: str, arg: Any) -> str:
+    """callback_data параметризованного действия: ("kill_process", 123) -> kill_process:123"""
+    return f"{key}{ARG_SEPARATOR}{arg}"
+
+
+def check_argument(value: str, what: str) -> str:
+    """Проверяет, что имя поместится аргументом в callback_data кнопки; возвращает его же"""
+    size = len(value.encode("utf-8"))
+    if not value or size > MAX_ARGUMENT_SIZE:
+        raise ValueError(f"{what} {value!r}: нужно от 1 до {MAX_ARGUMENT_SIZE} байт в UTF-8, сейчас {size}")
+    return value
+
+
+class ActionRegistry:
+    """
+    Реестр действий
+
+    Точные ключи ищутся в словаре за O(1). У параметризованных действий
+    префикс отделен от аргумента ARG_SEPARATOR, и префикс тоже ищется в
+    словаре: macro:run_x - макрос run_x, а macro_run:x - запуск макроса x.
+    """
+
+    def __init__(self, locks: Optional[ResourceLocks] = None):
+        self._exact: Dict[str, Action] = {}
+        self._prefixes: Dict[str, Action] = {}
+        self.locks = locks or resource_locks
+
+    def register(self, action: Action) -> Action:
+        """Регистрирует действие"""
+        if action.mode not in RUN_MODES:
+            raise ValueError(f"Неизвестный способ выполнения {action.mode!r} у действия {action.key}")
+
+        if ARG_SEPARATOR in action.key:
+            raise ValueError(f"В ключе действия {action.key} не может быть {ARG_SEPARATOR!r}")
+        confirmation = callback_data("confirm", callback_data(action.key, ""))
+        if action.prefix and len(confirmation) + MAX_ARGUMENT_SIZE > MAX_CALLBACK_DATA:
+            raise ValueError(f"Ключ действия {action.key} слишком длинный для callback_data")
+
+        table = self._prefixes if action.prefix else self._exact
+        if action.key in table:
+            raise ValueError(f"Действие {action.key} уже зарегистрировано")
+        table[action.key] = action
+        return action
+
+    def action(self, key: str, **options) -> Callable:
+        """Декоратор для регистрации обработчика как действия"""
+        def decorator(handler: Callable) -> Callable:
+            self.register(Action(key, handler, **options))
+            return handler
+        return decorator
+
+    def get(self, key: str) -> Optional[Action]:
+        """Действие по точному ключу"""
+        return self._exact.get(key)
+
+    def resolve(self, data: str) -> Optional[Tuple[Action, Optional[str]]]:
+        """
+        Находит действие по callback_data
+
+        Returns:
+            (действие, аргумент) или None; для точных действий аргумент None
+        """
+        action = self._exact.get(data)
+        if action is not None:
+            return action, None
+
+        key, separator, arg = data.partition(ARG_SEPARATOR)
+        action = self._prefixes.get(key) if separator else None
+        if action is None:
+            return None
+        return action, arg
+
+    async def run(self, action: Action, arg: Optional[str] = None, query=None) -> Any:
+        """Выполняет действие выбранным способом, время и ошибки попадают в метрики"""
+        args = []
+        if action.view:
+            args.append(query)
+        if action.prefix:
+            args.append(arg)
+
+        with track(f"action:{action.name}"):
+            async with self.locks.hold(action.locks):
+                if action.mode == THREAD:
+                    return await asyncio.to_thread(action.handler, *args)
+
+                result = action.handler(*args)
+                if inspect.isawaitable(result):
+                    result = await result
+                return result
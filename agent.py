@@ -0,0 +1,329 @@
+"""
+Агент: управление этим компьютером по сети для бота-концентратора
+
+Запуск на управляемом компьютере:
+
+    python agent.py                  # настоящие контроллеры Windows
+    python agent.py --fake office    # поддельный бэкенд для проверки без Windows
+
+Адрес и токен задаются в .env: AGENT_LISTEN, AGENT_PORT, AGENT_TOKEN.
+"""
+
+import argparse
+import asyncio
+import hmac
+import inspect
+import logging
+import os
+import secrets
+import socket
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+from agent_protocol import (AGENT, CHALLENGE_SIZE, CHUNK, CHUNK_SIZE, CLIENT, END, ERROR, HELLO, OPERATIONS, REQUEST,
+                            RESULT, STREAM_OPERATIONS, ProtocolError, decode_json, encode_frame, encode_json,
+                            new_challenge, proof, read_frame)
+from metrics import track
+
+logger = logging.getLogger(__name__)
+
+
+class AgentBackend(ABC):
+    """Операции агента; имена методов совпадают с agent_protocol.OPERATIONS"""
+
+    def ping(self) -> Dict[str, Any]:
+        return {"name": socket.gethostname(), "time": time.time()}
+
+    @abstractmethod
+    def system_info(self) -> Dict[str, str]: ...
+
+    @abstractmethod
+    def processes(self, limit: Optional[int] = 20) -> List[Dict[str, str]]: ...
+
+    @abstractmethod
+    def kill_process(self, pid: int) -> str: ...
+
+    @abstractmethod
+    def windows(self, limit: Optional[int] = None) -> List[Dict[str, str]]: ...
+
+    @abstractmethod
+    def activate_window(self, hwnd: int) -> str: ...
+
+    @abstractmethod
+    async def shutdown(self) -> str: ...
+
+    @abstractmethod
+    async def restart(self) -> str: ...
+
+    @abstractmethod
+    async def sleep(self) -> str: ...
+
+    @abstractmethod
+    async def hibernate(self) -> str: ...
+
+    @abstractmethod
+    async def lock_screen(self) -> str: ...
+
+    @abstractmethod
+    def screenshot(self, screenshot_type: str = "full",
+                   window_title: Optional[str] = None) -> Tuple[bool, str, Optional[bytes]]: ...
+
+
+class WindowsAgentBackend(AgentBackend):
+    """Бэкенд на контроллерах Windows этого компьютера"""
+
+    def __init__(self):
+        from screenshot_controller import WindowsScreenshot
+        from windows_controller import WindowsProcessManager, WindowsSystemController, WindowsWindowManager
+
+        self._system = WindowsSystemController
+        self._processes = WindowsProcessManager
+        self._windows = WindowsWindowManager
+        self._screenshot = WindowsScreenshot()
+
+    def system_info(self) -> Dict[str, str]:
+        return self._system.get_system_info()
+
+    def processes(self, limit: Optional[int] = 20) -> List[Dict[str, str]]:
+        return self._processes.get_running_processes(limit)
+
+    def kill_process(self, pid: int) -> str:
+        return self._processes.kill_process(int(pid))
+
+    def windows(self, limit: Optional[int] = None) -> List[Dict[str, str]]:
+        return self._windows.get_visible_windows(limit)
+
+    def activate_window(self, hwnd: int) -> str:
+        return self._windows.activate_window(hwnd)
+
+    async def shutdown(self) -> str:
+        return await self._system.shutdown()
+
+    async def restart(self) -> str:
+        return await self._system.restart()
+
+    async def sleep(self) -> str:
+        return await self._system.sleep()
+
+    async def hibernate(self) -> str:
+        return await self._system.hibernate()
+
+    async def lock_screen(self) -> str:
+        return await self._system.lock_screen()
+
+    def screenshot(self, screenshot_type: str = "full",
+                   window_title: Optional[str] = None) -> Tuple[bool, str, Optional[bytes]]:
+        return self._screenshot.get_screenshot_as_bytes(screenshot_type, window_title)
+
+
+class FakeAgentBackend(AgentBackend):
+    """Поддельный бэкенд для проверки концентратора без Windows"""
+
+    def __init__(self, name: str = "fake", screenshot_size: int = 512 * 1024, delay: float = 0.05):
+        self.name = name
+        self.screenshot_size = screenshot_size
+        self.delay = delay
+        self.calls: List[str] = []
+
+    def ping(self) -> Dict[str, Any]:
+        return {"name": self.name, "time": time.time()}
+
+    def system_info(self) -> Dict[str, str]:
+        self.calls.append("system_info")
+        return {"Компьютер": self.name, "CPU": "4 ядер, загрузка: 12.5%"}
+
+    def processes(self, limit: Optional[int] = 20) -> List[Dict[str, str]]:
+        self.calls.append("processes")
+        processes = [{"pid": str(1000 + i), "name": f"{self.name}-{i}.exe", "cpu": f"{50 / (i + 1):.1f}%",
+                      "memory": "1.0%"} for i in range(50)]
+        return processes if limit is None else processes[:limit]
+
+    def kill_process(self, pid: int) -> str:
+        self.calls.append("kill_process")
+        return f"✅ Процесс {self.name}-x.exe (PID: {pid}) завершен"
+
+    def windows(self, limit: Optional[int] = None) -> List[Dict[str, str]]:
+        self.calls.append("windows")
+        windows = [{"hwnd": str(100 + i), "title": f"Окно {i}", "process": f"{self.name}.exe"} for i in range(5)]
+        return windows if limit is None else windows[:limit]
+
+    def activate_window(self, hwnd: int) -> str:
+        self.calls.append("activate_window")
+        return f"✅ Окно '{hwnd}' активировано"
+
+    async def _power(self, operation: str) -> str:
+        self.calls.append(operation)
+        await asyncio.sleep(self.delay)
+        return f"✅ {self.name}: команда {operation} отправлена"
+
+    async def shutdown(self) -> str:
+        return await self._power("shutdown")
+
+    async def restart(self) -> str:
+        return await self._power("restart")
+
+    async def sleep(self) -> str:
+        return await self._power("sleep")
+
+    async def hibernate(self) -> str:
+        return await self._power("hibernate")
+
+    async def lock_screen(self) -> str:
+        return await self._power("lock_screen")
+
+    def screenshot(self, screenshot_type: str = "full",
+                   window_title: Optional[str] = None) -> Tuple[bool, str, Optional[bytes]]:
+        self.calls.append("screenshot")
+        time.sleep(self.delay)
+        return True, f"Скриншот {self.name}", secrets.token_bytes(self.screenshot_size)
+
+
+class AgentServer:
+    """
+    Сервер агента
+
+    Клиент сначала проходит рукопожатие HELLO (agent_protocol); после этого каждый REQUEST
+    выполняется в отдельной задаче, так что медленный скриншот не задерживает
+    остальные запросы того же соединения. Синхронные операции бэкенда
+    выполняются в пуле потоков.
+    """
+
+    def __init__(self, backend: AgentBackend, token: str, host: str = "0.0.0.0", port: int = 8765,
+                 name: Optional[str] = None):
+        if not token:
+            raise ValueError("Для агента нужен AGENT_TOKEN")
+        self.backend = backend
+        self.token = token
+        self.host = host
+        self.port = port
+        self.name = name or socket.gethostname()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set[asyncio.StreamWriter] = set()
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Агент {self.name} слушает {self.host}:{self.port}")
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._connections):
+                writer.close()
+            while self._connections:
+                await asyncio.sleep(0.01)
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer = writer.get_extra_info("peername")
+        self._connections.add(writer)
+        write_lock = asyncio.Lock()
+        tasks: Set[asyncio.Task] = set()
+        try:
+            challenge = new_challenge()
+            writer.write(encode_frame(HELLO, 0, challenge))
+            await writer.drain()
+            kind, _, payload = await asyncio.wait_for(read_frame(reader), 10)
+            client_challenge, client_proof = payload[:CHALLENGE_SIZE], payload[CHALLENGE_SIZE:]
+            if (kind != HELLO or len(client_challenge) != CHALLENGE_SIZE or not hmac.compare_digest(
+                    client_proof, proof(self.token, CLIENT, challenge, client_challenge))):
+                logger.warning(f"Подключение {peer} отклонено: неверный токен")
+                return
+            writer.write(encode_json(HELLO, 0, {
+                "name": self.name, "proof": proof(self.token, AGENT, client_challenge, challenge).hex()}))
+            await writer.drain()
+
+            while True:
+                kind, request_id, payload = await read_frame(reader)
+                if kind != REQUEST:
+                    raise ProtocolError(f"Неожиданный кадр {kind}")
+                task = asyncio.create_task(self._handle_request(writer, write_lock, request_id, payload))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            pass
+        except ProtocolError as e:
+            logger.warning(f"Ошибка протокола от {peer}: {e}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _handle_request(self, writer: asyncio.StreamWriter, write_lock: asyncio.Lock,
+                              request_id: int, payload: bytes) -> None:
+        async def send(frame: bytes) -> None:
+            async with write_lock:
+                writer.write(frame)
+                await writer.drain()
+
+        try:
+            request = decode_json(payload)
+            operation = request["op"]
+            args = request.get("args", [])
+            if operation not in OPERATIONS:
+                raise ValueError(f"Неизвестная операция: {operation}")
+
+            with track(f"agent:{operation}"):
+                method = getattr(self.backend, operation)
+                if inspect.iscoroutinefunction(method):
+                    result = await method(*args)
+                else:
+                    result = await asyncio.to_thread(method, *args)
+        except Exception as e:
+            await send(encode_json(ERROR, request_id, {"error": str(e)}))
+            return
+
+        if operation not in STREAM_OPERATIONS:
+            await send(encode_json(RESULT, request_id, result))
+            return
+
+        success, message, data = result
+        if not success or data is None:
+            await send(encode_json(ERROR, request_id, {"error": message}))
+            return
+        # Кадры по CHUNK_SIZE: блокировка отпускается между ними, и ответы
+        # на другие запросы не ждут окончания всего скриншота
+        view = memoryview(data)
+        for offset in range(0, len(view), CHUNK_SIZE):
+            await send(encode_frame(CHUNK, request_id, view[offset:offset + CHUNK_SIZE].tobytes()))
+        await send(encode_json(END, request_id, {"message": message, "size": len(data)}))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Агент управления компьютером для бота")
+    parser.add_argument("--fake", metavar="NAME", help="поддельный бэкенд с этим именем (для проверки)")
+    parser.add_argument("--port", type=int, help="порт (по умолчанию AGENT_PORT или 8765)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    backend = FakeAgentBackend(args.fake) if args.fake else WindowsAgentBackend()
+    server = AgentServer(
+        backend,
+        token=os.getenv("AGENT_TOKEN", ""),
+        host=os.getenv("AGENT_LISTEN", "0.0.0.0"),
+        port=args.port if args.port is not None else int(os.getenv("AGENT_PORT", "8765")),
+        name=args.fake,
+    )
+
+    async def serve() -> None:
+        await server.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        logger.info("Агент остановлен")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Концентратор агентов: бот управляет несколькими компьютерами через их агенты
+"""
+
+import asyncio
+import hmac
+import itertools
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from actions import check_argument
+from agent_protocol import (AGENT, CHALLENGE_SIZE, CHUNK, CLIENT, END, ERROR, HELLO, REQUEST, RESULT, AgentError,
+                            ProtocolError, decode_json, encode_frame, encode_json, new_challenge, proof, read_frame)
+from metrics import track
+
+logger = logging.getLogger(__name__)
+
+
+class PendingCall:
+    """Запрос, ожидающий ответа агента"""
+
+    def __init__(self):
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.chunks = bytearray()
+
+
+class AgentConnection:
+    """
+    Постоянное соединение с одним агентом
+
+    Соединение открывается при первом запросе и переиспользуется; запросы
+    выполняются по нему одновременно, ответы сопоставляются по номеру
+    запроса. При обрыве все ожидающие запросы получают ConnectionError,
+    а следующий запрос открывает соединение заново.
+    """
+
+    def __init__(self, name: str, host: str, port: int, token: str,
+                 timeout: float = 30.0, connect_timeout: float = 3.0):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.token = token
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._connect_lock = asyncio.Lock()
+        self._pending: Dict[int, PendingCall] = {}
+        self._ids = itertools.count(1)
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def _connect(self) -> asyncio.StreamWriter:
+        async with self._connect_lock:
+            if self.connected:
+                return self._writer
+
+            with track(f"agent_connect:{self.name}"):
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), self.connect_timeout)
+                try:
+                    await asyncio.wait_for(self._handshake(reader, writer), self.connect_timeout)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    writer.close()
+                    raise ConnectionError(f"Агент {self.name} отклонил подключение")
+                except Exception:
+                    writer.close()
+                    raise
+
+            self._writer = writer
+            self._reader_task = asyncio.create_task(self._read_loop(reader, writer))
+            logger.info(f"Подключен агент {self.name} ({self.host}:{self.port})")
+            return writer
+
+    async def _handshake(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """HMAC запрос-ответ: бот и агент доказывают друг другу знание токена, не передавая его"""
+        kind, _, challenge = await read_frame(reader)
+        if kind != HELLO or len(challenge) != CHALLENGE_SIZE:
+            raise ProtocolError(f"Агент {self.name} ответил кадром {kind} вместо HELLO")
+        own_challenge = new_challenge()
+        writer.write(encode_frame(HELLO, 0, own_challenge + proof(self.token, CLIENT, challenge, own_challenge)))
+        await writer.drain()
+
+        kind, _, payload = await read_frame(reader)
+        if kind != HELLO:
+            raise ProtocolError(f"Агент {self.name} ответил кадром {kind} вместо HELLO")
+        expected = proof(self.token, AGENT, own_challenge, challenge).hex()
+        if not hmac.compare_digest(str((decode_json(payload) or {}).get("proof", "")), expected):
+            raise ConnectionError(f"Агент {self.name} не подтвердил токен")
+
+    async def _read_loop(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        error: Exception = ConnectionError(f"Соединение с агентом {self.name} закрыто")
+        try:
+            while True:
+                kind, request_id, payload = await read_frame(reader)
+                call = self._pending.get(request_id)
+                if call is None or call.future.done():
+                    continue  # Ответ на запрос, который уже отменен по таймауту
+                try:
+                    if kind == CHUNK:
+                        call.chunks += payload
+                    elif kind == RESULT:
+                        call.future.set_result(decode_json(payload))
+                    elif kind == END:
+                        call.future.set_result((bytes(call.chunks), decode_json(payload)))
+                    elif kind == ERROR:
+                        message = (decode_json(payload) or {}).get("error", "ошибка агента")
+                        call.future.set_exception(AgentError(message))
+                    else:
+                        raise ProtocolError(f"Неожиданный кадр {kind}")
+                except ValueError as e:
+                    raise ProtocolError(f"Некорректный JSON в кадре {kind}: {e}")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except ProtocolError as e:
+            logger.warning(f"Ошибка протокола агента {self.name}: {e}")
+            error = ConnectionError(str(e))
+        finally:
+            writer.close()
+            if self._writer is writer:
+                self._writer = None
+            for call in self._pending.values():
+                if not call.future.done():
+                    call.future.set_exception(error)
+
+    async def request(self, operation: str, *args: Any, timeout: Optional[float] = None) -> Any:
+        """Выполняет операцию на агенте; для потоковых операций - (данные, метаданные)"""
+        writer = await self._connect()
+        request_id = next(self._ids)
+        call = self._pending[request_id] = PendingCall()
+        try:
+            with track(f"agent_call:{operation}"):
+                writer.write(encode_json(REQUEST, request_id, {"op": operation, "args": list(args)}))
+                await writer.drain()
+                return await asyncio.wait_for(call.future, timeout or self.timeout)
+        finally:
+            del self._pending[request_id]
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        if self._reader_task is not None:
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+            self._reader_task = None
+
+
+def parse_agents(spec: str) -> Dict[str, Tuple[str, int]]:
+    """Разбирает AGENTS вида "office=192.168.1.20:8765,lab=lab-pc:8765" """
+    agents = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, address = item.partition("=")
+        host, _, port = address.rpartition(":")
+        if not name or not host or not port.isdigit():
+            raise ValueError(f"Некорректное описание агента: {item}")
+        agents[check_argument(name.strip(), "Имя агента")] = (host.strip(), int(port))
+    return agents
+
+
+class AgentHub:
+    """Пул соединений с агентами по имени"""
+
+    def __init__(self, agents: Dict[str, Tuple[str, int]], token: str, timeout: float = 30.0):
+        self._connections = {
+            name: AgentConnection(name, host, port, token, timeout)
+            for name, (host, port) in agents.items()
+        }
+
+    def names(self) -> List[str]:
+        return list(self._connections)
+
+    def get(self, name: str) -> AgentConnection:
+        connection = self._connections.get(name)
+        if connection is None:
+            raise LookupError(f"Агент {name} не настроен")
+        return connection
+
+    async def request(self, name: str, operation: str, *args: Any, timeout: Optional[float] = None) -> Any:
+        return await self.get(name).request(operation, *args, timeout=timeout)
+
+    async def request_all(self, operation: str, *args: Any,
+                          timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Выполняет операцию на всех агентах параллельно; вместо результата может быть исключение"""
+        names = self.names()
+        results = await asyncio.gather(
+            *(self.request(name, operation, *args, timeout=timeout) for name in names),
+            return_exceptions=True,
+        )
+        return dict(zip(names, results))
+
+    async def close(self) -> None:
+        await asyncio.gather(*(connection.close() for connection in self._connections.values()))
@@ -0,0 +1,106 @@
+"""
+Протокол агента: двоичные кадры поверх одного TCP соединения
+
+Кадр - заголовок из 9 байт (тип, номер запроса, длина тела) и тело. Номер
+запроса позволяет вести по одному соединению много запросов одновременно:
+ответы приходят в любом порядке, а большие данные (скриншоты) идут
+потоком кадров CHUNK, между которыми проходят ответы на другие запросы.
+
+    HELLO   рукопожатие (см. ниже)
+    REQUEST {"op": "processes", "args": [20]}
+    RESULT  результат операции (JSON)
+    ERROR   {"error": "текст"}
+    CHUNK   часть потоковых данных (сырые байты)
+    END     конец потока: {"message": ..., "size": ...}
+
+Рукопожатие - HMAC запрос-ответ, сам токен по сети не передается:
+
+    агент -> клиент  HELLO: случайный вызов агента (16 байт)
+    клиент -> агент  HELLO: вызов клиента (16 байт) + proof(CLIENT, вызов агента, вызов клиента)
+    агент -> клиент  HELLO: {"name": ..., "proof": hex(proof(AGENT, вызов клиента, вызов агента))}
+
+Каждая сторона доказывает знание токена на свежем вызове другой стороны,
+поэтому перехваченное рукопожатие нельзя повторить, а поддельный агент без
+токена не пройдет проверку у бота. Содержимое кадров после рукопожатия не
+шифруется: за пределами доверенной сети агент подключается через VPN.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import secrets
+import struct
+from typing import Any, Tuple
+
+HELLO = 1
+REQUEST = 2
+RESULT = 3
+ERROR = 4
+CHUNK = 5
+END = 6
+
+HEADER = struct.Struct("!BII")
+MAX_FRAME_SIZE = 4 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+CHALLENGE_SIZE = 16
+
+# Стороны рукопожатия: доказательство одной стороны нельзя выдать за ответ другой
+CLIENT = b"client"
+AGENT = b"agent"
+
+# Операции агента; сами операции реализует бэкенд (agent.AgentBackend)
+OPERATIONS = (
+    "ping",
+    "system_info",
+    "processes",
+    "kill_process",
+    "windows",
+    "activate_window",
+    "shutdown",
+    "restart",
+    "sleep",
+    "hibernate",
+    "lock_screen",
+    "screenshot",
+)
+# Операции, результат которых передается потоком кадров CHUNK
+STREAM_OPERATIONS = ("screenshot",)
+
+
+class ProtocolError(Exception):
+    """Нарушение формата кадров"""
+
+
+class AgentError(Exception):
+    """Ошибка, которую вернул агент"""
+
+
+def new_challenge() -> bytes:
+    return secrets.token_bytes(CHALLENGE_SIZE)
+
+
+def proof(token: str, side: bytes, challenge: bytes, own_challenge: bytes) -> bytes:
+    """HMAC-SHA256 токеном по вызову другой стороны и своему"""
+    return hmac.new(token.encode(), side + challenge + own_challenge, hashlib.sha256).digest()
+
+
+def encode_frame(kind: int, request_id: int, payload: bytes = b"") -> bytes:
+    return HEADER.pack(kind, request_id, len(payload)) + payload
+
+
+def encode_json(kind: int, request_id: int, value: Any) -> bytes:
+    return encode_frame(kind, request_id, json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode())
+
+
+def decode_json(payload: bytes) -> Any:
+    return json.loads(payload) if payload else None
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[int, int, bytes]:
+    """Читает кадр; IncompleteReadError - соединение закрыто"""
+    kind, request_id, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if length > MAX_FRAME_SIZE:
+        raise ProtocolError(f"Слишком большой кадр: {length} байт")
+    payload = await reader.readexactly(length) if length else b""
+    return kind, request_id, payload
@@ -0,0 +1,198 @@
+"""
+Журнал аудита: кто, что, когда и с каким результатом сделал через бота
+
+Записи накапливаются в очереди и пишутся пачками в отдельной задаче, поэтому
+обработчики не ждут диска. Файл - строки JSON, только дозапись; при
+превышении max_bytes он переименовывается в audit.jsonl.1 (старые копии
+сдвигаются, лишние удаляются).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, List, NamedTuple, Optional
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+audit_dropped = registry.counter(
+    "bot_audit_dropped_total", "Записи аудита, не попавшие в журнал из-за переполнения очереди")
+audit_written = registry.counter(
+    "bot_audit_written_total", "Записи аудита, записанные на диск")
+
+
+class AuditRecord(NamedTuple):
+    """Запись журнала"""
+    timestamp: float
+    user_id: int
+    user: str
+    action: str
+    args: Optional[str]
+    latency: float
+    ok: bool
+    result: str
+
+    def describe(self) -> str:
+        when = time.strftime("%d.%m %H:%M:%S", time.localtime(self.timestamp))
+        action = f"{self.action} {self.args}" if self.args else self.action
+        status = "✅" if self.ok else "❌"
+        return f"{when} {status} {self.user}: {action} ({self.latency * 1000:.0f} мс) {self.result[:80]}"
+
+
+class AuditJournal:
+    """
+    Журнал аудита с индексом последних записей
+
+    Последние recent записей хранятся в памяти вместе с индексами по
+    пользователю и по действию, так что /history отвечает без чтения файла.
+    При запуске индекс заполняется из конца текущего файла журнала.
+    """
+
+    def __init__(self, path: str = "logs/audit.jsonl", max_bytes: int = 5 * 1024 * 1024, backups: int = 3,
+                 batch_size: int = 100, flush_interval: float = 1.0, recent: int = 1000, queue_size: int = 10000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.recent: Deque[AuditRecord] = deque(maxlen=recent)
+        self._by_user: Dict[int, Deque[AuditRecord]] = {}
+        self._by_action: Dict[str, Deque[AuditRecord]] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._queue_size = queue_size
+        self._writer: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(self._queue_size)
+        for record in await asyncio.to_thread(self._read_tail):
+            self._index(record)
+        self._writer = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Дописывает оставшиеся записи и останавливает запись"""
+        if self._writer is None:
+            return
+        await self._queue.put(None)  # Признак остановки - после всех уже поставленных записей
+        await self._writer
+        self._writer = None
+
+    def record(self, user_id: int, user: str, action: str, args: Optional[str], latency: float,
+               ok: bool, result: str = "") -> AuditRecord:
+        """Добавляет запись; не ждет диска"""
+        entry = AuditRecord(time.time(), user_id, user, action, args, round(latency, 4), ok, result)
+        self._index(entry)
+        if self._queue is not None:
+            try:
+                self._queue.put_nowait(entry)
+            except asyncio.QueueFull:
+                audit_dropped.inc()
+        return entry
+
+    def query(self, user_id: Optional[int] = None, action: Optional[str] = None,
+              since: Optional[float] = None, limit: int = 20) -> List[AuditRecord]:
+        """Последние записи (новые первыми) с отбором по пользователю, действию и времени"""
+        # Начинаем с самого узкого индекса
+        candidates = [self.recent]
+        if user_id is not None:
+            candidates.append(self._by_user.get(user_id, deque()))
+        if action is not None:
+            candidates.append(self._by_action.get(action, deque()))
+        source = min(candidates, key=len)
+
+        records = []
+        for entry in reversed(source):
+            if since is not None and entry.timestamp < since:
+                break  # Записи идут по времени - дальше только более старые
+            if user_id is not None and entry.user_id != user_id:
+                continue
+            if action is not None and entry.action != action:
+                continue
+            records.append(entry)
+            if len(records) >= limit:
+                break
+        return records
+
+    def _index(self, entry: AuditRecord) -> None:
+        maxlen = self.recent.maxlen
+        # Запись, вытесняемая из общего окна, уходит и из индексов
+        if len(self.recent) == maxlen:
+            oldest = self.recent[0]
+            for index, key in ((self._by_user, oldest.user_id), (self._by_action, oldest.action)):
+                bucket = index.get(key)
+                if bucket and bucket[0] is oldest:
+                    bucket.popleft()
+                    if not bucket:
+                        del index[key]
+        self.recent.append(entry)
+        self._by_user.setdefault(entry.user_id, deque()).append(entry)
+        self._by_action.setdefault(entry.action, deque()).append(entry)
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = []
+            entry = await self._queue.get()
+            # Собираем пачку: все, что накопилось, но не дольше flush_interval
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+                timeout = deadline - time.monotonic()
+                if len(batch) >= self.batch_size or timeout <= 0:
+                    break
+                try:
+                    entry = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if batch:
+                try:
+                    await asyncio.to_thread(self._write, batch)
+                except OSError as e:
+                    logger.error(f"Ошибка записи журнала аудита: {e}")
+
+    def _write(self, batch: List[AuditRecord]) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        data = "".join(json.dumps(entry._asdict(), ensure_ascii=False) + "\n" for entry in batch).encode("utf-8")
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        if size and size + len(data) > self.max_bytes:
+            self._rotate()
+        with open(self.path, "ab") as f:
+            f.write(data)
+        audit_written.inc(len(batch))
+
+    def _rotate(self) -> None:
+        for number in range(self.backups, 0, -1):
+            source = f"{self.path}.{number - 1}" if number > 1 else self.path
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{number}")
+
+    def _read_tail(self, max_bytes: int = 256 * 1024) -> List[AuditRecord]:
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                f.seek(max(0, size - max_bytes))
+                lines = f.read().splitlines()
+        except OSError:
+            return []
+        if size > max_bytes:
+            lines = lines[1:]  # Первая строка, скорее всего, обрезана
+
+        records = []
+        for line in lines[-self.recent.maxlen:]:
+            try:
+                records.append(AuditRecord(**json.loads(line)))
+            except (ValueError, TypeError):
+                continue
+        return records
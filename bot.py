@@ -2,62 +2,103 @@
 Telegram Bot для удаленного управления Windows компьютером
 """
 
+import asyncio
+import contextlib
 import logging
+import math
 import os
-from typing import Dict, Any
+import time
+from typing import Any, Dict, List, Optional
 
-from dotenv import load_dotenv
-from telegram import Update, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters
+from lazy_import import LazyObject, import_profiler
 
-# Импортируем модули управления Windows
-try:
-    from windows_controller import WindowsSystemController, WindowsProcessManager, WindowsWindowManager, \
-        WindowsVolumeController
-    from screenshot_controller import WindowsScreenshot, WindowsScreenRecorder
+with import_profiler:
+    from dotenv import load_dotenv
+    from telegram import Update, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
+    from telegram.ext import (Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes,
+                              TypeHandler, filters)
+    from telegram.helpers import escape_markdown
 
-    WINDOWS_MODULES_AVAILABLE = True
-except ImportError:
-    # Если модули недоступны (например, не на Windows), создаем заглушки
-    WINDOWS_MODULES_AVAILABLE = False
+    from access import (ADMIN, COST_HEAVY, COST_LIGHT, COST_MEDIUM, OPERATOR, VIEWER, AccessControl, access_denied,
+                        parse_users)
+    from actions import Action, ActionRegistry, THREAD, callback_data
+    from agent_hub import AgentHub, parse_agents
+    from audit import AuditJournal
+    from charts import ChartPool
+    from file_transfer import FileBrowser, Transfer, TransferStore, check_unchanged, format_size, run_transfer
+    from live_dashboard import LiveDashboard, STOP_CALLBACK
+    from macros import Macro, MacroRegistry, MacroRunner, MacroStep, StepResult
+    from metrics import count_error, format_stats, instrument, start_metrics_server
+    from rate_limiter import OutboundScheduler, PRIORITY_HIGH
+    from resource_locks import MemoryBudget, POWER, PROCESSES, SCREEN, SOUND, WINDOWS, resource_locks
+    from webhook import WebhookServer, run_webhook
+    from outages import OutageReporter, read_outages
+    from pagination import Snapshot, SnapshotStore, get_page, page_callback, parse_page_argument
+    from profiler import Profiler
+    from system_info import system_info_provider
+    from wake_on_lan import WakeHost, WakeHostRegistry, WakeOnLan
 
 
-    class WindowsSystemController:
-        @staticmethod
-        def shutdown(): return "❌ Функция недоступна на данной платформе"
+# Заглушки на случай, если модули управления Windows недоступны (например, не на Windows)
+class UnavailableSystemController:
+    @staticmethod
+    async def shutdown(): return "❌ Функция недоступна на данной платформе"
 
-        @staticmethod
-        def restart(): return "❌ Функция недоступна на данной платформе"
+    @staticmethod
+    async def restart(): return "❌ Функция недоступна на данной платформе"
 
-        @staticmethod
-        def sleep(): return "❌ Функция недоступна на данной платформе"
+    @staticmethod
+    async def sleep(): return "❌ Функция недоступна на данной платформе"
 
-        @staticmethod
-        def lock_screen(): return "❌ Функция недоступна на данной платформе"
+    @staticmethod
+    async def hibernate(): return "❌ Функция недоступна на данной платформе"
 
-        @staticmethod
-        def get_system_info(): return {"Ошибка": "Модули Windows недоступны"}
+    @staticmethod
+    async def lock_screen(): return "❌ Функция недоступна на данной платформе"
 
+    @staticmethod
+    def get_system_info(): return {"Ошибка": "Модули Windows недоступны"}
 
-    class WindowsProcessManager:
-        @staticmethod
-        def get_running_processes(): return [{"error": "Модули Windows недоступны"}]
 
-        @staticmethod
-        def kill_process(pid): return "❌ Функция недоступна на данной платформе"
+class UnavailableProcessManager:
+    @staticmethod
+    def get_running_processes(limit=20): return [{"error": "Модули Windows недоступны"}]
 
+    @staticmethod
+    def kill_process(pid): return "❌ Функция недоступна на данной платформе"
 
-    class WindowsWindowManager:
-        @staticmethod
-        def get_visible_windows(): return [{"error": "Модули Windows недоступны"}]
 
-        @staticmethod
-        def activate_window(hwnd): return "❌ Функция недоступна на данной платформе"
+class UnavailableWindowManager:
+    @staticmethod
+    def get_visible_windows(limit=None): return [{"error": "Модули Windows недоступны"}]
 
+    @staticmethod
+    def activate_window(hwnd): return "❌ Функция недоступна на данной платформе"
 
-    class WindowsScreenshot:
-        def get_screenshot_as_bytes(self, screenshot_type, window_title=None):
-            return False, "❌ Функция недоступна на данной платформе", None
+
+class UnavailableScreenshot:
+    def get_screenshot_as_bytes(self, screenshot_type, window_title=None, hwnd=None):
+        return False, "❌ Функция недоступна на данной платформе", None
+
+
+class UnavailableVolumeController:
+    @staticmethod
+    async def set_volume(level): return "❌ Функция недоступна на данной платформе"
+
+    @staticmethod
+    async def mute(): return "❌ Функция недоступна на данной платформе"
+
+    @staticmethod
+    async def unmute(): return "❌ Функция недоступна на данной платформе"
+
+
+# Модули управления Windows тянут pyautogui, Pillow и win32*, поэтому загружаются
+# при первом использовании соответствующей функции, а не при запуске бота
+WindowsSystemController = LazyObject("windows_controller", "WindowsSystemController", UnavailableSystemController)
+WindowsProcessManager = LazyObject("windows_controller", "WindowsProcessManager", UnavailableProcessManager)
+WindowsWindowManager = LazyObject("windows_controller", "WindowsWindowManager", UnavailableWindowManager)
+WindowsVolumeController = LazyObject("windows_controller", "WindowsVolumeController", UnavailableVolumeController)
+WindowsScreenshot = LazyObject("screenshot_controller", "WindowsScreenshot", UnavailableScreenshot)
 
 # Загружаем переменные окружения
 load_dotenv()
@@ -73,13 +114,95 @@ logger = logging.getLogger(__name__)
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 UNLOCK_PASSWORD = os.getenv('UNLOCK_PASSWORD')
 AUTHORIZED_USER_ID = os.getenv('AUTHORIZED_USER_ID')
+# Порт HTTP эндпоинта /metrics (если не задан - эндпоинт не запускается)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = os.getenv('METRICS_PORT')
+# Режим webhook включается заданием WEBHOOK_URL (публичный https адрес), иначе используется polling
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+# Адрес Bot API (например, локальный сервер telegram-bot-api или фейковый сервер для проверок)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+# Типы обновлений, которые бот обрабатывает; остальные Telegram не присылает
+ALLOWED_UPDATES = [
+    update_type.strip()
+    for update_type in os.getenv('ALLOWED_UPDATES', f'{Update.MESSAGE},{Update.CALLBACK_QUERY}').split(',')
+    if update_type.strip()
+]
 
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN не найден в файле .env")
 
+# Сколько обновлений Telegram обрабатывается одновременно
+CONCURRENT_UPDATES = 16
+
+# Пользователи: AUTHORIZED_USER_ID - администратор, USERS="id:роль,..." - остальные (роли в access.py).
+# Квота каждого пользователя: QUOTA_RATE токенов в секунду, не больше QUOTA_BURST подряд
+users = parse_users(os.getenv('USERS', ''))
+if AUTHORIZED_USER_ID:
+    users[int(AUTHORIZED_USER_ID)] = ADMIN
+access = AccessControl(users, rate=float(os.getenv('QUOTA_RATE', '1')), burst=float(os.getenv('QUOTA_BURST', '30')))
+
+# Память под скриншоты в обработке: кадр до сжатия, затем PNG до конца отправки
+image_memory = MemoryBudget("images", int(os.getenv('IMAGE_MEMORY_MB', '128')) * 1024 * 1024)
+# Резерв на снимок, пока его размер неизвестен: кадр 4K в формате BGRX
+SCREENSHOT_RESERVE = 3840 * 2160 * 4
+
+# Графики /chart: замеры cpumonitor.py (база - CPUMONITOR_DB) и число процессов, рисующих графики
+monitor_columns = LazyObject("cpumonitor", "get_columns")
+# Быстрый просмотр /load: текстовые графики из фонового замера бота или из базы cpumonitor.py
+monitor_columns_from_rows = LazyObject("cpumonitor", "columns_from_rows")
+monitor_render_text = LazyObject("cpumonitor", "render_text")
+LOAD_DEFAULT_MINUTES = 10
+LOAD_WIDTH = 28  # Ширина спарклайна: строка помещается в экран телефона
+chart_pool = ChartPool(int(os.getenv('CHART_WORKERS', '2')))
+CHART_DEFAULT_SAMPLES = 60        # cpumonitor.py пишет замер раз в минуту
+CHART_MAX_SAMPLES = 7 * 24 * 60
+
 # Словарь для хранения состояний ожидания подтверждения
 pending_confirmations: Dict[int, Dict[str, Any]] = {}
 
+# Снимки списков процессов и окон для постраничного просмотра
+snapshots = SnapshotStore()
+
+# Реестр действий inline кнопок
+actions = ActionRegistry()
+
+# Журнал аудита всех действий пользователей
+audit_journal = AuditJournal(os.getenv('AUDIT_LOG', 'logs/audit.jsonl'))
+
+# Живая панель /live: период обновления и время до остановки без действий пользователя, с
+live_dashboard = LiveDashboard(
+    system_info_provider.sampler,
+    interval=float(os.getenv('LIVE_INTERVAL', '10')),
+    idle_timeout=float(os.getenv('LIVE_IDLE_TIMEOUT', '600')),
+)
+
+# Wake-on-LAN: реестр компьютеров и время ожидания их включения, с
+wake_hosts = WakeHostRegistry(os.getenv('WOL_HOSTS_FILE', 'wol_hosts.json'))
+wake_on_lan = WakeOnLan(deadline=float(os.getenv('WOL_DEADLINE', '120')))
+
+# История перебоев сети, которую ведет wifi_fixer.py, и период ее проверки, с
+outage_reporter = OutageReporter()
+OUTAGES_CHECK_INTERVAL = 30
+background_tasks = set()
+
+# Агенты на других компьютерах: AGENTS="имя=адрес:порт,..." и общий AGENT_TOKEN
+agent_hub = AgentHub(parse_agents(os.getenv('AGENTS', '')), os.getenv('AGENT_TOKEN', ''))
+
+# Файлы: корневые каталоги (через ";", на Linux через ":"), размер части и незавершенные передачи
+file_browser = FileBrowser(os.getenv('FILES_ROOTS', os.path.expanduser('~')).split(os.pathsep))
+FILE_PART_SIZE = int(os.getenv('FILE_PART_SIZE', str(45 * 1024 * 1024)))
+FILE_UPLOAD_TIMEOUT = 300
+transfers = TransferStore(os.getenv('TRANSFERS_FILE', 'transfers.json'))
+
+# Макросы из MACROS_FILE; встроенный "windows" снимает все открытые окна
+DEFAULT_MACROS = {
+    "windows": Macro("windows", "Скриншоты всех окон", (MacroStep("1", "screenshot_windows"),)),
+}
+macro_book = MacroRegistry(os.getenv('MACROS_FILE', 'macros.json'), DEFAULT_MACROS)
+
 
 def get_main_keyboard():
     """Создает основную клавиатуру бота"""
@@ -158,7 +281,7 @@ def get_sound_keyboard():
 def get_confirmation_keyboard(action: str):
     """Создает клавиатуру подтверждения действия"""
     keyboard = [
-        [InlineKeyboardButton("✅ Подтвердить", callback_data=f"confirm_{action}")],
+        [InlineKeyboardButton("✅ Подтвердить", callback_data=callback_data("confirm", action))],
         [InlineKeyboardButton("❌ Отменить", callback_data="cancel_action")]
     ]
     return InlineKeyboardMarkup(keyboard)
@@ -166,18 +289,36 @@ def get_confirmation_keyboard(action: str):
 
 def is_authorized(user_id: int) -> bool:
     """Проверяет авторизацию пользователя"""
-    if AUTHORIZED_USER_ID:
-        return str(user_id) == AUTHORIZED_USER_ID
+    return access.is_authorized(user_id)
+
 
+def access_error(user_id: int, role: str, cost: float) -> Optional[str]:
+    """Проверяет права и списывает квоту; возвращает текст отказа или None"""
+    if not is_authorized(user_id):
+        access_denied.inc(reason="unauthorized")
+        return "❌ У вас нет доступа к этому боту."
+    if not access.allows(user_id, role):
+        access_denied.inc(reason="role")
+        return "❌ Недостаточно прав для этого действия."
+    wait = access.charge(user_id, cost)
+    if wait:
+        return f"⏳ Слишком много запросов, повторите через {math.ceil(wait)} с."
+    return None
+
+
+async def check_access(update: Update, role: str = VIEWER, cost: float = COST_LIGHT) -> bool:
+    """Проверка для команд: при отказе отвечает пользователю и возвращает False"""
+    error = access_error(update.effective_user.id, role, cost)
+    if error:
+        await update.message.reply_text(error)
+        return False
     return True
 
 
+@instrument()
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик команды /start"""
-    user_id = update.effective_user.id
-
-    if not is_authorized(user_id):
-        await update.message.reply_text("❌ У вас нет доступа к этому боту.")
+    if not await check_access(update):
         return
 
     welcome_text = (
@@ -199,15 +340,14 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     )
 
 
+@instrument()
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик текстовых сообщений"""
-    user_id = update.effective_user.id
-
-    if not is_authorized(user_id):
-        await update.message.reply_text("❌ У вас нет доступа к этому боту.")
-        return
-
     text = update.message.text
+    # Кнопки меню только открывают клавиатуры, информация о системе - замеры
+    cost = COST_MEDIUM if text == 'ℹ️ Информация о системе' else COST_LIGHT
+    if not await check_access(update, VIEWER, cost):
+        return
 
     if text == '💻 Управление питанием':
         await update.message.reply_text(
@@ -258,230 +398,426 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
 
 
+async def ask_confirmation(message, user_id: int, data: str, title: str) -> None:
+    """Запрашивает подтверждение действия data в сообщении message"""
+    pending_confirmations[user_id] = {"action": data}
+
+    # Приоритет передается только методам бота, ярлыки Message/CallbackQuery его не принимают
+    await message.get_bot().edit_message_text(
+        f"⚠️ Вы уверены, что хотите выполнить {title}?",
+        message.chat_id, message.message_id,
+        reply_markup=get_confirmation_keyboard(data),
+        rate_limit_args=PRIORITY_HIGH
+    )
+
+
+@instrument()
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик callback запросов от inline кнопок"""
     query = update.callback_query
-    await query.answer()
 
     if not is_authorized(query.from_user.id):
+        await query.answer()
         await query.edit_message_text("❌ У вас нет доступа к этому боту.")
         return
 
-    data = query.data
-    user_id = query.from_user.id
-
-    # Обработка подтверждений
-    if data.startswith("confirm_"):
-        action = data.replace("confirm_", "")
-        await execute_confirmed_action(query, action)
-        return
-
-    elif data == "cancel_action":
-        if user_id in pending_confirmations:
-            del pending_confirmations[user_id]
-        await query.edit_message_text(
-            "❌ Действие отменено.",
-            reply_markup=None
-        )
+    resolved = actions.resolve(query.data)
+    if resolved is None:
+        await query.answer()
+        logger.warning(f"Неизвестное действие: {query.data}")
         return
+    action, arg = resolved
 
-    elif data == "back_main":
-        await query.edit_message_text(
-            "🏠 Главное меню. Выберите функцию:",
-            reply_markup=None
-        )
+    # Права и квота; действие с подтверждением оплачивается в момент подтверждения.
+    # Отказ показывается всплывающим уведомлением, а меню остается на месте
+    error = access_error(query.from_user.id, action.role, 0 if action.confirm else action.cost)
+    await query.answer(error, show_alert=error is not None)
+    if error:
         return
 
     # Обработка действий, требующих подтверждения
-    critical_actions = ["power_shutdown", "power_restart", "power_sleep", "power_hibernate", "screen_lock"]
-
-    if data in critical_actions:
-        action_names = {
-            "power_shutdown": "выключение компьютера",
-            "power_restart": "перезагрузку компьютера",
-            "power_sleep": "переход в режим сна",
-            "power_hibernate": "переход в гибернацию",
-            "screen_lock": "блокировку экрана",
-        }
-
-        pending_confirmations[user_id] = {"action": data}
-
-        await query.edit_message_text(
-            f"⚠️ Вы уверены, что хотите выполнить {action_names[data]}?",
-            reply_markup=get_confirmation_keyboard(data)
-        )
+    if action.confirm:
+        await ask_confirmation(query.message, query.from_user.id, query.data, action.title)
         return
 
-    # Обработка других действий
-    elif data == "screenshot_full":
-        await handle_screenshot(query, "full")
+    await perform_action(query, action, arg)
 
-    elif data == "screenshot_window":
-        await handle_screenshot(query, "window")
 
-    elif data == "processes_list":
-        await handle_processes_list(query)
+def audit(user, action: str, args: Optional[str], started: float, ok: bool, result: str = "") -> None:
+    """Записывает выполненное действие в журнал аудита"""
+    audit_journal.record(user.id, user.username or user.full_name, action, args,
+                         time.perf_counter() - started, ok, result)
 
-    elif data == "windows_list":
-        await handle_windows_list(query)
 
-    elif data == "sound_mute":
-        result = WindowsVolumeController.mute()
-        await query.edit_message_text(f"🔇 {result}")
-
-    elif data == "sound_unmute":
-        result = WindowsVolumeController.unmute()
-        await query.edit_message_text(f"🔊 {result}")
-
-    elif data == "sound_50":
-        result = WindowsVolumeController.set_volume(50)
-        await query.edit_message_text(f"🔉 {result}")
-
-    elif data == "sound_100":
-        result = WindowsVolumeController.set_volume(100)
-        await query.edit_message_text(f"🔊 {result}")
-
-    # Обработка активации окон
-    elif data.startswith("activate_window_"):
-        hwnd = data.replace("activate_window_", "")
-        result = WindowsWindowManager.activate_window(hwnd)
-        await query.edit_message_text(f"🪟 {result}")
-
-    # Обработка завершения процессов
-    elif data.startswith("kill_process_"):
-        pid = data.replace("kill_process_", "")
-        result = WindowsProcessManager.kill_process(int(pid))
-        await query.edit_message_text(f"⚠️ {result}")
+async def perform_action(query, action: Action, arg: Optional[str] = None) -> None:
+    """Выполняет действие и показывает результат"""
+    started = time.perf_counter()
+    try:
+        result = await actions.run(action, arg, query)
+        if action.audit:
+            # Результат - строка "✅ ..." / "❌ ..."; действие с view=True возвращает ее,
+            # уже показав ответ пользователю
+            result = "" if result is None else str(result)
+            audit(query.from_user, action.key, arg, started, not result.startswith("❌"), result)
+        if not action.view:
+            await query.edit_message_text(f"{action.emoji} {result}")
 
-    # Обработка скриншотов окон
-    elif data.startswith("screenshot_window_"):
-        hwnd = data.replace("screenshot_window_", "")
-        await handle_screenshot_by_hwnd(query, hwnd)
+    except Exception as e:
+        if action.audit:
+            audit(query.from_user, action.key, arg, started, False, str(e))
+        count_error(f"action:{action.name}", e)
+        await query.edit_message_text(f"❌ Ошибка выполнения действия: {str(e)}")
 
 
-async def execute_confirmed_action(query, action: str) -> None:
+async def execute_confirmed_action(query, data: str) -> None:
     """Выполняет подтвержденное действие"""
     user_id = query.from_user.id
 
     if user_id in pending_confirmations:
         del pending_confirmations[user_id]
 
-    try:
-        if action == "power_shutdown":
-            result = WindowsSystemController.shutdown()
-            await query.edit_message_text(f"🔴 {result}")
-
-        elif action == "power_restart":
-            result = WindowsSystemController.restart()
-            await query.edit_message_text(f"🔄 {result}")
+    resolved = actions.resolve(data)
+    if resolved is None or not resolved[0].confirm:
+        await query.edit_message_text("❌ Неизвестное действие.")
+        return
 
-        elif action == "power_sleep":
-            result = WindowsSystemController.sleep()
-            await query.edit_message_text(f"😴 {result}")
+    action, arg = resolved
+    error = access_error(user_id, action.role, action.cost)
+    if error:
+        await query.edit_message_text(error)
+        return
+    await perform_action(query, action, arg)
 
-        elif action == "power_hibernate":
-            result = WindowsSystemController.hibernate()
-            await query.edit_message_text(f"🛌 {result}")
 
-        elif action == "screen_lock":
-            result = WindowsSystemController.lock_screen()
-            await query.edit_message_text(f"🔒 {result}")
+async def cancel_action(query) -> None:
+    """Отмена действия, ожидающего подтверждения"""
+    pending_confirmations.pop(query.from_user.id, None)
+    await query.edit_message_text(
+        "❌ Действие отменено.",
+        reply_markup=None
+    )
 
-        # elif action == "screen_unlock":
-        #     result = WindowsSystemController.unlock_screen()
-        #     await query.edit_message_text(f"🔓 {result}")
 
-    except Exception as e:
-        logger.error(f"Ошибка выполнения действия {action}: {e}")
-        await query.edit_message_text(f"❌ Ошибка выполнения действия: {str(e)}")
+async def back_to_main(query) -> None:
+    """Возврат в главное меню"""
+    await query.edit_message_text(
+        "🏠 Главное меню. Выберите функцию:",
+        reply_markup=None
+    )
 
 
+@instrument()
 async def handle_system_info(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработка запроса информации о системе"""
     try:
-        info = WindowsSystemController.get_system_info()
+        info = await asyncio.to_thread(WindowsSystemController.get_system_info)
 
         info_text = "ℹ️ **Информация о системе:**\n\n"
         for key, value in info.items():
-            info_text += f"**{key}:** {value}\n"
+            info_text += f"**{escape_markdown(key)}:** {escape_markdown(str(value))}\n"
 
         await update.message.reply_text(info_text, parse_mode='Markdown')
 
     except Exception as e:
+        count_error("handle_system_info", e)
         await update.message.reply_text(f"❌ Ошибка получения информации: {str(e)}")
 
 
-async def handle_processes_list(query) -> None:
+PROCESSES_PER_PAGE = 10
+WINDOWS_PER_PAGE = 5
+FILES_PER_PAGE = 8
+
+
+def render_processes_page(snapshot: Snapshot, page: int):
+    """Формирует текст и клавиатуру страницы списка процессов"""
+    processes, page, pages = get_page(snapshot.items, page, PROCESSES_PER_PAGE)
+
+    text = f"📋 **Активные процессы** (стр. {page + 1}/{pages}):\n\n"
+    for i, proc in enumerate(processes, page * PROCESSES_PER_PAGE + 1):
+        text += f"{i}. **{escape_markdown(proc['name'])}** (PID: {proc['pid']})\n"
+        text += f"   CPU: {proc['cpu']}, RAM: {proc['memory']}\n\n"
+
+    # Кнопки завершения для всех процессов страницы
+    keyboard = []
+    for proc in processes:
+        keyboard.append([InlineKeyboardButton(
+            f"❌ Завершить {proc['name'][:15]}",
+            callback_data=callback_data("kill_process", proc['pid'])
+        )])
+    keyboard.extend(get_page_navigation(snapshot.sid, page, pages))
+
+    return text, InlineKeyboardMarkup(keyboard)
+
+
+def render_windows_page(snapshot: Snapshot, page: int):
+    """Формирует текст и клавиатуру страницы списка окон"""
+    windows, page, pages = get_page(snapshot.items, page, WINDOWS_PER_PAGE)
+
+    text = f"🪟 **Активные окна** (стр. {page + 1}/{pages}):\n\n"
+    for i, window in enumerate(windows, page * WINDOWS_PER_PAGE + 1):
+        text += f"{i}. **{escape_markdown(window['title'])}**\n"
+        text += f"   Процесс: {escape_markdown(window['process'])} (PID: {window['pid']})\n\n"
+
+    # Кнопки управления для всех окон страницы
+    keyboard = []
+    for window in windows:
+        keyboard.append([
+            InlineKeyboardButton(
+                f"🎯 {window['title'][:15]}",
+                callback_data=callback_data("activate_window", window['hwnd'])
+            ),
+            InlineKeyboardButton(
+                f"📸 Скриншот",
+                callback_data=callback_data("screenshot_window", window['hwnd'])
+            )
+        ])
+    keyboard.extend(get_page_navigation(snapshot.sid, page, pages))
+
+    return text, InlineKeyboardMarkup(keyboard)
+
+
+def render_files_page(snapshot: Snapshot, page: int):
+    """Формирует текст и клавиатуру страницы каталога"""
+    entries, page, pages = get_page(snapshot.items, page, FILES_PER_PAGE)
+    listing = snapshot.context
+
+    title = escape_markdown(listing.path) if listing is not None else "Корневые каталоги"
+    text = f"📁 **{title}** (стр. {page + 1}/{pages})"
+    if not snapshot.items:
+        text += "\n\nКаталог пуст"
+
+    keyboard = []
+    for index, entry in enumerate(entries, page * FILES_PER_PAGE):
+        label = f"📁 {entry.name}" if entry.is_dir else f"📄 {entry.name} ({format_size(entry.size)})"
+        action = "file" if entry.is_dir else "fileget"
+        data = callback_data(action, f"{snapshot.sid}_{index}")
+        keyboard.append([InlineKeyboardButton(label[:60], callback_data=data)])
+    # Из корневого каталога вверх - к списку корней, если их несколько
+    if listing is not None and (listing.parent is not None or len(file_browser.roots) > 1):
+        keyboard.append([InlineKeyboardButton("⬆️ Вверх", callback_data=callback_data("file", f"{snapshot.sid}_up"))])
+    keyboard.extend(get_page_navigation(snapshot.sid, page, pages))
+
+    return text, InlineKeyboardMarkup(keyboard)
+
+
+PAGE_RENDERERS = {
+    "processes": render_processes_page,
+    "windows": render_windows_page,
+    "files": render_files_page,
+}
+
+
+def get_page_navigation(sid: str, page: int, pages: int):
+    """Создает ряды кнопок листания и возврата"""
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton("⬅️ Пред.", callback_data=page_callback(sid, page - 1)))
+    if page < pages - 1:
+        navigation.append(InlineKeyboardButton("След. ➡️", callback_data=page_callback(sid, page + 1)))
+
+    rows = [navigation] if navigation else []
+    rows.append([InlineKeyboardButton("◀️ Назад", callback_data="back_main")])
+    return rows
+
+
+@instrument()
+async def handle_processes_list(query) -> str:
     """Обработка запроса списка процессов"""
     try:
-        processes = WindowsProcessManager.get_running_processes(15)
+        processes = await asyncio.to_thread(WindowsProcessManager.get_running_processes, None)
 
         if processes and 'error' not in processes[0]:
-            text = "📋 **Активные процессы:**\n\n"
-            for i, proc in enumerate(processes, 1):
-                text += f"{i}. **{proc['name']}** (PID: {proc['pid']})\n"
-                text += f"   CPU: {proc['cpu']}, RAM: {proc['memory']}\n\n"
-
-            # Создаем кнопки для завершения процессов
-            keyboard = []
-            for proc in processes[:5]:  # Показываем кнопки только для первых 5 процессов
-                keyboard.append([InlineKeyboardButton(
-                    f"❌ Завершить {proc['name'][:15]}",
-                    callback_data=f"kill_process_{proc['pid']}"
-                )])
-            keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="back_main")])
-
-            await query.edit_message_text(
-                text,
-                parse_mode='Markdown',
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
+            snapshot = snapshots.put("processes", processes)
+            text, keyboard = render_processes_page(snapshot, 0)
+            await query.edit_message_text(text, parse_mode='Markdown', reply_markup=keyboard)
+            return f"✅ Процессов: {len(processes)}"
         else:
             await query.edit_message_text("❌ Ошибка получения списка процессов")
+            return "❌ Ошибка получения списка процессов"
 
     except Exception as e:
+        count_error("handle_processes_list", e)
         await query.edit_message_text(f"❌ Ошибка: {str(e)}")
+        return f"❌ {e}"
 
 
-async def handle_windows_list(query) -> None:
+@instrument()
+async def handle_windows_list(query) -> str:
     """Обработка запроса списка окон"""
     try:
-        windows = WindowsWindowManager.get_visible_windows()
+        windows = await asyncio.to_thread(WindowsWindowManager.get_visible_windows)
 
         if windows and 'error' not in windows[0]:
-            text = "🪟 **Активные окна:**\n\n"
-            for i, window in enumerate(windows, 1):
-                text += f"{i}. **{window['title']}**\n"
-                text += f"   Процесс: {window['process']} (PID: {window['pid']})\n\n"
-
-            # Создаем кнопки для управления окнами
-            keyboard = []
-            for window in windows[:4]:  # Показываем кнопки только для первых 4 окон
-                keyboard.append([
-                    InlineKeyboardButton(
-                        f"🎯 {window['title'][:15]}",
-                        callback_data=f"activate_window_{window['hwnd']}"
-                    ),
-                    InlineKeyboardButton(
-                        f"📸 Скриншот",
-                        callback_data=f"screenshot_window_{window['hwnd']}"
-                    )
-                ])
-            keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="back_main")])
-
-            await query.edit_message_text(
-                text,
-                parse_mode='Markdown',
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
+            snapshot = snapshots.put("windows", windows)
+            text, keyboard = render_windows_page(snapshot, 0)
+            await query.edit_message_text(text, parse_mode='Markdown', reply_markup=keyboard)
+            return f"✅ Окон: {len(windows)}"
         else:
             await query.edit_message_text("❌ Ошибка получения списка окон")
+            return "❌ Ошибка получения списка окон"
 
     except Exception as e:
+        count_error("handle_windows_list", e)
         await query.edit_message_text(f"❌ Ошибка: {str(e)}")
+        return f"❌ {e}"
+
+
+async def handle_page(query, arg: str) -> None:
+    """Листание ранее сохраненного снимка без повторного перечисления"""
+    sid, page = parse_page_argument(arg)
+    snapshot = snapshots.get(sid)
+    if snapshot is None:
+        await query.edit_message_text("⌛ Список устарел, запросите его заново.")
+        return
+
+    text, keyboard = PAGE_RENDERERS[snapshot.kind](snapshot, page)
+    await query.edit_message_text(text, parse_mode='Markdown', reply_markup=keyboard)
+
+
+async def open_directory(path: Optional[str]) -> Snapshot:
+    """Снимок каталога для листания; path=None - корневые каталоги"""
+    if path is None and len(file_browser.roots) == 1:
+        path = file_browser.roots[0]
+    if path is None:
+        return snapshots.put("files", file_browser.root_entries())
+    listing = await asyncio.to_thread(file_browser.list, path)
+    return snapshots.put("files", listing.entries, listing)
+
+
+def get_resume_keyboard(transfer_id: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([[InlineKeyboardButton("🔁 Продолжить", callback_data=callback_data("file_resume", transfer_id))]])
+
+
+async def continue_transfer(status, transfer: Transfer) -> str:
+    """Отправляет оставшиеся части передачи, показывая ход в сообщении status; возвращает итог"""
+    name = os.path.basename(transfer.path)
+
+    async def send(data: bytes, filename: str, current: Transfer) -> None:
+        await status.edit_text(f"⬇️ {name}: часть {current.part}, отправлено {current.progress()}")
+        await status.reply_document(document=data, filename=filename, write_timeout=FILE_UPLOAD_TIMEOUT)
+
+    try:
+        transfer = await run_transfer(transfer, transfers, send)
+    except Exception as e:
+        count_error("send_file", e)
+        current = await asyncio.to_thread(transfers.get, transfer.id) or transfer
+        await status.edit_text(f"❌ Передача {name} прервана: {e}\nОтправлено {current.progress()}",
+                               reply_markup=get_resume_keyboard(transfer.id))
+        return f"❌ {transfer.path}: прервана на {current.progress()}: {e}"
+
+    parts = transfer.part - 1
+    text = f"✅ {name} отправлен" + (" (сжат gzip)" if transfer.compress else "")
+    if parts > 1:
+        text += f"\n\nЧастей: {parts}. Склейте их: {transfer.join_hint()} или откройте первую часть в 7-Zip"
+    await status.edit_text(text)
+    return f"✅ {transfer.path} ({format_size(transfer.size)})"
+
+
+async def send_file(message, path: str, user_id: int) -> str:
+    """Начинает передачу файла пользователя user_id ответом на message; возвращает итог для журнала аудита"""
+    try:
+        path = file_browser.resolve(path)
+        transfer = await asyncio.to_thread(transfers.create, path, FILE_PART_SIZE, user_id)
+    except (OSError, ValueError) as e:
+        await message.reply_text(f"❌ {e}")
+        return f"❌ {e}"
+
+    status = await message.reply_text(f"⬇️ {os.path.basename(path)} ({format_size(transfer.size)})...")
+    return await continue_transfer(status, transfer)
+
+
+@instrument()
+async def show_files(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /files [путь] - просмотр и скачивание файлов"""
+    path = " ".join(context.args) or None
+    # Скачивание - только администратору: в каталогах бывают ключи и пароли (~/.ssh)
+    download = path is not None and os.path.isfile(path)
+    if not await check_access(update, ADMIN if download else OPERATOR, COST_HEAVY if download else COST_MEDIUM):
+        return
+
+    try:
+        if download:
+            started = time.perf_counter()
+            result = await send_file(update.message, path, update.effective_user.id)
+            audit(update.effective_user, "files", path, started, not result.startswith("❌"), result)
+            return
+        snapshot = await open_directory(path)
+    except OSError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
 
+    text, keyboard = render_files_page(snapshot, 0)
+    await update.message.reply_text(text, parse_mode='Markdown', reply_markup=keyboard)
 
-async def handle_screenshot_by_hwnd(query, hwnd: str) -> None:
+    if not access.allows(update.effective_user.id, ADMIN):
+        return
+    for transfer in await asyncio.to_thread(transfers.all, update.effective_user.id):
+        await update.message.reply_text(
+            f"⏸ Незавершенная передача {os.path.basename(transfer.path)}: {transfer.progress()}",
+            reply_markup=get_resume_keyboard(transfer.id))
+
+
+async def handle_file(query, arg: str, download: bool = False) -> str:
+    """Кнопка элемента каталога: каталог открывается, файл отправляется (только при download)"""
+    sid, _, index = arg.rpartition("_")
+    snapshot = snapshots.get(sid)
+    if snapshot is None:
+        await query.edit_message_text("⌛ Список устарел, запросите его заново.")
+        return "❌ Список устарел"
+
+    try:
+        if index == "up":
+            snapshot = await open_directory(snapshot.context.parent)
+        else:
+            entry = snapshot.items[int(index)]
+            if not entry.is_dir:
+                if not download:
+                    await query.edit_message_text("❌ Это файл, а не каталог")
+                    return "❌ Это файл, а не каталог"
+                return await send_file(query.message, entry.path, query.from_user.id)
+            snapshot = await open_directory(entry.path)
+    except OSError as e:
+        await query.edit_message_text(f"❌ {e}")
+        return f"❌ {e}"
+
+    text, keyboard = render_files_page(snapshot, 0)
+    await query.edit_message_text(text, parse_mode='Markdown', reply_markup=keyboard)
+    return f"✅ {snapshot.context.path}" if snapshot.context is not None else "✅ Корневые каталоги"
+
+
+async def handle_file_resume(query, transfer_id: str) -> str:
+    """Продолжение прерванной передачи с первой неотправленной части"""
+    # Чужая передача выглядит так же, как несуществующая
+    transfer = await asyncio.to_thread(transfers.get, transfer_id, query.from_user.id)
+    if transfer is None:
+        await query.edit_message_text("❌ Передача не найдена или уже завершена")
+        return "❌ Передача не найдена"
+    if not await asyncio.to_thread(check_unchanged, transfer):
+        await asyncio.to_thread(transfers.remove, transfer_id)
+        await query.edit_message_text("❌ Файл изменился с начала передачи, скачайте его заново")
+        return f"❌ {transfer.path}: файл изменился"
+
+    await query.edit_message_text(f"🔁 Продолжаю с части {transfer.part}")
+    return await continue_transfer(query.message, transfer)
+
+
+@contextlib.asynccontextmanager
+async def take_screenshot(screenshot_type: str, window_title: Optional[str] = None, hwnd: Optional[int] = None):
+    """
+    Скриншот в пуле потоков в пределах бюджета памяти image_memory
+
+    На время захвата резервируется целый кадр, после сжатия резерв уменьшается
+    до размера PNG и держится до выхода из блока, то есть до конца отправки.
+    """
+    async with image_memory.hold(SCREENSHOT_RESERVE) as reservation:
+        success, message, img_bytes = await asyncio.to_thread(
+            WindowsScreenshot().get_screenshot_as_bytes, screenshot_type, window_title, hwnd)
+        reservation.shrink(len(img_bytes) if img_bytes else 0)
+        yield success, message, img_bytes
+
+
+@instrument()
+async def handle_screenshot_by_hwnd(query, hwnd: str) -> str:
     """Создает скриншот окна по его handle"""
     try:
         await query.edit_message_text("📸 Создаю скриншот окна...")
@@ -493,68 +829,577 @@ async def handle_screenshot_by_hwnd(query, hwnd: str) -> None:
         except:
             window_title = "Неизвестное окно"
 
-        screenshot_controller = WindowsScreenshot()
-        success, message, img_bytes = screenshot_controller.get_screenshot_as_bytes("window", window_title)
-
-        if success and img_bytes:
-            await query.message.reply_photo(
-                photo=img_bytes,
-                caption=f"📸 Скриншот окна: {window_title}\n{message}"
-            )
-            await query.edit_message_text("✅ Скриншот окна отправлен!")
-        else:
-            await query.edit_message_text(f"❌ {message}")
+        async with take_screenshot("window", window_title, int(hwnd)) as (success, message, img_bytes):
+            if success and img_bytes:
+                await query.message.reply_photo(
+                    photo=img_bytes,
+                    caption=f"📸 Скриншот окна: {window_title}\n{message}"
+                )
+                await query.edit_message_text("✅ Скриншот окна отправлен!")
+                return f"✅ {window_title}"
+            else:
+                await query.edit_message_text(f"❌ {message}")
+                return f"❌ {message}"
 
     except Exception as e:
+        count_error("handle_screenshot_by_hwnd", e)
         await query.edit_message_text(f"❌ Ошибка создания скриншота: {str(e)}")
+        return f"❌ {e}"
 
 
-async def handle_screenshot(query, screenshot_type: str) -> None:
+@instrument()
+async def handle_screenshot(query, screenshot_type: str) -> str:
     """Обработка создания скриншотов"""
     try:
         await query.edit_message_text("📸 Создаю скриншот...")
 
-        # Создаем объект для работы со скриншотами
-        screenshot_controller = WindowsScreenshot()
-
         # Создаем скриншот
-        success, message, img_bytes = screenshot_controller.get_screenshot_as_bytes(screenshot_type)
-
-        if success and img_bytes:
-            # Отправляем скриншот
-            await query.message.reply_photo(
-                photo=img_bytes,
-                caption=f"📸 Скриншот ({screenshot_type})\n{message}"
-            )
-            await query.edit_message_text("✅ Скриншот отправлен!")
-        else:
-            await query.edit_message_text(f"❌ {message}")
+        async with take_screenshot(screenshot_type) as (success, message, img_bytes):
+            if success and img_bytes:
+                # Отправляем скриншот
+                await query.message.reply_photo(
+                    photo=img_bytes,
+                    caption=f"📸 Скриншот ({screenshot_type})\n{message}"
+                )
+                await query.edit_message_text("✅ Скриншот отправлен!")
+                return f"✅ Скриншот ({screenshot_type})"
+            else:
+                await query.edit_message_text(f"❌ {message}")
+                return f"❌ {message}"
 
     except Exception as e:
+        count_error("handle_screenshot", e)
         await query.edit_message_text(f"❌ Ошибка создания скриншота: {str(e)}")
+        return f"❌ {e}"
 
 
+@instrument()
 async def handle_screenshot_window_by_title(update: Update, context: ContextTypes.DEFAULT_TYPE,
                                             window_title: str) -> None:
     """Создает скриншот конкретного окна по заголовку"""
     try:
         await update.message.reply_text("📸 Создаю скриншот окна...")
 
-        screenshot_controller = WindowsScreenshot()
-        success, message, img_bytes = screenshot_controller.get_screenshot_as_bytes("window", window_title)
+        async with take_screenshot("window", window_title) as (success, message, img_bytes):
+            if success and img_bytes:
+                await update.message.reply_photo(
+                    photo=img_bytes,
+                    caption=f"📸 Скриншот окна: {window_title}\n{message}"
+                )
+            else:
+                await update.message.reply_text(f"❌ {message}")
+
+    except Exception as e:
+        count_error("handle_screenshot_window_by_title", e)
+        await update.message.reply_text(f"❌ Ошибка: {str(e)}")
+
+
+@instrument()
+async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /stats - задержки и ошибки операций"""
+    if not await check_access(update, VIEWER):
+        return
+
+    await update.message.reply_text(format_stats())
+
+
+@instrument()
+async def start_live(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /live - закрепленная панель загрузки системы"""
+    if not await check_access(update, VIEWER, COST_MEDIUM):
+        return
+
+    await live_dashboard.start(context.bot, update.effective_chat.id)
+
+
+async def stop_live(query) -> None:
+    """Кнопка "⏹ Остановить" на живой панели"""
+    if not await live_dashboard.stop(query.get_bot(), query.message.chat_id):
+        await query.edit_message_reply_markup(reply_markup=None)
 
+
+async def track_activity(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Любое действие пользователя продлевает работу живой панели в его чате"""
+    if update.effective_chat is not None:
+        live_dashboard.touch(update.effective_chat.id)
+
+
+def get_wake_keyboard(hosts) -> InlineKeyboardMarkup:
+    """Создает клавиатуру выбора компьютера для пробуждения"""
+    keyboard = [[InlineKeyboardButton(f"⏰ {host.name}", callback_data=callback_data("wake", host.name))] for host in hosts]
+    if len(hosts) > 1:
+        keyboard.append([InlineKeyboardButton("🌐 Разбудить все", callback_data="wake_all")])
+    return InlineKeyboardMarkup(keyboard)
+
+
+async def wake_hosts_and_report(message, hosts) -> str:
+    """Будит компьютеры и показывает итог в сообщении message; возвращает итог для журнала"""
+    names = ", ".join(host.name for host in hosts)
+    await message.edit_text(f"📨 Отправляю magic packet: {names}\n⏳ Жду включения...")
+    results = await wake_on_lan.wake(hosts)
+    await message.edit_text("⏰ Wake-on-LAN\n\n" + "\n".join(result.describe() for result in results))
+    failed = [result.describe() for result in results if result.error or result.up is False]
+    return "; ".join(failed) if failed else f"✅ {names}"
+
+
+@instrument()
+async def wake(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /wake [имя ...|all] - пробуждение компьютеров по сети"""
+    if not await check_access(update, OPERATOR, COST_MEDIUM):
+        return
+
+    try:
+        hosts = wake_hosts.all()
+    except (OSError, ValueError, TypeError) as e:
+        count_error("wake", e)
+        await update.message.reply_text(f"❌ Ошибка чтения списка компьютеров: {e}")
+        return
+
+    if not hosts:
+        await update.message.reply_text(
+            "❌ Список компьютеров пуст.\nДобавьте компьютер: /wakeadd <имя> <MAC> [адрес[:порт]] [broadcast]")
+        return
+
+    if not context.args:
+        await update.message.reply_text("⏰ Какой компьютер разбудить?", reply_markup=get_wake_keyboard(hosts))
+        return
+
+    if context.args == ["all"]:
+        selected = hosts
+    else:
+        known = {host.name: host for host in hosts}
+        unknown = [name for name in context.args if name not in known]
+        if unknown:
+            await update.message.reply_text(f"❌ Неизвестные компьютеры: {', '.join(unknown)}")
+            return
+        selected = [known[name] for name in context.args]
+
+    started = time.perf_counter()
+    message = await update.message.reply_text("⏰ Wake-on-LAN")
+    result = await wake_hosts_and_report(message, selected)
+    audit(update.effective_user, "wake", " ".join(context.args), started, not result.startswith("❌"), result)
+
+
+async def handle_wake(query, name: Optional[str] = None) -> str:
+    """Кнопка пробуждения одного компьютера или всех сразу (name=None)"""
+    if name is None:
+        hosts = wake_hosts.all()
+    else:
+        host = wake_hosts.get(name)
+        hosts = [host] if host is not None else []
+    if not hosts:
+        await query.edit_message_text("❌ Компьютер не найден в списке")
+        return "❌ Компьютер не найден в списке"
+    return await wake_hosts_and_report(query.message, hosts)
+
+
+@instrument()
+async def wake_add(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /wakeadd <имя> <MAC> [адрес[:порт]] [broadcast]"""
+    if not await check_access(update, ADMIN):
+        return
+
+    if len(context.args) < 2 or len(context.args) > 4 or context.args[0] == "all":
+        await update.message.reply_text("❌ Использование: /wakeadd <имя> <MAC> [адрес[:порт]] [broadcast]")
+        return
+
+    name, mac, *rest = context.args
+    fields: Dict[str, Any] = {}
+    if rest:
+        probe_host, _, probe_port = rest[0].partition(":")
+        fields["probe_host"] = probe_host
+        if probe_port:
+            if not probe_port.isdigit():
+                await update.message.reply_text(f"❌ Некорректный порт: {probe_port}")
+                return
+            fields["probe_port"] = int(probe_port)
+    if len(rest) > 1:
+        fields["broadcast"] = rest[1]
+
+    started = time.perf_counter()
+    try:
+        wake_hosts.add(WakeHost(name, mac, **fields))
+    except (OSError, ValueError) as e:
+        audit(update.effective_user, "wakeadd", " ".join(context.args), started, False, str(e))
+        await update.message.reply_text(f"❌ {e}")
+        return
+    audit(update.effective_user, "wakeadd", " ".join(context.args), started, True)
+    await update.message.reply_text(f"✅ Компьютер {name} добавлен")
+
+
+@instrument()
+async def wake_remove(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /wakedel <имя>"""
+    if not await check_access(update, ADMIN):
+        return
+
+    if len(context.args) != 1:
+        await update.message.reply_text("❌ Использование: /wakedel <имя>")
+        return
+
+    started = time.perf_counter()
+    removed = wake_hosts.remove(context.args[0])
+    audit(update.effective_user, "wakedel", context.args[0], started, removed, "" if removed else "не найден")
+    if removed:
+        await update.message.reply_text(f"✅ Компьютер {context.args[0]} удален")
+    else:
+        await update.message.reply_text(f"❌ Компьютер {context.args[0]} не найден")
+
+
+def get_agent_keyboard(name: str) -> InlineKeyboardMarkup:
+    """Создает клавиатуру действий с агентом"""
+    keyboard = [
+        [InlineKeyboardButton("ℹ️ Информация", callback_data=callback_data("agent_info", name)),
+         InlineKeyboardButton("📋 Процессы", callback_data=callback_data("agent_procs", name))],
+        [InlineKeyboardButton("📸 Скриншот", callback_data=callback_data("agent_shot", name)),
+         InlineKeyboardButton("🔒 Блокировка", callback_data=callback_data("agent_lock", name))],
+        [InlineKeyboardButton("🔴 Выключить", callback_data=callback_data("agent_shutdown", name))],
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+
+@instrument()
+async def show_agents(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /agents - компьютеры, управляемые через агентов"""
+    if not await check_access(update, VIEWER, COST_MEDIUM):
+        return
+
+    if not agent_hub.names():
+        await update.message.reply_text("❌ Агенты не настроены. Укажите AGENTS и AGENT_TOKEN в .env")
+        return
+
+    # Все агенты опрашиваются параллельно, недоступный агент не задерживает остальных
+    statuses = await agent_hub.request_all("ping", timeout=3)
+    for name, status in statuses.items():
+        if isinstance(status, Exception):
+            await update.message.reply_text(f"🔴 {name}: недоступен ({status or type(status).__name__})")
+        else:
+            await update.message.reply_text(f"🟢 {name} ({status['name']})", reply_markup=get_agent_keyboard(name))
+
+
+async def handle_agent_info(query, name: str) -> str:
+    """Информация о системе агента"""
+    info = await agent_hub.request(name, "system_info")
+    text = f"ℹ️ **{escape_markdown(name)}:**\n\n"
+    for key, value in info.items():
+        text += f"**{escape_markdown(key)}:** {escape_markdown(str(value))}\n"
+    await query.edit_message_text(text, parse_mode='Markdown', reply_markup=get_agent_keyboard(name))
+    return f"✅ {name}"
+
+
+async def handle_agent_processes(query, name: str) -> str:
+    """Самые загруженные процессы агента"""
+    processes = await agent_hub.request(name, "processes", PROCESSES_PER_PAGE)
+    if processes and 'error' in processes[0]:
+        await query.edit_message_text(f"❌ {name}: {processes[0]['error']}", reply_markup=get_agent_keyboard(name))
+        return f"❌ {processes[0]['error']}"
+    text = f"📋 {name}, процессы:\n\n" + "\n".join(
+        f"{proc['name']} (PID {proc['pid']}) - CPU {proc['cpu']}, RAM {proc['memory']}" for proc in processes)
+    await query.edit_message_text(text, reply_markup=get_agent_keyboard(name))
+    return f"✅ {name}: процессов {len(processes)}"
+
+
+async def handle_agent_screenshot(query, name: str) -> str:
+    """Скриншот экрана агента (передается потоком)"""
+    await query.edit_message_text(f"📸 Создаю скриншот на {name}...")
+    img_bytes, meta = await agent_hub.request(name, "screenshot", "full")
+    await query.message.reply_photo(photo=img_bytes, caption=f"📸 {name}\n{meta.get('message', '')}")
+    await query.edit_message_text(f"✅ Скриншот {name} отправлен!", reply_markup=get_agent_keyboard(name))
+    return f"✅ {name}"
+
+
+async def capture_screen(screenshot_type: str) -> List[StepResult]:
+    """Источник макросов: скриншот всего экрана или активного окна"""
+    # Резерв памяти держится только на время захвата: PNG макроса отправляется после всех шагов
+    async with resource_locks.hold([SCREEN]), take_screenshot(screenshot_type) as shot:
+        success, message, img_bytes = shot
+    name = f"screenshot_{screenshot_type}"
+    if not success or not img_bytes:
+        return [StepResult(name, False, message)]
+    caption = f"📸 Скриншот ({screenshot_type})"
+    return [StepResult(name, True, caption, ((caption, img_bytes),))]
+
+
+async def capture_all_windows() -> List[StepResult]:
+    """Источник макросов: скриншоты всех видимых окон, снимаются одновременно"""
+    windows = await asyncio.to_thread(WindowsWindowManager.get_visible_windows)
+    if windows and 'error' in windows[0]:
+        return [StepResult("screenshot_windows", False, f"❌ {windows[0]['error']}")]
+
+    async def capture(hwnd: int):
+        async with take_screenshot("window", None, hwnd) as shot:
+            return shot
+
+    # Окна снимаются параллельно в пуле потоков, сколько кадров помещается в бюджет памяти;
+    # экран занят один раз на все снимки
+    async with resource_locks.hold([SCREEN]):
+        shots = await asyncio.gather(*(capture(int(window['hwnd'])) for window in windows))
+
+    results = []
+    for window, (success, message, img_bytes) in zip(windows, shots):
+        title = window['title'] or window['hwnd']
         if success and img_bytes:
-            await update.message.reply_photo(
-                photo=img_bytes,
-                caption=f"📸 Скриншот окна: {window_title}\n{message}"
-            )
+            results.append(StepResult(title, True, f"📸 {title}", ((f"📸 {title}", img_bytes),)))
+        else:
+            results.append(StepResult(title, False, f"❌ {title}: {message.lstrip('❌ ')}"))
+    return results
+
+
+MEDIA_GROUP_SIZE = 10  # Ограничение Telegram на число фото в одной группе
+
+
+async def send_photos(message, photos) -> None:
+    """Отправляет фотографии ответом на message альбомами по MEDIA_GROUP_SIZE"""
+    for offset in range(0, len(photos), MEDIA_GROUP_SIZE):
+        group = photos[offset:offset + MEDIA_GROUP_SIZE]
+        if len(group) == 1:
+            caption, data = group[0]
+            await message.reply_photo(photo=data, caption=caption)
+        else:
+            await message.reply_media_group([InputMediaPhoto(data, caption=caption) for caption, data in group])
+
+
+def get_macros_keyboard(macros) -> InlineKeyboardMarkup:
+    """Создает клавиатуру выбора макроса"""
+    keyboard = [[InlineKeyboardButton(f"▶️ {macro.title}", callback_data=callback_data("macro", macro.name))]
+                for macro in macros]
+    return InlineKeyboardMarkup(keyboard)
+
+
+def macro_access_error(user_id: int, macro: Macro) -> Optional[str]:
+    """Макрос доступен, только если пользователю доступны действия всех его шагов"""
+    if all(access.allows(user_id, action.role) for action in macro_runner.actions(macro)):
+        return None
+    access_denied.inc(reason="role")
+    return "❌ Недостаточно прав для действий этого макроса."
+
+
+async def run_macro_and_report(message, macro: Macro) -> bool:
+    """Выполняет макрос, отправляет снимки и показывает итог в сообщении message"""
+    await message.edit_text(f"▶️ Выполняю макрос {macro.title}...")
+    report = await macro_runner.run(macro)
+    await send_photos(message, report.photos)
+    await message.edit_text(report.describe())
+    return report.ok
+
+
+@instrument()
+async def show_macros(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /macro [имя] - выполнение набора действий одним запросом"""
+    if not await check_access(update, OPERATOR, COST_HEAVY if context.args else COST_LIGHT):
+        return
+
+    try:
+        macros = macro_book.all()
+    except (OSError, ValueError, TypeError, KeyError) as e:
+        count_error("macro", e)
+        await update.message.reply_text(f"❌ Ошибка чтения макросов: {e}")
+        return
+
+    if not context.args:
+        await update.message.reply_text("▶️ Какой макрос выполнить?", reply_markup=get_macros_keyboard(macros))
+        return
+
+    macro = macro_book.get(context.args[0])
+    if macro is None:
+        await update.message.reply_text(f"❌ Макрос {context.args[0]} не найден")
+        return
+
+    message = await update.message.reply_text(f"▶️ Макрос {macro.title}")
+    try:
+        error = macro_access_error(update.effective_user.id, macro)
+        if error:
+            await message.edit_text(error)
+            return
+        if macro_runner.requires_confirmation(macro):
+            await ask_confirmation(message, update.effective_user.id, callback_data("macro_run", macro.name),
+                                   f"макрос {macro.title}")
+            return
+        started = time.perf_counter()
+        ok = await run_macro_and_report(message, macro)
+        audit(update.effective_user, "macro", macro.name, started, ok)
+    except ValueError as e:
+        await message.edit_text(f"❌ {e}")
+
+
+async def handle_macro(query, name: str, confirmed: bool = False) -> str:
+    """Кнопка макроса; макрос с опасными действиями сначала требует подтверждения"""
+    macro = macro_book.get(name)
+    if macro is None:
+        await query.edit_message_text(f"❌ Макрос {name} не найден")
+        return f"❌ Макрос {name} не найден"
+    error = macro_access_error(query.from_user.id, macro)
+    if error:
+        await query.edit_message_text(error)
+        return error
+    if not confirmed and macro_runner.requires_confirmation(macro):
+        await ask_confirmation(query.message, query.from_user.id, callback_data("macro_run", name), f"макрос {macro.title}")
+        return "⚠️ Запрошено подтверждение"
+    if await run_macro_and_report(query.message, macro):
+        return f"✅ {macro.title}"
+    return f"❌ {macro.title}: не все шаги выполнены"
+
+
+# Источники данных для шагов макросов (перекрывают одноименные кнопки скриншотов)
+macro_runner = MacroRunner(actions, {
+    "screenshot_full": lambda: capture_screen("full"),
+    "screenshot_window": lambda: capture_screen("window"),
+    "screenshot_windows": capture_all_windows,
+})
+
+
+HISTORY_LIMIT = 20
+
+# Профилирование по команде /profile: время замера по умолчанию и наибольшее, с
+profiler = Profiler()
+PROFILE_DEFAULT_SECONDS = 10
+PROFILE_MAX_SECONDS = 300
+
+
+@instrument()
+async def show_history(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /history [действие] [число] - журнал действий"""
+    if not await check_access(update, ADMIN):
+        return
+
+    action = None
+    limit = HISTORY_LIMIT
+    for arg in context.args:
+        if arg.isdigit():
+            limit = min(int(arg), 100)
         else:
-            await update.message.reply_text(f"❌ {message}")
+            action = arg
+
+    records = audit_journal.query(action=action, limit=limit)
+    if not records:
+        await update.message.reply_text("📜 Журнал пуст." if action is None else f"📜 Записей {action} нет.")
+        return
+    await update.message.reply_text(
+        "📜 Последние действия:\n\n" + "\n".join(record.describe() for record in records))
+
+
+@instrument()
+async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /profile [секунды] - профиль бота и рост памяти за время замера"""
+    if not await check_access(update, ADMIN):
+        return
+
+    if context.args and not context.args[0].isdigit():
+        await update.message.reply_text("❌ Использование: /profile [секунды]")
+        return
+    seconds = min(int(context.args[0]) if context.args else PROFILE_DEFAULT_SECONDS, PROFILE_MAX_SECONDS)
+    if profiler.running:
+        await update.message.reply_text("⏱ Профилирование уже запущено.")
+        return
 
+    status = await update.message.reply_text(f"⏱ Профилирую {seconds} с...")
+    started = time.perf_counter()
+    try:
+        report = await profiler.run(max(seconds, 1))
     except Exception as e:
-        await update.message.reply_text(f"❌ Ошибка: {str(e)}")
+        audit(update.effective_user, "profile", str(seconds), started, False, str(e))
+        await status.edit_text(f"❌ Ошибка профилирования: {e}")
+        return
+    audit(update.effective_user, "profile", str(seconds), started, True)
+    await status.edit_text(report.text)
+    # .prof открывается через python -m pstats или snakeviz
+    await status.reply_document(document=report.prof,
+                                filename=time.strftime("profile-%Y%m%d-%H%M%S.prof"))
+
 
+@instrument()
+async def show_chart(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /chart [замеров] - график загрузки по данным cpumonitor.py"""
+    if not await check_access(update, VIEWER, COST_HEAVY):
+        return
+
+    if context.args and not context.args[0].isdigit():
+        await update.message.reply_text("❌ Использование: /chart [число замеров]")
+        return
+    count = min(max(int(context.args[0]), 1) if context.args else CHART_DEFAULT_SAMPLES, CHART_MAX_SAMPLES)
 
+    try:
+        # Чтение идет через пул соединений cpumonitor и не ждет записи замеров
+        columns = await asyncio.to_thread(monitor_columns, count)
+        if not len(columns.times):
+            await update.message.reply_text("📈 Замеров пока нет: запустите cpumonitor.py.")
+            return
+        # Рисует процесс пула; цикл событий тем временем обслуживает других пользователей
+        png = await chart_pool.render(columns)
+    except Exception as e:
+        count_error("show_chart", e)
+        await update.message.reply_text(f"❌ Ошибка построения графика: {e}")
+        return
+    await update.message.reply_photo(photo=png, caption=f"📈 Загрузка, последние {len(columns.times)} замеров")
+
+
+@instrument()
+async def show_load(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /load [минут] - загрузка текстовыми графиками, без картинки"""
+    if not await check_access(update, VIEWER):
+        return
+
+    if context.args and not context.args[0].isdigit():
+        await update.message.reply_text("❌ Использование: /load [минут]")
+        return
+    minutes = min(max(int(context.args[0]), 1) if context.args else LOAD_DEFAULT_MINUTES, CHART_MAX_SAMPLES)
+
+    sampler = system_info_provider.sampler
+    try:
+        if minutes * 60 <= sampler.interval * sampler.samples.maxlen:
+            # Последние минуты есть в памяти: ни базы, ни потоков, рендер за доли миллисекунды
+            sampler.start()
+            horizon = time.time() - minutes * 60
+            columns = monitor_columns_from_rows([(sample.timestamp, sample.cpu, sample.gpu, sample.ram, sample.vram)
+                                                 for sample in list(sampler.samples) if sample.timestamp >= horizon])
+        else:
+            # Дольше - из базы cpumonitor.py, где замер раз в минуту
+            columns = await asyncio.to_thread(monitor_columns, minutes)
+        text = monitor_render_text(columns, LOAD_WIDTH)
+    except Exception as e:
+        count_error("show_load", e)
+        await update.message.reply_text(f"❌ Ошибка: {e}")
+        return
+
+    if not text:
+        await update.message.reply_text("📊 Собираю первые замеры, повторите через несколько секунд.")
+        return
+    await update.message.reply_text(
+        f"📊 Загрузка за {minutes} мин\n```\n{text}\n```\n📈 /chart - подробный график", parse_mode='Markdown')
+
+
+@instrument()
+async def show_outages(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /outages - последние перебои сети"""
+    if not await check_access(update, VIEWER):
+        return
+
+    outages = await asyncio.to_thread(read_outages, outage_reporter.path)
+    if not outages:
+        await update.message.reply_text("📶 Перебоев сети не было.")
+        return
+    await update.message.reply_text(
+        "📶 Последние перебои сети:\n\n" + "\n".join(outage.describe() for outage in outages[-10:]))
+
+
+async def report_outages(application: Application) -> None:
+    """Сообщает владельцу о перебоях сети, как только связь с Telegram восстановилась"""
+    while True:
+        try:
+            outages = await asyncio.to_thread(outage_reporter.new_outages)
+            admins = access.users_with_role(ADMIN)
+            if outages and admins:
+                text = "📶 Пока бота не было в сети:\n\n" + "\n".join(outage.describe() for outage in outages)
+                for admin_id in admins:
+                    await application.bot.send_message(admin_id, text)
+                outage_reporter.mark_reported(outages)
+        except Exception as e:
+            # Сеть еще не вернулась - повторим при следующей проверке
+            logger.warning(f"Не удалось сообщить о перебоях сети: {e}")
+        await asyncio.sleep(OUTAGES_CHECK_INTERVAL)
+
+
+@instrument()
 async def show_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показывает справку по боту"""
     help_text = (
@@ -575,29 +1420,166 @@ async def show_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         "• Активация окна\n\n"
         "📋 Процессы:\n"
         "• Список активных процессов\n\n"
+        "📊 /stats - время выполнения и ошибки операций\n"
+        "📈 /live - закрепленная панель загрузки, обновляется сама\n"
+        "⏰ /wake - разбудить компьютеры по сети (/wakeadd, /wakedel - список)\n"
+        "🖥 /agents - другие компьютеры, управляемые через агентов\n"
+        "📶 /outages - последние перебои сети\n"
+        "📊 /load [минут] - загрузка текстом, быстро и без картинки\n"
+        "📈 /chart [замеров] - график загрузки (cpumonitor.py)\n"
+        "📜 /history [действие] [число] - журнал действий\n"
+        "⏱ /profile [секунды] - профиль бота и рост памяти\n"
+        "▶️ /macro [имя] - несколько действий одним запросом\n"
+        "📁 /files [путь] - файлы компьютера и их скачивание\n\n"
         "⚠️ Критические действия требуют подтверждения."
     )
 
     await update.message.reply_text(help_text)
 
 
+# Действия inline кнопок. Новое действие добавляется сюда, центральный обработчик не меняется.
+# Контроллеры вызываются через lambda, чтобы имя класса разрешалось в момент вызова.
+for _action in (
+    # Служебные
+    Action("confirm", execute_confirmed_action, prefix=True, view=True, audit=False, role=VIEWER),
+    Action("cancel_action", cancel_action, view=True, audit=False, role=VIEWER),
+    Action("back_main", back_to_main, view=True, audit=False, role=VIEWER),
+    Action(STOP_CALLBACK, stop_live, view=True, audit=False, role=VIEWER),
+
+    # Wake-on-LAN
+    Action("wake_all", handle_wake, view=True, cost=COST_MEDIUM),
+    Action("wake", handle_wake, prefix=True, view=True, cost=COST_MEDIUM),
+
+    # Питание и экран
+    Action("power_shutdown", lambda: WindowsSystemController.shutdown(), "выключение компьютера", "🔴",
+           confirm=True, locks=(POWER,), role=ADMIN),
+    Action("power_restart", lambda: WindowsSystemController.restart(), "перезагрузку компьютера", "🔄",
+           confirm=True, locks=(POWER,), role=ADMIN),
+    Action("power_sleep", lambda: WindowsSystemController.sleep(), "переход в режим сна", "😴",
+           confirm=True, locks=(POWER,), role=ADMIN),
+    Action("power_hibernate", lambda: WindowsSystemController.hibernate(), "переход в гибернацию", "🛌",
+           confirm=True, locks=(POWER,), role=ADMIN),
+    Action("screen_lock", lambda: WindowsSystemController.lock_screen(), "блокировку экрана", "🔒",
+           confirm=True, locks=(POWER,), role=ADMIN),
+
+    # Скриншоты
+    Action("screenshot_full", lambda query: handle_screenshot(query, "full"), view=True, locks=(SCREEN,),
+           role=VIEWER, cost=COST_HEAVY),
+    Action("screenshot_window", lambda query: handle_screenshot(query, "window"), view=True, locks=(SCREEN,),
+           role=VIEWER, cost=COST_HEAVY),
+    Action("screenshot_window", handle_screenshot_by_hwnd, prefix=True, view=True, locks=(SCREEN,),
+           role=VIEWER, cost=COST_HEAVY),
+
+    # Процессы и окна
+    Action("processes_list", handle_processes_list, view=True, locks=(PROCESSES,), role=VIEWER, cost=COST_MEDIUM),
+    Action("windows_list", handle_windows_list, view=True, locks=(WINDOWS,), role=VIEWER, cost=COST_MEDIUM),
+    Action("page", handle_page, prefix=True, view=True, audit=False, role=VIEWER),
+    Action("kill_process", lambda pid: WindowsProcessManager.kill_process(int(pid)), "завершение процесса", "⚠️",
+           prefix=True, mode=THREAD, locks=(PROCESSES,), role=ADMIN),
+    Action("kill_name", lambda name: WindowsProcessManager.kill_process_by_name(name), "завершение процессов",
+           "⚠️", confirm=True, prefix=True, mode=THREAD, locks=(PROCESSES,), role=ADMIN, cost=COST_MEDIUM),
+    Action("activate_window", lambda hwnd: WindowsWindowManager.activate_window(hwnd), "активацию окна", "🪟",
+           prefix=True, mode=THREAD, locks=(WINDOWS,)),
+
+    # Агенты на других компьютерах
+    Action("agent_info", handle_agent_info, prefix=True, view=True, role=VIEWER, cost=COST_MEDIUM),
+    Action("agent_procs", handle_agent_processes, prefix=True, view=True, role=VIEWER, cost=COST_MEDIUM),
+    Action("agent_shot", handle_agent_screenshot, prefix=True, view=True, role=VIEWER, cost=COST_HEAVY),
+    Action("agent_lock", lambda name: agent_hub.request(name, "lock_screen"), "блокировку экрана агента", "🔒",
+           confirm=True, prefix=True, role=ADMIN),
+    Action("agent_shutdown", lambda name: agent_hub.request(name, "shutdown"), "выключение компьютера агента", "🔴",
+           confirm=True, prefix=True, role=ADMIN),
+
+    # Файлы: переход по каталогам дешевый, скачивание - дорогое и только для администратора
+    Action("file_resume", handle_file_resume, prefix=True, view=True, role=ADMIN, cost=COST_HEAVY),
+    Action("fileget", lambda query, arg: handle_file(query, arg, download=True), prefix=True, view=True,
+           role=ADMIN, cost=COST_HEAVY),
+    Action("file", handle_file, prefix=True, view=True),
+
+    # Макросы (права на действия шагов проверяются при запуске)
+    Action("macro", handle_macro, prefix=True, view=True, cost=COST_HEAVY),
+    Action("macro_run", lambda query, name: handle_macro(query, name, confirmed=True), "макрос", "▶️",
+           confirm=True, prefix=True, view=True),  # Оплачен нажатием кнопки макроса
+
+    # Звук
+    Action("sound_mute", lambda: WindowsVolumeController.mute(), "отключение звука", "🔇", locks=(SOUND,)),
+    Action("sound_unmute", lambda: WindowsVolumeController.unmute(), "включение звука", "🔊", locks=(SOUND,)),
+    Action("sound_50", lambda: WindowsVolumeController.set_volume(50), "громкость 50%", "🔉", locks=(SOUND,)),
+    Action("sound_100", lambda: WindowsVolumeController.set_volume(100), "громкость 100%", "🔊", locks=(SOUND,)),
+):
+    actions.register(_action)
+
+
+async def post_init(application: Application) -> None:
+    """Запуск служебных сервисов после инициализации приложения"""
+    if METRICS_PORT:
+        await start_metrics_server(METRICS_HOST, int(METRICS_PORT))
+    await audit_journal.start()
+    # Первые замеры для "ℹ️ Информация о системе" идут в фоне, ответ их не ждет
+    await asyncio.to_thread(system_info_provider.warm_up)
+    background_tasks.add(asyncio.create_task(report_outages(application)))
+    logger.info(import_profiler.report())
+
+
+async def post_stop(application: Application) -> None:
+    """Остановка фоновых задач до закрытия соединения с Telegram"""
+    for task in background_tasks:
+        task.cancel()
+    await live_dashboard.stop_all(application.bot)
+    await agent_hub.close()
+    await audit_journal.stop()
+    chart_pool.close()
+
+
 def main():
     """Главная функция запуска бота"""
     if not BOT_TOKEN:
         logger.error("BOT_TOKEN не найден в переменных окружения!")
         return
 
-    # Создаем приложение
-    application = Application.builder().token(BOT_TOKEN).build()
+    # Создаем приложение. Обновления обрабатываются параллельно: медленный скриншот
+    # не задерживает меню и подтверждения, а конфликтующие действия разводятся
+    # блокировками ресурсов в реестре действий
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .rate_limiter(OutboundScheduler())
+        .post_init(post_init)
+        .post_stop(post_stop)
+    )
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(f"{TELEGRAM_API_URL}/bot").base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+    application = builder.build()
 
     # Добавляем обработчики
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(TypeHandler(Update, track_activity), group=-1)
+    application.add_handler(CommandHandler("stats", show_stats))
+    application.add_handler(CommandHandler("live", start_live))
+    application.add_handler(CommandHandler("wake", wake))
+    application.add_handler(CommandHandler("wakeadd", wake_add))
+    application.add_handler(CommandHandler("wakedel", wake_remove))
+    application.add_handler(CommandHandler("agents", show_agents))
+    application.add_handler(CommandHandler("outages", show_outages))
+    application.add_handler(CommandHandler("load", show_load))
+    application.add_handler(CommandHandler("chart", show_chart))
+    application.add_handler(CommandHandler("history", show_history))
+    application.add_handler(CommandHandler("profile", profile))
+    application.add_handler(CommandHandler("macro", show_macros))
+    application.add_handler(CommandHandler("files", show_files))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     application.add_handler(CallbackQueryHandler(handle_callback))
 
     # Запускаем бота
-    logger.info("Запуск бота...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if WEBHOOK_URL:
+        logger.info(f"Запуск бота в режиме webhook на {WEBHOOK_LISTEN}:{WEBHOOK_PORT}...")
+        run_webhook(application, WebhookServer(
+            application, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_SECRET, ALLOWED_UPDATES
+        ))
+    else:
+        logger.info("Запуск бота...")
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 
 if __name__ == '__main__':
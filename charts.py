@@ -0,0 +1,172 @@
+"""
+Графики загрузки компьютера в отдельных процессах
+
+Отрисовка matplotlib - долгий код на Python, который держит GIL, поэтому в
+потоке она все равно останавливала бы цикл событий бота. Графики рисует
+небольшой постоянный пул процессов: matplotlib импортируется в каждом
+процессе один раз при его запуске, замеры передаются колонками через общую
+память (без сериализации списков), обратно возвращается готовый PNG.
+"""
+
+import asyncio
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from metrics import track
+
+SMOOTHING_WINDOW = 10  # Окно скользящего среднего, замеров
+
+# Колонки загрузки в порядке хранения в общей памяти: (заголовок, цвет)
+SERIES = (
+    ("CPU Utilization", "blue"),
+    ("GPU Utilization", "orange"),
+    ("RAM Utilization", "green"),
+    ("VRAM Utilization", "red"),
+)
+
+
+class SampleColumns(NamedTuple):
+    """Замеры колонками: время (datetime64[us]) и загрузка в % (float32, строки как в SERIES)"""
+    times: np.ndarray
+    values: np.ndarray  # форма (4, число замеров)
+
+    @classmethod
+    def empty(cls) -> "SampleColumns":
+        return cls(np.empty(0, "datetime64[us]"), np.empty((len(SERIES), 0), np.float32))
+
+    @property
+    def nbytes(self) -> int:
+        return self.times.nbytes + self.values.nbytes
+
+
+def smooth(values: np.ndarray, window: int = SMOOTHING_WINDOW) -> np.ndarray:
+    """Скользящее среднее по последней оси, как pandas rolling(window).mean(): первые window - 1 точек - NaN"""
+    result = np.full(values.shape, np.nan)
+    if values.shape[-1] < window:
+        return result
+    sums = np.cumsum(values, axis=-1, dtype=np.float64)
+    result[..., window - 1] = sums[..., window - 1]
+    result[..., window:] = sums[..., window:] - sums[..., :-window]
+    result[..., window - 1:] /= window
+    return result
+
+
+# Символы спарклайна от наименьшего значения к наибольшему
+SPARK_BLOCKS = np.array(list("▁▂▃▄▅▆▇█"))
+
+
+def downsample(values: np.ndarray, width: int) -> np.ndarray:
+    """
+    Сжимает ряды (последняя ось) до width точек: среднее по равным корзинам без учета NaN
+
+    Все ряды считаются разом через np.add.reduceat, без цикла по точкам; в
+    корзине без значений получается NaN.
+    """
+    count = values.shape[-1]
+    if count <= width:
+        return values.astype(np.float64)
+    edges = np.arange(width) * count // width
+    present = ~np.isnan(values)
+    sums = np.add.reduceat(np.where(present, values, 0.0), edges, axis=-1, dtype=np.float64)
+    counts = np.add.reduceat(present, edges, axis=-1, dtype=np.int64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts
+
+
+def sparkline(values: np.ndarray, low: float = 0.0, high: float = 100.0) -> str:
+    """Спарклайн ▁..█ по символу на точку одномерного ряда; значения обрезаются по [low, high], NaN - пробел"""
+    top = len(SPARK_BLOCKS) - 1
+    missing = np.isnan(values)
+    levels = np.rint(np.clip((np.where(missing, low, values) - low) / ((high - low) or 1.0), 0.0, 1.0) * top)
+    chars = SPARK_BLOCKS[levels.astype(np.intp)]
+    chars[missing] = " "
+    return "".join(chars)
+
+
+def draw_utilization(axes, columns: SampleColumns, smoothing: bool = True) -> None:
+    """Рисует четыре графика загрузки на сетке осей 2x2"""
+    values = smooth(columns.values) if smoothing else columns.values
+    for number, (ax, (title, color)) in enumerate(zip(axes.flat, SERIES)):
+        ax.plot(columns.times, values[number], color=color)
+        ax.set_title(title)  # Вместо легенды используем заголовок
+        ax.set_ylim(0, 100)
+        if number % 2 == 0:
+            ax.set_ylabel('Нагрузка, %')
+        if number >= 2:
+            ax.set_xlabel('Время')
+
+
+def _init_worker() -> None:
+    """Запуск процесса пула: единственный импорт matplotlib за время жизни процесса"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.figure
+    import matplotlib.style
+    matplotlib.style.use('seaborn-v0_8-whitegrid')
+
+
+def _render(name: str, count: int, smoothing: bool) -> bytes:
+    """Рисует график в процессе пула по колонкам из общей памяти name"""
+    from matplotlib.figure import Figure
+
+    memory = shared_memory.SharedMemory(name=name)
+    try:
+        # Массивы - представления поверх общей памяти, данные не копируются
+        times = np.ndarray(count, "datetime64[us]", memory.buf)
+        values = np.ndarray((len(SERIES), count), np.float32, memory.buf, offset=times.nbytes)
+        # Figure без pyplot: не регистрируется в глобальном состоянии и освобождается сборщиком
+        figure = Figure(figsize=(12, 8))
+        draw_utilization(figure.subplots(nrows=2, ncols=2), SampleColumns(times, values), smoothing)
+        figure.tight_layout()
+        buffer = io.BytesIO()
+        figure.savefig(buffer, format="png")
+        del times, values
+    finally:
+        memory.close()
+    return buffer.getvalue()
+
+
+class ChartPool:
+    """
+    Постоянный пул процессов для графиков
+
+    Процессы запускаются при первом графике и живут до close. На Windows
+    процессы стартуют через spawn и заново импортируют главный модуль, поэтому
+    запуск пула - разовая задержка в несколько секунд, а не на каждый график.
+    """
+
+    def __init__(self, workers: int = 2):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker)
+        return self._executor
+
+    async def render(self, columns: SampleColumns, smoothing: bool = True) -> bytes:
+        """PNG с четырьмя графиками загрузки"""
+        count = len(columns.times)
+        memory = shared_memory.SharedMemory(create=True, size=max(columns.nbytes, 1))
+        try:
+            with track("chart"):
+                # Одна запись колонок в общую память; процесс пула читает их на месте
+                np.ndarray(count, "datetime64[us]", memory.buf)[:] = columns.times
+                np.ndarray((len(SERIES), count), np.float32, memory.buf,
+                           offset=columns.times.nbytes)[:] = columns.values
+                return await asyncio.get_running_loop().run_in_executor(
+                    self._get_executor(), _render, memory.name, count, smoothing)
+        finally:
+            memory.close()
+            memory.unlink()
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
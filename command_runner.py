@@ -0,0 +1,115 @@
+"""
+Асинхронный запуск системных команд без shell с таймаутами и метриками
+"""
+
+import asyncio
+import locale
+import logging
+import math
+import os
+import time
+from typing import NamedTuple, Optional, Tuple
+
+from metrics import operation_errors, operation_seconds
+
+logger = logging.getLogger(__name__)
+
+# Консольные утилиты Windows пишут в OEM-кодировке (cp866 для русской локали)
+OUTPUT_ENCODING = "oem" if os.name == "nt" else locale.getpreferredencoding(False)
+
+
+class CommandResult(NamedTuple):
+    """Результат выполнения команды"""
+    args: Tuple[str, ...]
+    returncode: Optional[int]
+    stdout: str
+    stderr: str
+    duration: float
+    timed_out: bool = False
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out and self.error is None
+
+    def describe(self) -> str:
+        """Краткое описание ошибки для пользователя"""
+        if self.error:
+            return self.error
+        if self.timed_out:
+            return f"превышено время ожидания ({self.duration:.1f}с)"
+        output = (self.stderr or self.stdout).strip()
+        if output:
+            return f"{output.splitlines()[-1]} (код {self.returncode})"
+        return f"код возврата {self.returncode}"
+
+
+class CommandRunner:
+    """
+    Запуск команд через asyncio.create_subprocess_exec
+
+    Команда не блокирует цикл событий, зависший процесс убивается по таймауту,
+    а число одновременно запущенных процессов ограничено семафором. Длительность
+    и ошибки каждой команды попадают в метрики как операция command:<программа>.
+    """
+
+    def __init__(self, max_concurrency: int = 4, default_timeout: float = 15.0):
+        self.default_timeout = default_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(self, *args: str, timeout: Optional[float] = None) -> CommandResult:
+        """
+        Выполняет команду и возвращает результат
+
+        Args:
+            args: Программа и ее аргументы (shell не используется)
+            timeout: Таймаут в секундах, None - таймаут по умолчанию,
+                math.inf - без ограничения
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        async with self._semaphore:
+            result = await self._execute(args, None if math.isinf(timeout) else timeout)
+
+        operation = f"command:{os.path.basename(args[0]).lower()}"
+        operation_seconds.observe(result.duration, operation=operation)
+        if not result.ok:
+            error = "timeout" if result.timed_out else "start" if result.error else "exit_code"
+            operation_errors.inc(operation=operation, error=error)
+            logger.warning(f"Команда {' '.join(args)} завершилась ошибкой: {result.describe()}")
+        return result
+
+    @staticmethod
+    async def _execute(args: Tuple[str, ...], timeout: Optional[float]) -> CommandResult:
+        started = time.perf_counter()
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *args,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        except FileNotFoundError:
+            return CommandResult(args, None, "", "", time.perf_counter() - started,
+                                 error=f"программа {args[0]} не найдена")
+        except OSError as e:
+            return CommandResult(args, None, "", "", time.perf_counter() - started,
+                                 error=f"не удалось запустить {args[0]}: {e}")
+
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            return CommandResult(args, process.returncode, "", "", time.perf_counter() - started,
+                                 timed_out=True)
+
+        return CommandResult(
+            args,
+            process.returncode,
+            stdout.decode(OUTPUT_ENCODING, errors="replace"),
+            stderr.decode(OUTPUT_ENCODING, errors="replace"),
+            time.perf_counter() - started,
+        )
+
+
+command_runner = CommandRunner()
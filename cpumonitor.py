@@ -1,42 +1,238 @@
 """
 Модуль для создания красивых плотов с графиками использования ресурсов пк
 """
-from typing import Any
+import contextlib
+import os
+import queue
+import threading
+from typing import TYPE_CHECKING, Any, Iterator
 
-import matplotlib
 # TODO Создать отдельный модуль со сбором статистики о ресурсах пк и записи их в базу данных.
 # TODO Второй бот который будет уведомлять об активности пк каждую 1 минуту(примерно),\
 #  каждые 30-60 минут присылать график ресурсов.
 # TODO Позаботиться о безопасности, обработка случаев
 
-import matplotlib.pyplot as plt
-from matplotlib.figure import Figure
-import sqlite3, psutil, pynvml, time, datetime
-import pandas as pd
+import sqlite3, psutil, pynvml, time, datetime, heapq, sys
+import numpy as np
+
+from charts import SampleColumns, downsample, draw_utilization, sparkline
+
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
 
-pynvml.nvmlInit()
 # Функции для получения использования ресурсов пк
 def get_cpu_utilization(): return psutil.cpu_percent(interval=1)
 def get_ram_utilization(): return psutil.virtual_memory()
-handle = pynvml.nvmlDeviceGetHandleByIndex(0)
-def get_gpu_utilization(): return pynvml.nvmlDeviceGetUtilizationRates(handle)
+# NVML инициализируется при первом замере GPU, чтобы чтение базы (бот) работало и без видеокарты
+_gpu_handle = None
+def get_gpu_utilization():
+    global _gpu_handle
+    if _gpu_handle is None:
+        pynvml.nvmlInit()
+        _gpu_handle = pynvml.nvmlDeviceGetHandleByIndex(0)
+    return pynvml.nvmlDeviceGetUtilizationRates(_gpu_handle)
+
+# Сколько процессов-лидеров по CPU и по RAM записывается на каждом замере
+TOP_PROCESSES = 5
+# Сколько дней хранятся записи (и общие, и по процессам)
+RETENTION_DAYS = 30
 
 # Автоматическая конвертация строк в класс datetime
 def convert_timestamp(val): return datetime.datetime.fromisoformat(val.decode())
 sqlite3.register_converter("DATETIME", convert_timestamp)
 
-# Инициализация субд sqlite3.
-db = sqlite3.connect('CPUmonitor.db', detect_types=sqlite3.PARSE_DECLTYPES)
-cursor = db.cursor()
-cursor.execute('''
+SCHEMA = '''
 CREATE TABLE IF NOT EXISTS CPUmonitor (
 timestamp DATETIME UNIQUE NOT NULL,
 cpu_utilization REAL NOT NULL,
 gpu_utilization REAL NOT NULL,
 vram_utilization REAL NOT NULL,
 ram_utilization REAL NOT NULL
-)
-''')
+);
+-- Лидеры по процессам. Имена хранятся один раз в process_names, строка замера -
+-- только числа: номер общего замера (rowid CPUmonitor), id имени, pid,
+-- CPU в десятых долях процента от всего компьютера и RSS в мегабайтах.
+-- Таблица упорядочена по номеру замера, поэтому выборка за интервал - это
+-- поиск границ по индексу timestamp и чтение непрерывного диапазона.
+CREATE TABLE IF NOT EXISTS process_names (
+id INTEGER PRIMARY KEY,
+name TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS process_usage (
+sample_id INTEGER NOT NULL,
+name_id INTEGER NOT NULL,
+pid INTEGER NOT NULL,
+cpu INTEGER NOT NULL,
+ram_mb INTEGER NOT NULL,
+PRIMARY KEY (sample_id, name_id, pid)
+) WITHOUT ROWID;
+'''
+
+class MonitorDatabase:
+    """
+    Соединения с базой замеров: одно для записи и пул соединений только для чтения
+
+    База работает в режиме WAL, поэтому читатели не ждут записи и не мешают ей:
+    панели, уведомления и графики бота читают одновременно, пока идут замеры.
+    Соединения открываются при первом обращении и используются из любых потоков:
+    запись идет под блокировкой, соединение для чтения в каждый момент отдано
+    одному потоку. Каждое соединение хранит подготовленные запросы (cached_statements),
+    поэтому повторяющиеся запросы не разбираются заново.
+    """
+
+    def __init__(self, path: str, readers: int = 4, mmap_size: int = 256 * 1024 * 1024,
+                 cached_statements: int = 64):
+        self.path = path
+        self.readers = readers
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+        self._writer: sqlite3.Connection | None = None
+        self._write_lock = threading.Lock()
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._opened = 0
+        self._open_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False,
+                             cached_statements=self.cached_statements)
+        db.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        return db
+
+    def _get_writer(self) -> sqlite3.Connection:
+        if self._writer is None:
+            db = self._connect()
+            db.execute('PRAGMA journal_mode = WAL')
+            # В WAL fsync на каждой фиксации не нужен для целостности, только для последнего замера
+            db.execute('PRAGMA synchronous = NORMAL')
+            db.executescript(SCHEMA)
+            self._writer = db
+        return self._writer
+
+    @contextlib.contextmanager
+    def writing(self) -> Iterator[sqlite3.Cursor]:
+        """
+        Курсор соединения для записи; изменения фиксируются при выходе из блока
+
+        :return:
+            sqlite3.Cursor
+        """
+        with self._write_lock:
+            db = self._get_writer()
+            try:
+                yield db.cursor()
+                db.commit()
+            except BaseException:
+                db.rollback()
+                raise
+
+    def _acquire_reader(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._open_lock:
+            if self._opened < self.readers:
+                self._opened += 1
+                opened = True
+            else:
+                opened = False
+        if not opened:
+            return self._idle.get()  # Все соединения заняты - ждем первое освободившееся
+        try:
+            # Схема и режим WAL создаются соединением для записи, если базы еще нет
+            with self._write_lock:
+                self._get_writer()
+            db = self._connect()
+            db.isolation_level = None  # Транзакции чтения открываются явно в reading
+            db.execute('PRAGMA query_only = ON')
+            return db
+        except BaseException:
+            with self._open_lock:
+                self._opened -= 1
+            raise
+
+    @contextlib.contextmanager
+    def reading(self) -> Iterator[sqlite3.Cursor]:
+        """
+        Курсор соединения только для чтения; все запросы блока видят один снимок базы
+
+        :return:
+            sqlite3.Cursor
+        """
+        db = self._acquire_reader()
+        try:
+            db.execute('BEGIN')
+            try:
+                yield db.cursor()
+            finally:
+                db.execute('COMMIT')
+        finally:
+            self._idle.put(db)
+
+    def close(self) -> None:
+        """
+        Закрывает все соединения (занятые соединения для чтения закрываются при возврате в пул)
+
+        :return:
+            None
+        """
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._open_lock:
+                self._opened -= 1
+
+# База замеров; путь можно задать переменной окружения CPUMONITOR_DB
+monitor_db = MonitorDatabase(os.getenv('CPUMONITOR_DB', 'CPUmonitor.db'))
+
+# Кэш id имен процессов, чтобы не обращаться к process_names на каждом замере
+_process_name_ids: dict[str, int] = {}
+
+def intern_process_name(cursor: sqlite3.Cursor, name: str) -> int:
+    """
+    Возвращает id имени процесса, добавляя имя в process_names при первой встрече
+
+    :param cursor: Курсор соединения для записи (monitor_db.writing)
+    :param name: Имя процесса
+    :return:
+        id из process_names
+    """
+    name_id = _process_name_ids.get(name)
+    if name_id is None:
+        cursor.execute('INSERT OR IGNORE INTO process_names (name) VALUES (?)', (name,))
+        cursor.execute('SELECT id FROM process_names WHERE name = ?', (name,))
+        name_id = _process_name_ids[name] = cursor.fetchone()[0]
+    return name_id
+
+def get_top_processes(k: int = TOP_PROCESSES) -> list[tuple[str, int, int, int]]:
+    """
+    Процессы-лидеры по CPU и по RAM на текущий момент (объединение двух топов)
+
+    CPU процесса считается от прошлого вызова (psutil запоминает процессы между
+    вызовами process_iter), поэтому на первом замере он равен нулю.
+
+    :param k: Сколько лидеров брать по каждому ресурсу
+    :return:
+        [(имя, pid, CPU в десятых долях %, RSS в МБ), ...]
+    """
+    cpu_count = psutil.cpu_count() or 1
+    processes = []
+    for proc in psutil.process_iter(['name', 'cpu_percent', 'memory_info']):
+        info = proc.info
+        if not info['name'] or info['memory_info'] is None:
+            continue  # Нет доступа к процессу
+        cpu = round((info['cpu_percent'] or 0.0) / cpu_count * 10)
+        processes.append((info['name'], proc.pid, cpu, info['memory_info'].rss >> 20))
+
+    top = {row[1]: row for row in heapq.nlargest(k, processes, key=lambda row: row[2])}
+    top.update((row[1], row) for row in heapq.nlargest(k, processes, key=lambda row: row[3]))
+    return list(top.values())
 
 def insert_utilization() -> None:
     """
@@ -44,10 +240,76 @@ def insert_utilization() -> None:
     :return:
         None
     """
-    cursor.execute('''
-    INSERT INTO CPUmonitor (timestamp, cpu_utilization, gpu_utilization, vram_utilization, ram_utilization)
-    VALUES (?, ?, ?, ?, ?)''',
-                   (datetime.datetime.now(), get_cpu_utilization(), get_gpu_utilization().gpu, get_gpu_utilization().memory, get_ram_utilization()[2]))
+    # Замер (секунда на CPU и обход процессов) - до захвата соединения для записи
+    gpu = get_gpu_utilization()
+    sample = (datetime.datetime.now(), get_cpu_utilization(), gpu.gpu, gpu.memory, get_ram_utilization()[2])
+    processes = get_top_processes()
+    with monitor_db.writing() as cursor:
+        cursor.execute('''
+        INSERT INTO CPUmonitor (timestamp, cpu_utilization, gpu_utilization, vram_utilization, ram_utilization)
+        VALUES (?, ?, ?, ?, ?)''', sample)
+        sample_id = cursor.lastrowid
+        cursor.executemany('''
+        INSERT OR IGNORE INTO process_usage (sample_id, name_id, pid, cpu, ram_mb) VALUES (?, ?, ?, ?, ?)''',
+                           [(sample_id, intern_process_name(cursor, name), pid, cpu, ram_mb)
+                            for name, pid, cpu, ram_mb in processes])
+
+def purge_old_writes(days: int = RETENTION_DAYS) -> None:
+    """
+    Удаляет записи старше days дней из обеих таблиц и имена процессов, на которые
+    больше нет ссылок
+
+    :param days: Срок хранения в днях
+    :return:
+        None
+    """
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=days)
+    with monitor_db.writing() as cursor:
+        cursor.execute('SELECT rowid FROM CPUmonitor WHERE timestamp >= ? ORDER BY timestamp LIMIT 1', (cutoff,))
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute('SELECT MAX(rowid) + 1 FROM CPUmonitor')
+            row = cursor.fetchone()
+        first_kept = row[0] or 0
+        cursor.execute('DELETE FROM process_usage WHERE sample_id < ?', (first_kept,))
+        cursor.execute('DELETE FROM CPUmonitor WHERE timestamp < ?', (cutoff,))
+        cursor.execute('DELETE FROM process_names WHERE id NOT IN (SELECT DISTINCT name_id FROM process_usage)')
+        _process_name_ids.clear()
+
+def get_top_consumers(start: datetime.datetime, end: datetime.datetime, n: int = 10,
+                      by: str = 'cpu') -> list[tuple[str, float, float, int, int]]:
+    """
+    Главные потребители ресурсов за интервал, например с 02:50 до 03:10
+
+    Границы интервала ищутся по индексу timestamp, строки процессов читаются
+    непрерывным диапазоном по номеру замера - без просмотра всей таблицы.
+
+    :param start: Начало интервала
+    :param end: Конец интервала
+    :param n: Количество процессов
+    :param by: 'cpu' - по средней загрузке CPU, 'ram' - по пиковой памяти
+    :return:
+        [(имя, средний CPU % за интервал, пиковый CPU %, пиковая RAM в МБ, число замеров в топе), ...]
+    """
+    with monitor_db.reading() as cursor:
+        cursor.execute('SELECT rowid FROM CPUmonitor WHERE timestamp >= ? ORDER BY timestamp LIMIT 1', (start,))
+        first = cursor.fetchone()
+        cursor.execute('SELECT rowid FROM CPUmonitor WHERE timestamp <= ? ORDER BY timestamp DESC LIMIT 1', (end,))
+        last = cursor.fetchone()
+        if first is None or last is None or first[0] > last[0]:
+            return []
+        samples = last[0] - first[0] + 1
+
+        # Процесс вне топа считается неактивным, поэтому среднее - сумма, деленная на все замеры интервала
+        order = 'SUM(p.cpu)' if by == 'cpu' else 'MAX(p.ram_mb)'
+        cursor.execute(f'''
+        SELECT n.name, SUM(p.cpu) / 10.0 / ?, MAX(p.cpu) / 10.0, MAX(p.ram_mb), COUNT(*)
+        FROM process_usage p JOIN process_names n ON n.id = p.name_id
+        WHERE p.sample_id BETWEEN ? AND ?
+        GROUP BY p.name_id
+        ORDER BY {order} DESC
+        LIMIT ?''', (samples, first[0], last[0], n))
+        return cursor.fetchall()
 
 def get_n_writes(n:int=5) -> list[Any] | None:
     """
@@ -59,16 +321,88 @@ def get_n_writes(n:int=5) -> list[Any] | None:
         Либо None
     """
     try:
-        cursor.execute(f'''SELECT * FROM CPUmonitor ORDER BY timestamp DESC LIMIT ?''', (n,))
-        result = cursor.fetchall()
+        with monitor_db.reading() as cursor:
+            cursor.execute('''SELECT * FROM CPUmonitor ORDER BY timestamp DESC LIMIT ?''', (n,))
+            result = cursor.fetchall()
         result.reverse()
         return result
     except Exception as e:
         print(e)
 
-def make_plot(writes_amount:int=5, smoothing:bool=True) -> tuple[Figure, Any]:
+def get_columns(n: int = 5) -> SampleColumns:
+    """
+    Последние n записей колонками, как их принимает charts.py
+
+    :param n: Количество записей
+    :return:
+        SampleColumns: время и загрузка CPU, GPU, RAM, VRAM
+    """
+    rows = get_n_writes(n) or []
+    if not rows:
+        return SampleColumns.empty()
+    times, cpu, gpu, vram, ram = zip(*rows)
+    return SampleColumns(np.array(times, 'datetime64[us]'), np.array([cpu, gpu, ram, vram], np.float32))
+
+def columns_from_rows(rows: list[tuple[float, float, Any, float, Any]]) -> SampleColumns:
+    """
+    Колонки из замеров в памяти (например, фонового замера бота) без обращения к базе
+
+    :param rows: [(время Unix в секундах, CPU %, GPU % или None, RAM %, VRAM % или None), ...]
+    :return:
+        SampleColumns; отсутствующие значения - NaN
+    """
+    if not rows:
+        return SampleColumns.empty()
+    table = np.array(rows, np.float64)  # None становится NaN
+    times = (table[:, 0] * 1e6).astype('datetime64[us]')
+    return SampleColumns(times, table[:, 1:].T.astype(np.float32))
+
+# Текстовые графики: строки колонок SampleColumns и дробные доли полосы
+TEXT_SERIES = ('CPU', 'GPU', 'RAM', 'VRAM')
+BAR_EIGHTHS = ' ▏▎▍▌▋▊▉'
+
+def bar(value: float, width: int = 10) -> str:
+    """
+    Горизонтальная полоса для значения 0..100 с точностью до восьмой доли символа
+
+    :param value: Значение в процентах
+    :param width: Длина полосы в символах
+    :return:
+        Строка длиной width
+    """
+    eighths = round(min(max(value, 0.0), 100.0) / 100.0 * width * 8)
+    full, part = divmod(eighths, 8)
+    return ('█' * full + (BAR_EIGHTHS[part] if part else '')).ljust(width)
+
+def render_text(columns: SampleColumns, width: int = 28) -> str:
+    """
+    Текстовый график загрузки: для каждого ресурса строка с текущим значением,
+    полосой, средним и пиком и строка спарклайна шириной width
+
+    Ресурсы без замеров (нет GPU) пропускаются. Для моноширинного шрифта.
+
+    :param columns: Замеры колонками
+    :param width: Ширина спарклайна в символах
+    :return:
+        Строки текста через перевод строки; пустая строка, если замеров нет
+    """
+    if not len(columns.times):
+        return ''
+    points = downsample(columns.values, width)
+    lines = []
+    for name, series, line in zip(TEXT_SERIES, columns.values, points):
+        present = series[~np.isnan(series)]
+        if not len(present):
+            continue
+        latest = float(present[-1])
+        lines.append(f'{name:<4} {latest:3.0f}% ▕{bar(latest)}▏ ср {present.mean():.0f} пик {present.max():.0f}')
+        lines.append(f'     {sparkline(line)}')
+    return '\n'.join(lines)
+
+def make_plot(writes_amount:int=5, smoothing:bool=True) -> tuple['Figure', Any]:
     """
     Создает плот с 4 графиками использования ресурсов пк, данные берет из бд.
+    Бот рисует тот же плот в пуле процессов charts.ChartPool.
 
     :param writes_amount:
         Параметр n передающийся в get_n_writes(), количество последних записей по которым будет построен плот.
@@ -76,60 +410,45 @@ def make_plot(writes_amount:int=5, smoothing:bool=True) -> tuple[Figure, Any]:
     :return:
         Кортеж объектов Figure и массив Axes Matplotlib.
     """
-    timelist = []
-    cpu_util_list = []
-    gpu_util_list = []
-    ram_util_list = []
-    vram_util_list = []
-    for row in get_n_writes(writes_amount):
-        timelist.append(row[0])
-        cpu_util_list.append(row[1])
-        gpu_util_list.append(row[2])
-        vram_util_list.append(row[3])
-        ram_util_list.append(row[4])
-    # Сглаживание
-    if smoothing:
-        window_size = 10
-        cpu_series = pd.Series(cpu_util_list)
-        gpu_series = pd.Series(gpu_util_list)
-        ram_series = pd.Series(ram_util_list)
-        vram_series = pd.Series(vram_util_list)
-
-        cpu_util_list = cpu_series.rolling(window=window_size).mean()
-        gpu_util_list = gpu_series.rolling(window=window_size).mean()
-        ram_util_list = ram_series.rolling(window=window_size).mean()
-        vram_util_list = vram_series.rolling(window=window_size).mean()
+    # pyplot загружается только здесь: боту, читающему базу, он не нужен
+    import matplotlib.pyplot as plt
 
-    fig, axes = plt.subplots(nrows=2, ncols=2, figsize=(12, 8))
     plt.style.use('seaborn-v0_8-whitegrid')
-
-    ax1 = axes[0, 0]
-    ax1.plot(timelist, cpu_util_list, color='blue')
-    ax1.set_title('CPU Utilization')  # Вместо легенды используем заголовок
-    ax1.set_ylabel('Нагрузка, %')
-    ax1.set_ylim(0, 100)
-
-    # График 2: GPU Utilization (верхний правый)
-    ax2 = axes[0, 1]
-    ax2.plot(timelist, gpu_util_list, color='orange')
-    ax2.set_title('GPU Utilization')
-    ax2.set_ylim(0, 100)
-
-    # График 3: RAM Utilization (нижний левый)
-    ax3 = axes[1, 0]
-    ax3.plot(timelist, ram_util_list, color='green')
-    ax3.set_title('RAM Utilization')
-    ax3.set_ylabel('Нагрузка, %')
-    ax3.set_xlabel('Время')
-    ax3.set_ylim(0, 100)
-
-    # График 4: VRAM Utilization (нижний правый)
-    ax4 = axes[1, 1]
-    ax4.plot(timelist, vram_util_list, color='red')
-    ax4.set_title('VRAM Utilization')
-    ax4.set_xlabel('Время')
-    ax4.set_ylim(0, 100)
+    fig, axes = plt.subplots(nrows=2, ncols=2, figsize=(12, 8))
+    draw_utilization(axes, get_columns(writes_amount), smoothing)
     plt.tight_layout()
     return fig, axes
 
-print(get_n_writes(5))
\ No newline at end of file
+def parse_time(value: str, now: datetime.datetime | None = None) -> datetime.datetime:
+    """
+    Разбирает время вида "02:50" (ближайшее прошедшее) или "2024-05-01 02:50"
+
+    :param value: Строка времени
+    :param now: Текущий момент (для проверки)
+    :return:
+        datetime.datetime
+    """
+    now = now or datetime.datetime.now()
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        moment = datetime.datetime.combine(now.date(), datetime.time.fromisoformat(value))
+        return moment - datetime.timedelta(days=1) if moment > now else moment
+
+if __name__ == '__main__':
+    # python cpumonitor.py top 02:50 03:10 - лидеры за интервал, без аргументов - запись замеров раз в минуту
+    if len(sys.argv) == 4 and sys.argv[1] == 'top':
+        start, end = parse_time(sys.argv[2]), parse_time(sys.argv[3])
+        if end < start:
+            start -= datetime.timedelta(days=1)
+        for name, avg_cpu, peak_cpu, peak_ram, in_top in get_top_consumers(start, end):
+            print(f'{name:<30} CPU {avg_cpu:5.1f}% (пик {peak_cpu:5.1f}%)  RAM до {peak_ram} МБ  в топе {in_top} раз')
+    else:
+        print(get_n_writes(5))
+        last_purge = 0.0
+        while True:
+            insert_utilization()
+            if time.monotonic() - last_purge > 3600:
+                purge_old_writes()
+                last_purge = time.monotonic()
+            time.sleep(59)
\ No newline at end of file
@@ -0,0 +1,293 @@
+"""
+Просмотр файлов компьютера и их передача в Telegram частями
+
+Файл читается блоками по chunk_size и отправляется частями не больше
+part_size (ограничение Telegram на загрузку ботом - 50 МБ), так что в памяти
+одновременно находится не больше одной-двух частей, а не весь файл. Сжимаемые
+файлы по пути упаковываются в gzip: каждая часть - отдельный gzip-блок,
+поэтому склеенные части (copy /b, cat или 7-Zip по файлу .001) - обычный .gz.
+Состояние передачи сохраняется после каждой части, и прерванную передачу
+можно продолжить с первой неотправленной части, в том числе после перезапуска.
+"""
+
+import asyncio
+import json
+import os
+import secrets
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+# Форматы, которые уже сжаты: повторное сжатие только тратит время
+COMPRESSED_EXTENSIONS = frozenset({
+    ".7z", ".zip", ".rar", ".gz", ".tgz", ".bz2", ".xz", ".zst", ".cab", ".jar", ".apk",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".avif",
+    ".mp3", ".aac", ".ogg", ".opus", ".flac", ".m4a",
+    ".mp4", ".mkv", ".avi", ".mov", ".webm", ".wmv",
+    ".docx", ".xlsx", ".pptx", ".odt", ".pdf", ".msi",
+})
+
+KB = 1024
+MB = 1024 ** 2
+GB = 1024 ** 3
+
+
+def format_size(size: int) -> str:
+    for unit, name in ((GB, "GB"), (MB, "MB"), (KB, "KB")):
+        if size >= unit:
+            return f"{size / unit:.1f}{name}"
+    return f"{size}B"
+
+
+class FileEntry(NamedTuple):
+    """Элемент каталога"""
+    name: str
+    path: str
+    is_dir: bool
+    size: int
+    mtime: float
+
+
+class DirectoryListing(NamedTuple):
+    """Содержимое каталога; parent - None для корневых каталогов"""
+    path: str
+    parent: Optional[str]
+    entries: List[FileEntry]
+    mtime: float
+
+
+class FileBrowser:
+    """
+    Просмотр файлов внутри разрешенных корневых каталогов
+
+    Содержимое каталога кэшируется (LRU на cache_size каталогов) и читается
+    заново, только если изменилось время модификации каталога, поэтому
+    листание и возврат к уже открытым каталогам не обходят диск.
+    """
+
+    def __init__(self, roots: Sequence[str], cache_size: int = 64):
+        self.roots = [os.path.realpath(root) for root in roots if root]
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, DirectoryListing]" = OrderedDict()
+
+    def resolve(self, path: str) -> str:
+        """Абсолютный путь; PermissionError, если он вне корневых каталогов"""
+        real = os.path.realpath(path)
+        for root in self.roots:
+            try:
+                if os.path.commonpath([root, real]) == root:
+                    return real
+            except ValueError:
+                continue  # Разные диски Windows
+        raise PermissionError(f"Путь {path} вне разрешенных каталогов")
+
+    def root_entries(self) -> List[FileEntry]:
+        return [FileEntry(root, root, True, 0, 0.0) for root in self.roots]
+
+    def list(self, path: str) -> DirectoryListing:
+        path = self.resolve(path)
+        mtime = os.stat(path).st_mtime
+        listing = self._cache.get(path)
+        if listing is not None and listing.mtime == mtime:
+            self._cache.move_to_end(path)
+            return listing
+
+        entries = []
+        with os.scandir(path) as iterator:
+            for item in iterator:
+                try:
+                    # На Windows scandir уже знает размер и время, stat не обращается к диску
+                    is_dir = item.is_dir()
+                    stat = item.stat()
+                except OSError:
+                    continue
+                entries.append(FileEntry(item.name, item.path, is_dir, 0 if is_dir else stat.st_size, stat.st_mtime))
+        entries.sort(key=lambda entry: (not entry.is_dir, entry.name.casefold()))
+
+        parent = None if path in self.roots else os.path.dirname(path)
+        listing = DirectoryListing(path, parent, entries, mtime)
+        self._cache[path] = listing
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return listing
+
+
+def should_compress(path: str, sample_size: int = 256 * KB, threshold: float = 0.9) -> bool:
+    """Стоит ли сжимать файл: не сжатый формат и пробный блок сжимается заметно"""
+    if os.path.splitext(path)[1].lower() in COMPRESSED_EXTENSIONS:
+        return False
+    with open(path, "rb") as f:
+        sample = f.read(sample_size)
+    if len(sample) < KB:
+        return False
+    return len(zlib.compress(sample, 1)) < len(sample) * threshold
+
+
+class Transfer(NamedTuple):
+    """Состояние передачи файла"""
+    id: str
+    path: str
+    size: int
+    mtime: float
+    compress: bool
+    part_size: int
+    offset: int = 0      # позиция в исходном файле, с которой начнется следующая часть
+    part: int = 1        # номер следующей части
+    user_id: int = 0     # кто начал передачу: продолжить ее может только он
+
+    @property
+    def done(self) -> bool:
+        return self.offset >= self.size and self.part > 1
+
+    def part_name(self, part: int, single: bool) -> str:
+        name = os.path.basename(self.path) + (".gz" if self.compress else "")
+        return name if single else f"{name}.{part:03d}"
+
+    def join_hint(self) -> str:
+        """Команда склейки частей в исходный (или .gz) файл"""
+        return (f"copy /b {self.part_name(1, False)}+{self.part_name(2, False)}+... "
+                f"{self.part_name(1, True)}")
+
+    def progress(self) -> str:
+        percent = self.offset / self.size * 100 if self.size else 100.0
+        return f"{format_size(self.offset)} / {format_size(self.size)} ({percent:.0f}%)"
+
+
+def read_part(path: str, offset: int, part_size: int, compress: bool,
+              chunk_size: int = MB) -> Tuple[bytes, int]:
+    """
+    Читает часть файла, начиная с offset
+
+    Returns:
+        Tuple[bytes, int]: (данные части, позиция начала следующей части)
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        if not compress:
+            # Одно чтение сразу в итоговый объект bytes, без промежуточных копий
+            data = f.read(part_size)
+            return data, offset + len(data)
+
+        # Отдельный gzip-блок на часть; запас на блок, который упаковщик еще держит в буфере
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        chunk_size = min(chunk_size, part_size // 4)
+        pieces = []
+        size = 0
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            piece = compressor.compress(chunk)
+            pieces.append(piece)
+            size += len(piece)
+            offset += len(chunk)
+            if size + chunk_size + 64 * KB > part_size:
+                break
+        pieces.append(compressor.flush())
+        return b"".join(pieces), offset
+
+
+class TransferStore:
+    """
+    Незавершенные передачи в JSON файле, чтобы продолжить их после перезапуска бота
+
+    Методы работают с диском, поэтому из цикла событий вызываются через
+    asyncio.to_thread; одновременные передачи разделяет блокировка.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._transfers: Optional[Dict[str, Transfer]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Transfer]:
+        if self._transfers is None:
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self._transfers = {item["id"]: Transfer(**item) for item in json.load(f)}
+            except (OSError, ValueError, TypeError, KeyError):
+                self._transfers = {}
+        return self._transfers
+
+    def _save(self) -> None:
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump([transfer._asdict() for transfer in self._load().values()], f, ensure_ascii=False)
+        os.replace(temporary, self.path)
+
+    def create(self, path: str, part_size: int, user_id: int = 0) -> Transfer:
+        """Новая передача; пустой файл отклоняется - Telegram не принимает документы без данных"""
+        stat = os.stat(path)
+        if stat.st_size == 0:
+            raise ValueError(f"Файл {path} пуст")
+        transfer = Transfer(secrets.token_hex(4), path, stat.st_size, stat.st_mtime,
+                            should_compress(path), part_size, user_id=user_id)
+        self.put(transfer)
+        return transfer
+
+    def get(self, transfer_id: str, user_id: Optional[int] = None) -> Optional[Transfer]:
+        """Передача по id; с user_id - только если ее начал этот пользователь"""
+        with self._lock:
+            transfer = self._load().get(transfer_id)
+        if transfer is None or (user_id is not None and transfer.user_id != user_id):
+            return None
+        return transfer
+
+    def all(self, user_id: Optional[int] = None) -> List[Transfer]:
+        with self._lock:
+            transfers = list(self._load().values())
+        return [t for t in transfers if user_id is None or t.user_id == user_id]
+
+    def put(self, transfer: Transfer) -> None:
+        with self._lock:
+            self._load()[transfer.id] = transfer
+            self._save()
+
+    def remove(self, transfer_id: str) -> None:
+        with self._lock:
+            if self._load().pop(transfer_id, None) is not None:
+                self._save()
+
+
+def check_unchanged(transfer: Transfer) -> bool:
+    """Файл не менялся с начала передачи - продолжать с сохраненной позиции безопасно"""
+    try:
+        stat = os.stat(transfer.path)
+    except OSError:
+        return False
+    return stat.st_size == transfer.size and stat.st_mtime == transfer.mtime
+
+
+async def run_transfer(transfer: Transfer, store: TransferStore,
+                       send: Callable[[bytes, str, Transfer], Awaitable[None]]) -> Transfer:
+    """
+    Отправляет оставшиеся части передачи через send(данные, имя файла, передача)
+
+    Следующая часть читается и сжимается в потоке, пока текущая отправляется,
+    поэтому диск и сжатие не простаивают во время загрузки в Telegram.
+    Если send завершится ошибкой, в store останется позиция первой
+    неотправленной части. Пустой файл отправить нельзя - ValueError.
+    """
+    if transfer.size == 0:
+        raise ValueError(f"Файл {transfer.path} пуст")
+
+    def read(offset: int) -> "asyncio.Task[Tuple[bytes, int]]":
+        return asyncio.create_task(asyncio.to_thread(
+            read_part, transfer.path, offset, transfer.part_size, transfer.compress))
+
+    next_read = read(transfer.offset)
+    try:
+        while not transfer.done:
+            data, next_offset = await next_read
+            # Первая часть, после которой файл кончился, отправляется без номера в имени
+            single = transfer.part == 1 and next_offset >= transfer.size
+            if next_offset < transfer.size:
+                next_read = read(next_offset)
+            await send(data, transfer.part_name(transfer.part, single), transfer)
+            transfer = transfer._replace(offset=next_offset, part=transfer.part + 1)
+            await asyncio.to_thread(store.put, transfer)
+    finally:
+        next_read.cancel()
+    await asyncio.to_thread(store.remove, transfer.id)
+    return transfer
@@ -0,0 +1,153 @@
+"""
+Минимальный асинхронный HTTP/1.1 сервер для служебных эндпоинтов бота
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_HEADER_SIZE = 16 * 1024
+MAX_BODY_SIZE = 16 * 1024 * 1024
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class HttpRequest(NamedTuple):
+    method: str
+    path: str
+    query: str
+    headers: Dict[str, str]
+    body: bytes
+
+
+class HttpResponse(NamedTuple):
+    status: int = 200
+    body: bytes = b""
+    content_type: str = "text/plain; charset=utf-8"
+
+
+Handler = Callable[[HttpRequest], Awaitable[HttpResponse]]
+
+
+class HttpServer:
+    """
+    HTTP сервер на asyncio.start_server
+
+    Поддерживает только то, что нужно боту: маршруты по методу и пути,
+    тело с Content-Length и keep-alive соединения.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self._routes: Dict[Tuple[str, str], Handler] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set[asyncio.StreamWriter] = set()
+
+    def route(self, method: str, path: str, handler: Handler) -> None:
+        """Регистрирует обработчик для метода и пути"""
+        self._routes[(method.upper(), path)] = handler
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        # Если порт был 0, узнаем выданный системой
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"HTTP сервер слушает {self.host}:{self.port}")
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # Закрываем простаивающие keep-alive соединения, иначе wait_closed их дождется
+            for writer in list(self._connections):
+                writer.close()
+            while self._connections:
+                await asyncio.sleep(0.01)
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections.add(writer)
+        try:
+            while True:
+                request, error = await self._read_request(reader)
+                if request is None and error is None:
+                    break  # Клиент закрыл соединение
+
+                keep_alive = request is not None and request.headers.get("connection", "").lower() != "close"
+                if error is not None:
+                    response = HttpResponse(error, REASONS[error].encode())
+                    keep_alive = False
+                else:
+                    response = await self._dispatch(request)
+
+                self._write_response(writer, response, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Tuple[Optional[HttpRequest], Optional[int]]:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            return None, None
+        except asyncio.LimitOverrunError:
+            return None, 413
+        if len(head) > MAX_HEADER_SIZE:
+            return None, 413
+
+        try:
+            request_line, *header_lines = head.decode("latin-1").split("\r\n")
+            method, target, _ = request_line.split(" ", 2)
+            headers = {}
+            for line in header_lines:
+                if line:
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            return None, 400
+
+        if length > MAX_BODY_SIZE:
+            return None, 413
+        body = await reader.readexactly(length) if length else b""
+
+        path, _, query = target.partition("?")
+        return HttpRequest(method.upper(), path, query, headers, body), None
+
+    async def _dispatch(self, request: HttpRequest) -> HttpResponse:
+        handler = self._routes.get((request.method, request.path))
+        if handler is None:
+            known_path = any(path == request.path for _, path in self._routes)
+            status = 405 if known_path else 404
+            return HttpResponse(status, REASONS[status].encode())
+        try:
+            return await handler(request)
+        except Exception as e:
+            logger.error(f"Ошибка обработки {request.method} {request.path}: {e}")
+            return HttpResponse(500, REASONS[500].encode())
+
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, response: HttpResponse, keep_alive: bool) -> None:
+        head = (
+            f"HTTP/1.1 {response.status} {REASONS.get(response.status, '')}\r\n"
+            f"Content-Type: {response.content_type}\r\n"
+            f"Content-Length: {len(response.body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            "\r\n"
+        )
+        writer.write(head.encode("latin-1") + response.body)
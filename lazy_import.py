@@ -0,0 +1,126 @@
+"""
+Отложенная загрузка платформенных модулей и отчет о времени импортов при запуске
+"""
+
+import builtins
+import importlib
+import logging
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ImportProfiler:
+    """
+    Замер времени импортов
+
+        with import_profiler:
+            import telegram
+
+    Внутри блока записывается время каждого импорта верхнего уровня, то есть
+    вместе со всеми модулями, которые он потянул за собой. Уже загруженные
+    модули не учитываются. Отложенные импорты (LazyObject) добавляются в тот же
+    отчет через record.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.imports: Dict[str, float] = {}
+        self._original = None
+        self._depth = 0
+
+    def __enter__(self) -> "ImportProfiler":
+        self._original = builtins.__import__
+        builtins.__import__ = self._import
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        builtins.__import__ = self._original
+        self._original = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if self._depth or level or name in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+
+        self._depth += 1
+        started = time.perf_counter()
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            self._depth -= 1
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name: str, seconds: float) -> None:
+        self.imports[name] = self.imports.get(name, 0.0) + seconds
+
+    def slowest(self, limit: int = 10) -> List[Tuple[str, float]]:
+        return sorted(self.imports.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    def report(self, limit: int = 10) -> str:
+        """Строка для лога: время с начала запуска и самые долгие импорты"""
+        elapsed = time.perf_counter() - self.started
+        imports = ", ".join(f"{name} {seconds * 1000:.0f} мс" for name, seconds in self.slowest(limit))
+        return f"Запуск занял {elapsed:.2f} с; импорты: {imports or 'нет'}"
+
+
+import_profiler = ImportProfiler()
+
+
+class LazyObject:
+    """
+    Атрибут модуля, загружаемого при первом обращении
+
+        WindowsScreenshot = LazyObject("screenshot_controller", "WindowsScreenshot", StubScreenshot)
+
+    Модуль импортируется при первом обращении к атрибуту или вызове, время
+    импорта попадает в отчет import_profiler и в метрики (import:<модуль>).
+    Если модуль не загружается (не Windows, нет зависимостей), используется
+    fallback, а причина пишется в лог один раз.
+    """
+
+    def __init__(self, module: str, attribute: str, fallback: Any = None):
+        self._module = module
+        self._attribute = attribute
+        self._fallback = fallback
+        self._target: Optional[Any] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._target is not None
+
+    def resolve(self) -> Any:
+        if self._target is not None:
+            return self._target
+
+        # Импорт может начаться одновременно в потоке обработчика и в цикле событий
+        with self._lock:
+            if self._target is None:
+                started = time.perf_counter()
+                try:
+                    target = getattr(importlib.import_module(self._module), self._attribute)
+                except ImportError as e:
+                    if self._fallback is None:
+                        raise
+                    logger.warning(f"Модуль {self._module} недоступен ({e}), используется заглушка")
+                    target = self._fallback
+                seconds = time.perf_counter() - started
+                import_profiler.record(self._module, seconds)
+
+                from metrics import operation_seconds
+                operation_seconds.observe(seconds, operation=f"import:{self._module}")
+                self._target = target
+        return self._target
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.resolve(), name)
+
+    def __call__(self, *args, **kwargs) -> Any:
+        return self.resolve()(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        state = "загружен" if self.loaded else "не загружен"
+        return f"<LazyObject {self._module}.{self._attribute} ({state})>"
@@ -0,0 +1,220 @@
+"""
+Живая панель /live: одно закрепленное сообщение с загрузкой системы, обновляемое на месте
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import psutil
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import TelegramError
+
+from charts import downsample, sparkline
+from metrics import track
+from rate_limiter import PRIORITY_LOW
+from system_info import ResourceSample, ResourceSampler
+
+logger = logging.getLogger(__name__)
+
+STOP_CALLBACK = "live_stop"
+
+
+class ProcessTop:
+    """
+    Самые загруженные процессы
+
+    psutil.Process.cpu_percent считает загрузку от прошлого вызова на том же
+    объекте, поэтому объекты процессов хранятся между замерами; процесс,
+    впервые попавший в замер, получает загрузку со следующего раза.
+
+    Один объект обслуживает панели всех чатов из пула потоков, поэтому замер
+    идет под блокировкой. Панель, обновившаяся вскоре после другой (раньше
+    min_interval секунд), получает тот же результат: замер за долю секунды
+    дал бы почти нулевую загрузку.
+    """
+
+    def __init__(self, min_interval: float = 2.0):
+        self.min_interval = min_interval
+        self._processes: Dict[int, psutil.Process] = {}
+        self._lock = threading.Lock()
+        self._last: Tuple[float, List[Tuple[str, float, float]]] = (float("-inf"), [])
+
+    def top(self, limit: int = 5) -> List[Tuple[str, float, float]]:
+        """Список (имя, CPU %, RAM %) по убыванию CPU"""
+        with self._lock:
+            measured_at, rows = self._last
+            if time.monotonic() - measured_at >= self.min_interval:
+                rows = self._measure()
+                self._last = (time.monotonic(), rows)
+        return rows[:limit]
+
+    def _measure(self) -> List[Tuple[str, float, float]]:
+        seen = {}
+        rows = []
+        for proc in psutil.process_iter(['name', 'create_time']):
+            cached = self._processes.get(proc.pid)
+            # Тот же pid у нового процесса - начинаем отсчет заново
+            if cached is not None and cached.info.get('create_time') == proc.info.get('create_time'):
+                cached.info = proc.info
+                proc = cached
+            seen[proc.pid] = proc
+            try:
+                cpu = proc.cpu_percent(interval=None)
+                if cpu > 0:
+                    rows.append((proc.info.get('name') or proc.name(), cpu, proc.memory_percent()))
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                continue
+        self._processes = seen
+
+        # Нормируем на число ядер, как в диспетчере задач
+        cores = psutil.cpu_count() or 1
+        rows.sort(key=lambda row: row[1], reverse=True)
+        return [(name, cpu / cores, ram) for name, cpu, ram in rows]
+
+
+class LiveSession:
+    """Состояние панели в одном чате"""
+
+    def __init__(self, chat_id: int, message_id: int):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.text = ""
+        self.last_activity = time.monotonic()
+        self.task: Optional[asyncio.Task] = None
+
+
+class LiveDashboard:
+    """
+    Живые панели по чатам
+
+    Данные берутся из кэша замеров ResourceSampler, а не запрашиваются заново,
+    список процессов обновляется раз в interval. Сообщение правится, только если
+    текст изменился, с низким приоритетом в планировщике исходящих запросов.
+    Панель останавливается сама, если в чате idle_timeout секунд не было
+    действий пользователя.
+    """
+
+    def __init__(self, sampler: ResourceSampler, interval: float = 10.0, idle_timeout: float = 600.0,
+                 window: float = 300.0, width: int = 30, top_limit: int = 5):
+        self.sampler = sampler
+        self.interval = interval
+        self.idle_timeout = idle_timeout
+        self.window = window
+        self.width = width
+        self.top_limit = top_limit
+        self._sessions: Dict[int, LiveSession] = {}
+        self._top = ProcessTop()
+
+    def is_running(self, chat_id: int) -> bool:
+        return chat_id in self._sessions
+
+    def touch(self, chat_id: int) -> None:
+        """Отмечает действие пользователя в чате (продлевает работу панели)"""
+        session = self._sessions.get(chat_id)
+        if session is not None:
+            session.last_activity = time.monotonic()
+
+    async def start(self, bot: Bot, chat_id: int) -> None:
+        """Отправляет и закрепляет сообщение панели; старая панель в чате останавливается"""
+        await self.stop(bot, chat_id)
+        self.sampler.start()
+
+        text = await asyncio.to_thread(self.render)
+        message = await bot.send_message(chat_id, text, reply_markup=self._keyboard())
+        session = LiveSession(chat_id, message.message_id)
+        session.text = text
+        self._sessions[chat_id] = session
+
+        try:
+            await bot.pin_chat_message(chat_id, message.message_id, disable_notification=True)
+        except TelegramError as e:
+            logger.warning(f"Не удалось закрепить панель: {e}")
+
+        session.task = asyncio.create_task(self._run(bot, session))
+
+    async def stop(self, bot: Bot, chat_id: int, reason: str = "остановлена") -> bool:
+        """Останавливает панель в чате; False - панель не была запущена"""
+        session = self._sessions.pop(chat_id, None)
+        if session is None:
+            return False
+
+        if session.task is not None and session.task is not asyncio.current_task():
+            session.task.cancel()
+        try:
+            await bot.edit_message_text(f"{session.text}\n\n⏹ Панель {reason}", chat_id, session.message_id)
+            await bot.unpin_chat_message(chat_id, session.message_id)
+        except TelegramError as e:
+            logger.warning(f"Не удалось завершить панель: {e}")
+        return True
+
+    async def stop_all(self, bot: Bot) -> None:
+        for chat_id in list(self._sessions):
+            await self.stop(bot, chat_id)
+
+    async def _run(self, bot: Bot, session: LiveSession) -> None:
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                if time.monotonic() - session.last_activity > self.idle_timeout:
+                    await self.stop(bot, session.chat_id, "остановлена из-за бездействия")
+                    return
+                await self._update(bot, session)
+        finally:
+            # Задача завершилась не через stop - чат не должен считаться занятым замершей панелью
+            if self._sessions.get(session.chat_id) is session:
+                del self._sessions[session.chat_id]
+
+    async def _update(self, bot: Bot, session: LiveSession) -> None:
+        """Одно обновление панели; ошибка пропускает обновление, но не останавливает панель"""
+        try:
+            with track("live_dashboard_update"):
+                text = await asyncio.to_thread(self.render)
+                if text == session.text:
+                    return
+                await bot.edit_message_text(
+                    text, session.chat_id, session.message_id,
+                    reply_markup=self._keyboard(), rate_limit_args=PRIORITY_LOW,
+                )
+                session.text = text
+        except TelegramError as e:
+            logger.warning(f"Ошибка обновления панели: {e}")
+        except Exception:
+            logger.exception("Ошибка подготовки живой панели")
+
+    @staticmethod
+    def _keyboard() -> InlineKeyboardMarkup:
+        return InlineKeyboardMarkup([[InlineKeyboardButton("⏹ Остановить", callback_data=STOP_CALLBACK)]])
+
+    def _sparkline(self, values: List[float]) -> str:
+        return sparkline(downsample(np.array(values, np.float64), self.width))
+
+    def render(self) -> str:
+        """Текст панели из последних замеров"""
+        horizon = time.time() - self.window
+        samples = [sample for sample in list(self.sampler.samples) if sample.timestamp >= horizon]
+        if not samples:
+            return "📈 Живая панель\n\nСобираю первые замеры..."
+
+        latest: ResourceSample = samples[-1]
+        lines = [
+            "📈 Живая панель",
+            "",
+            f"CPU {latest.cpu:3.0f}%  {self._sparkline([s.cpu for s in samples])}",
+            f"RAM {latest.ram:3.0f}%  {self._sparkline([s.ram for s in samples])}",
+        ]
+        gpu = [s.gpu for s in samples if s.gpu is not None]
+        if gpu:
+            lines.append(f"GPU {gpu[-1]:3.0f}%  {self._sparkline(gpu)}")
+
+        top = self._top.top(self.top_limit)
+        if top:
+            lines += ["", "🔥 Процессы:"]
+            lines += [f"{name[:24]} - CPU {cpu:.0f}%, RAM {ram:.1f}%" for name, cpu, ram in top]
+
+        # Без времени обновления: иначе текст менялся бы при каждом замере
+        lines += ["", f"Графики за {self.window / 60:.0f} мин, обновление раз в {self.interval:.0f} с"]
+        return "\n".join(lines)
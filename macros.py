@@ -0,0 +1,215 @@
+"""
+Макросы: именованные наборы действий, выполняемые одним запросом
+
+Макросы описываются в JSON файле:
+
+    {
+        "away": {
+            "title": "Ухожу",
+            "steps": [
+                {"id": "game", "action": "kill_name:game.exe"},
+                {"id": "mute", "action": "sound_mute"},
+                {"action": "screen_lock", "after": ["game", "mute"]}
+            ]
+        },
+        "shots": {"steps": [{"action": "screenshot_full"}, {"action": "screenshot_windows"}]}
+    }
+
+Шаг - это callback_data зарегистрированного действия (как у кнопки) или имя
+источника данных бота (скриншоты). Шаги без "after" выполняются одновременно,
+шаг с "after" ждет перечисленные шаги и пропускается, если один из них
+завершился ошибкой. "sequential": true выполняет шаги строго по порядку.
+"""
+
+import asyncio
+import json
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from actions import Action, ActionRegistry, check_argument
+from metrics import count_error, track
+
+
+class MacroStep(NamedTuple):
+    """Шаг макроса"""
+    id: str
+    action: str                   # callback_data действия или имя источника
+    after: Tuple[str, ...] = ()   # шаги, которые должны успешно завершиться раньше
+
+
+class Macro(NamedTuple):
+    """Макрос"""
+    name: str
+    title: str
+    steps: Tuple[MacroStep, ...]
+
+
+class StepResult(NamedTuple):
+    """Результат шага; источник может вернуть несколько результатов (по одному на окно)"""
+    step: str
+    ok: bool
+    text: str
+    photos: Tuple[Tuple[str, bytes], ...] = ()  # (подпись, изображение)
+    latency: float = 0.0
+
+
+# Источник данных: корутина без аргументов, возвращающая результаты шага
+Source = Callable[[], Awaitable[List[StepResult]]]
+
+
+class MacroReport(NamedTuple):
+    """Итог выполнения макроса"""
+    macro: Macro
+    results: List[StepResult]
+    elapsed: float
+
+    @property
+    def ok(self) -> bool:
+        return all(result.ok for result in self.results)
+
+    @property
+    def photos(self) -> List[Tuple[str, bytes]]:
+        return [photo for result in self.results for photo in result.photos]
+
+    def describe(self) -> str:
+        done = sum(result.ok for result in self.results)
+        lines = [f"▶️ {self.macro.title}: выполнено {done}/{len(self.results)} за {self.elapsed:.1f} с", ""]
+        lines += [f"{result.text} ({result.latency:.1f} с)" for result in self.results]
+        return "\n".join(lines)
+
+
+def parse_macro(name: str, fields: dict) -> Macro:
+    """Разбирает описание макроса; зависимости могут ссылаться только на предыдущие шаги"""
+    check_argument(name, "Имя макроса")
+    raw_steps = fields.get("steps")
+    if not raw_steps:
+        raise ValueError(f"В макросе {name} нет шагов")
+
+    steps: List[MacroStep] = []
+    for number, raw in enumerate(raw_steps, 1):
+        step_id = str(raw.get("id", number))
+        if any(step.id == step_id for step in steps):
+            raise ValueError(f"В макросе {name} повторяется шаг {step_id}")
+        after = tuple(str(item) for item in raw.get("after", ()))
+        if fields.get("sequential") and steps:
+            after = (steps[-1].id,)
+        unknown = [item for item in after if not any(step.id == item for step in steps)]
+        if unknown:
+            raise ValueError(f"Шаг {step_id} макроса {name} ждет неизвестные шаги: {', '.join(unknown)}")
+        steps.append(MacroStep(step_id, raw["action"], after))
+    return Macro(name, fields.get("title", name), tuple(steps))
+
+
+class MacroRegistry:
+    """
+    Макросы из JSON файла и встроенные макросы
+
+    Файл читается заново, только если изменилось время его модификации;
+    макрос из файла заменяет встроенный с тем же именем.
+    """
+
+    def __init__(self, path: str, defaults: Optional[Dict[str, Macro]] = None):
+        self.path = path
+        self.defaults = defaults or {}
+        self._macros: Dict[str, Macro] = dict(self.defaults)
+        self._mtime: Optional[float] = None
+
+    def _load(self) -> None:
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            self._macros, self._mtime = dict(self.defaults), None
+            return
+        if mtime == self._mtime:
+            return
+
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        macros = dict(self.defaults)
+        for name, fields in data.items():
+            macros[name] = parse_macro(name, fields)
+        self._macros, self._mtime = macros, mtime
+
+    def all(self) -> List[Macro]:
+        self._load()
+        return list(self._macros.values())
+
+    def get(self, name: str) -> Optional[Macro]:
+        self._load()
+        return self._macros.get(name)
+
+
+class MacroRunner:
+    """
+    Выполнение макросов
+
+    Каждый шаг запускается отдельной задачей сразу, как только завершились
+    шаги из его "after", поэтому время макроса близко к самой длинной цепочке
+    шагов, а не к их сумме. Конфликтующие действия (два действия со звуком)
+    по-прежнему разводятся блокировками ресурсов реестра действий.
+    """
+
+    def __init__(self, registry: ActionRegistry, sources: Optional[Dict[str, Source]] = None):
+        self.registry = registry
+        self.sources = sources or {}
+
+    def resolve(self, step: MacroStep) -> Optional[Tuple[Action, Optional[str]]]:
+        """Действие шага; None для источников"""
+        if step.action in self.sources:
+            return None
+        resolved = self.registry.resolve(step.action)
+        if resolved is None or resolved[0].view:
+            # Действия с view=True сами рисуют ответ в сообщении и в макрос не подходят
+            raise ValueError(f"Действие {step.action} нельзя использовать в макросе")
+        return resolved
+
+    def actions(self, macro: Macro) -> List[Action]:
+        """Действия реестра, которые выполнит макрос (без источников)"""
+        resolved = (self.resolve(step) for step in macro.steps)
+        return [item[0] for item in resolved if item is not None]
+
+    def requires_confirmation(self, macro: Macro) -> bool:
+        """Нужно ли подтверждение: есть шаг с действием, требующим подтверждения"""
+        return any(action.confirm for action in self.actions(macro))
+
+    async def run(self, macro: Macro) -> MacroReport:
+        for step in macro.steps:
+            self.resolve(step)  # Неизвестное действие - ошибка до выполнения первого шага
+
+        started = time.perf_counter()
+        tasks: Dict[str, asyncio.Task] = {}
+        try:
+            with track(f"macro:{macro.name}"):
+                for step in macro.steps:
+                    tasks[step.id] = asyncio.create_task(
+                        self._run_step(step, [tasks[item] for item in step.after]))
+                done = await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+        results = [result for step_results in done for result in step_results]
+        return MacroReport(macro, results, time.perf_counter() - started)
+
+    async def _run_step(self, step: MacroStep, dependencies: List[asyncio.Task]) -> List[StepResult]:
+        if dependencies:
+            previous = await asyncio.gather(*dependencies)
+            if not all(result.ok for results in previous for result in results):
+                return [StepResult(step.id, False, f"⏭ {step.action}: пропущен, предыдущий шаг не выполнен")]
+
+        started = time.perf_counter()
+        try:
+            resolved = self.resolve(step)
+            if resolved is None:
+                results = await self.sources[step.action]()
+            else:
+                action, arg = resolved
+                result = str(await self.registry.run(action, arg))
+                results = [StepResult(step.id, not result.startswith("❌"), f"{action.emoji} {result}".strip())]
+        except Exception as e:
+            count_error(f"macro_step:{step.action}", e)
+            results = [StepResult(step.id, False, f"❌ {step.action}: {e}")]
+
+        latency = time.perf_counter() - started
+        return [result._replace(latency=latency) for result in results]
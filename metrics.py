@@ -0,0 +1,309 @@
+"""
+Метрики бота: гистограммы задержек, счетчики ошибок и выполняющиеся операции
+
+Метрики доступны командой /stats и, если задан METRICS_PORT, по HTTP
+на /metrics в текстовом формате Prometheus.
+"""
+
+import asyncio
+import bisect
+import functools
+import inspect
+import logging
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from http_server import HttpResponse, HttpServer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    """Базовый класс метрики с метками"""
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """Строки значений в текстовом формате Prometheus"""
+
+
+class Counter(Metric):
+    """Монотонно растущий счетчик"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def items(self) -> List[Tuple[LabelValues, float]]:
+        with self._lock:
+            return list(self._values.items())
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in self.items()]
+
+
+class Gauge(Counter):
+    """Значение, которое может расти и уменьшаться"""
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class HistogramSeries:
+    """Данные гистограммы для одного набора меток"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.counts = [0] * (len(buckets) + 1)  # Последний элемент - корзина +Inf
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+
+class Histogram(Metric):
+    """Гистограмма значений (обычно длительностей в секундах)"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, HistogramSeries] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = HistogramSeries(self.buckets)
+            series.counts[bisect.bisect_left(self.buckets, value)] += 1
+            series.total += value
+            series.count += 1
+            series.max = max(series.max, value)
+
+    def series(self) -> Dict[LabelValues, HistogramSeries]:
+        with self._lock:
+            return dict(self._series)
+
+    def quantile(self, q: float, **labels: str) -> float:
+        """Оценка квантиля линейной интерполяцией внутри корзины"""
+        series = self._series.get(self._key(labels))
+        if series is None or series.count == 0:
+            return 0.0
+
+        rank = q * series.count
+        cumulative = 0
+        lower = 0.0
+        for i, count in enumerate(series.counts):
+            upper = self.buckets[i] if i < len(self.buckets) else series.max
+            if cumulative + count >= rank and count:
+                return min(lower + (upper - lower) * (rank - cumulative) / count, series.max)
+            cumulative += count
+            lower = upper
+        return series.max
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, series in self.series().items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series.counts):
+                cumulative += count
+                labels = _format_labels(self.labels, key, f'le="{_format_value(float(bound))}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series.total)}")
+            lines.append(f"{self.name}_count{labels} {series.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Набор метрик процесса"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, documentation: str, labels: Sequence[str], **options) -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labels, **options)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Метрика {name} уже зарегистрирована с другим типом")
+            return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labels)
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labels)
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labels, buckets=buckets)
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+operation_seconds = registry.histogram(
+    "bot_operation_seconds", "Длительность обработчиков и вызовов контроллеров", ["operation"])
+operation_errors = registry.counter(
+    "bot_operation_errors_total", "Ошибки обработчиков и вызовов контроллеров", ["operation", "error"])
+operation_in_flight = registry.gauge(
+    "bot_operation_in_flight", "Выполняющиеся в данный момент операции", ["operation"])
+
+
+class track:
+    """
+    Контекстный менеджер замера операции
+
+        with track("screenshot"):
+            ...
+
+    Записывает длительность, ошибку (если было исключение) и число
+    выполняющихся операций.
+    """
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self._started = 0.0
+
+    def __enter__(self) -> "track":
+        operation_in_flight.inc(operation=self.operation)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        operation_seconds.observe(time.perf_counter() - self._started, operation=self.operation)
+        operation_in_flight.dec(operation=self.operation)
+        if exc_type is not None and not issubclass(exc_type, asyncio.CancelledError):
+            operation_errors.inc(operation=self.operation, error=exc_type.__name__)
+
+
+def instrument(operation: Optional[str] = None) -> Callable:
+    """Декоратор замера функции или корутины (по умолчанию операция = имя функции)"""
+    def decorator(func: Callable) -> Callable:
+        name = operation or func.__name__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with track(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with track(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def count_error(operation: str, error: BaseException) -> None:
+    """Учитывает ошибку, перехваченную обработчиком и показанную пользователю"""
+    operation_errors.inc(operation=operation, error=type(error).__name__)
+    logger.error(f"Ошибка в {operation}: {error}")
+
+
+def format_stats(limit: int = 15) -> str:
+    """Сводка для команды /stats: самые медленные операции по p95"""
+    rows = []
+    errors: Dict[str, float] = {}
+    for (operation, _), value in operation_errors.items():
+        errors[operation] = errors.get(operation, 0) + value
+
+    for (operation,), series in operation_seconds.series().items():
+        rows.append((
+            operation_seconds.quantile(0.95, operation=operation),
+            operation,
+            series.count,
+            operation_seconds.quantile(0.5, operation=operation),
+            series.max,
+        ))
+
+    if not rows:
+        return "📊 Статистика пока пуста."
+
+    rows.sort(reverse=True)
+    text = "📊 Статистика операций (p50 / p95 / max, мс):\n\n"
+    for p95, operation, count, p50, maximum in rows[:limit]:
+        text += f"{operation}: {count} выз., {p50 * 1000:.0f} / {p95 * 1000:.0f} / {maximum * 1000:.0f}"
+        if errors.get(operation):
+            text += f", ошибок: {errors[operation]:.0f}"
+        text += "\n"
+    return text
+
+
+async def start_metrics_server(host: str, port: int) -> HttpServer:
+    """Запускает HTTP сервер с эндпоинтом /metrics"""
+    server = HttpServer(host, port)
+
+    async def metrics_endpoint(request):
+        return HttpResponse(200, registry.render().encode(), "text/plain; version=0.0.4; charset=utf-8")
+
+    server.route("GET", "/metrics", metrics_endpoint)
+    await server.start()
+    return server
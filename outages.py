@@ -0,0 +1,102 @@
+"""
+История перебоев сети: wifi_fixer записывает, бот читает и сообщает о них
+
+Файл - строки JSON по одной на перебой, хранится не больше keep последних записей.
+"""
+
+import json
+import os
+import time
+from typing import List, NamedTuple, Optional
+
+OUTAGES_FILE = "wifi_outages.jsonl"
+
+
+class Outage(NamedTuple):
+    """Перебой связи"""
+    start: float      # время начала (unix time)
+    end: float        # время восстановления
+    repaired: bool    # связь вернулась после перезапуска адаптера
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    def describe(self) -> str:
+        started = time.strftime("%d.%m %H:%M:%S", time.localtime(self.start))
+        minutes, seconds = divmod(int(self.duration), 60)
+        how = "после перезапуска адаптера" if self.repaired else "сама"
+        return f"📶 {started} - нет сети {minutes}м {seconds}с, восстановилась {how}"
+
+
+def append_outage(outage: Outage, path: str = OUTAGES_FILE, keep: int = 200) -> None:
+    """Добавляет запись; при превышении keep файл переписывается с последними записями"""
+    line = json.dumps(outage._asdict(), separators=(",", ":"))
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+    outages = read_outages(path)
+    if len(outages) > keep:
+        temporary = path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            for item in outages[-keep:]:
+                f.write(json.dumps(item._asdict(), separators=(",", ":")) + "\n")
+        os.replace(temporary, path)
+
+
+def read_outages(path: str = OUTAGES_FILE, since: Optional[float] = None) -> List[Outage]:
+    """Записи по порядку; since - только перебои, закончившиеся позже этого времени"""
+    outages = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    outage = Outage(**json.loads(line))
+                except (ValueError, TypeError):
+                    continue  # Оборванная запись при аварийном выключении
+                if since is None or outage.end > since:
+                    outages.append(outage)
+    except FileNotFoundError:
+        pass
+    return outages
+
+
+class OutageReporter:
+    """
+    Отслеживает новые записи для уведомлений бота
+
+    Время последней сообщенной записи хранится рядом с историей, поэтому
+    после перезапуска бот не повторяет уже отправленные уведомления.
+    """
+
+    def __init__(self, path: str = OUTAGES_FILE):
+        self.path = path
+        self.state_path = path + ".reported"
+        self._mtime: Optional[float] = None
+
+    def _reported_until(self) -> float:
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                return float(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0.0
+
+    def new_outages(self) -> List[Outage]:
+        """Перебои, о которых еще не сообщали; файл читается, только если он изменился"""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return []
+        if mtime == self._mtime:
+            return []
+        outages = read_outages(self.path, since=self._reported_until())
+        if not outages:
+            self._mtime = mtime
+        return outages
+
+    def mark_reported(self, outages: List[Outage]) -> None:
+        """Отмечает записи отправленными (до вызова new_outages вернет их снова)"""
+        if outages:
+            with open(self.state_path, "w", encoding="utf-8") as f:
+                f.write(str(max(outage.end for outage in outages)))
+            self._mtime = None
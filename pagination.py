@@ -0,0 +1,82 @@
+"""
+Постраничный просмотр списков (процессы, окна) по сохраненным снимкам
+"""
+
+import math
+import secrets
+import time
+from collections import OrderedDict
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+
+class Snapshot(NamedTuple):
+    """Замороженный список элементов, по которому листаются страницы"""
+    sid: str
+    kind: str
+    items: List[Any]
+    created: float
+    context: Any = None  # данные для отрисовки страниц (например, путь каталога)
+
+
+class SnapshotStore:
+    """
+    Хранилище снимков с вытеснением по LRU и сроком жизни
+
+    Снимок делается один раз при открытии списка, дальше кнопки "вперед/назад"
+    ссылаются на него коротким ID и не вызывают повторного перечисления.
+    """
+
+    def __init__(self, capacity: int = 32, ttl: float = 600.0):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._snapshots: "OrderedDict[str, Snapshot]" = OrderedDict()
+
+    def put(self, kind: str, items: List[Any], context: Any = None) -> Snapshot:
+        """Сохраняет снимок и возвращает его"""
+        sid = secrets.token_hex(3)
+        while sid in self._snapshots:
+            sid = secrets.token_hex(3)
+
+        snapshot = Snapshot(sid, kind, list(items), time.monotonic(), context)
+        self._snapshots[sid] = snapshot
+        while len(self._snapshots) > self.capacity:
+            self._snapshots.popitem(last=False)
+        return snapshot
+
+    def get(self, sid: str) -> Optional[Snapshot]:
+        """Возвращает снимок по ID или None, если он вытеснен или устарел"""
+        snapshot = self._snapshots.get(sid)
+        if snapshot is None:
+            return None
+        if time.monotonic() - snapshot.created > self.ttl:
+            del self._snapshots[sid]
+            return None
+        self._snapshots.move_to_end(sid)
+        return snapshot
+
+    def __len__(self) -> int:
+        return len(self._snapshots)
+
+
+def get_page(items: List[Any], page: int, per_page: int) -> Tuple[List[Any], int, int]:
+    """
+    Возвращает элементы страницы
+
+    Returns:
+        Tuple[List, int, int]: (элементы страницы, номер страницы, всего страниц)
+    """
+    pages = max(1, math.ceil(len(items) / per_page))
+    page = min(max(page, 0), pages - 1)
+    start = page * per_page
+    return items[start:start + per_page], page, pages
+
+
+def page_callback(sid: str, page: int) -> str:
+    """callback_data кнопки перехода на страницу (укладывается в 64 байта Telegram)"""
+    return f"page:{sid}_{page}"
+
+
+def parse_page_argument(arg: str) -> Tuple[str, int]:
+    """Разбирает аргумент <sid>_<page> из callback_data вида page:<sid>_<page>"""
+    sid, page = arg.split("_")
+    return sid, int(page)
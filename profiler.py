@@ -0,0 +1,97 @@
+"""
+Профилирование работающего бота по команде: cProfile и tracemalloc на заданное время
+
+Профилировщик и трассировка памяти включаются только на время замера, поэтому
+в обычной работе накладных расходов нет. cProfile видит код потока цикла
+событий (обработчики, планировщик, сериализацию); блокирующие вызовы в пуле
+потоков видны как время ожидания asyncio.to_thread.
+"""
+
+import asyncio
+import cProfile
+import marshal
+import os
+import time
+import tracemalloc
+from typing import List, NamedTuple
+
+from metrics import track
+
+TRACEMALLOC_FRAMES = 1
+
+
+class ProfileReport(NamedTuple):
+    """Результат замера: текст для сообщения и статистика в формате pstats (.prof)"""
+    text: str
+    prof: bytes
+
+
+def format_functions(profile: cProfile.Profile, limit: int) -> List[str]:
+    """Функции по суммарному времени (cumulative), как в pstats"""
+    profile.create_stats()
+    rows = sorted(profile.stats.items(), key=lambda item: item[1][3], reverse=True)
+    lines = []
+    for (filename, line, name), (_, calls, _, cumulative, _) in rows[:limit]:
+        where = f"{os.path.basename(filename)}:{line}" if line else "встроенная"
+        lines.append(f"{cumulative:8.3f} с {calls:7d}× {name} ({where})")
+    return lines
+
+
+def format_allocations(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot, limit: int) -> List[str]:
+    """Места, где за время замера больше всего выросла занятая память"""
+    lines = []
+    for stat in after.compare_to(before, "lineno")[:limit]:
+        frame = stat.traceback[0]
+        lines.append(f"{stat.size_diff / 1024:+9.1f} KB {stat.count_diff:+7d} бл. "
+                     f"{os.path.basename(frame.filename)}:{frame.lineno}")
+    return lines
+
+
+class Profiler:
+    """Одновременно может идти только один замер"""
+
+    def __init__(self):
+        self._running = False
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    async def run(self, seconds: float, limit: int = 15) -> ProfileReport:
+        if self._running:
+            raise RuntimeError("Профилирование уже запущено")
+        self._running = True
+        try:
+            with track("profile"):
+                return await self._run(seconds, limit)
+        finally:
+            self._running = False
+
+    async def _run(self, seconds: float, limit: int) -> ProfileReport:
+        # Трассировку памяти, включенную кем-то другим (python -X tracemalloc), не выключаем
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        profile = cProfile.Profile()
+        try:
+            before = tracemalloc.take_snapshot()
+            started = time.perf_counter()
+            profile.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profile.disable()
+            elapsed = time.perf_counter() - started
+            after = tracemalloc.take_snapshot()
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+
+        # Снимки уже сделаны, обработка не попадает в замер и идет вне цикла событий
+        functions = await asyncio.to_thread(format_functions, profile, limit)
+        allocations = await asyncio.to_thread(format_allocations, before, after, limit)
+        text = "\n".join(
+            [f"⏱ Профиль за {elapsed:.1f} с", "", "Функции по суммарному времени:"] + functions
+            + ["", "Рост памяти по местам выделения:"] + (allocations or ["нет изменений"])
+        )
+        return ProfileReport(text, marshal.dumps(profile.stats))
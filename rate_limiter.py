@@ -0,0 +1,245 @@
+"""
+Планировщик исходящих запросов к Telegram: лимиты, приоритеты и объединение правок
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from metrics import operation_seconds, registry
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты запросов (меньше - раньше). Передаются через rate_limit_args;
+# нуль использовать нельзя: PTB отбрасывает "ложные" rate_limit_args
+PRIORITY_HIGH = 1    # подтверждения и ответы на нажатия
+PRIORITY_NORMAL = 2  # обычные ответы
+PRIORITY_LOW = 3     # фоновые обновления (живая панель и т.п.)
+
+EDIT_ENDPOINTS = ("editMessageText", "editMessageCaption", "editMessageReplyMarkup")
+
+outbound_skipped = registry.counter(
+    "bot_outbound_skipped_total", "Исходящие запросы, которые не пришлось отправлять", ["reason"])
+outbound_retry_after = registry.counter(
+    "bot_outbound_retry_after_total", "Ответы Telegram 429 (RetryAfter)")
+outbound_queue = registry.gauge(
+    "bot_outbound_queue", "Запросы, ожидающие отправки")
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity подряд"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float, amount: float = 1.0) -> float:
+        """Через сколько секунд будет доступно amount токенов (не больше capacity)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, now: float, amount: float = 1.0) -> None:
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+
+class PendingRequest:
+    """Запрос, ожидающий разрешения на отправку"""
+
+    def __init__(self, priority: int, seq: int, chat_id: Any, edit_key: Optional[Tuple]):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.edit_key = edit_key
+        self.granted: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class OutboundScheduler(BaseRateLimiter[int]):
+    """
+    Ограничитель исходящих запросов
+
+    - общий лимит и лимит на каждый чат (корзины токенов)
+    - из ожидающих запросов первым уходит запрос с наивысшим приоритетом,
+      чей чат не исчерпал лимит
+    - несколько ожидающих правок одного сообщения схлопываются в последнюю
+    - правка, не меняющая уже отправленное содержимое, не отправляется
+    - при ответе 429 отправка приостанавливается на retry_after и запрос повторяется
+
+    Запросы без chat_id (getUpdates, answerCallbackQuery и т.п.) не ограничиваются.
+    """
+
+    def __init__(self, global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: float = 3.0,
+                 max_retries: int = 2, remembered_messages: int = 512):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.remembered_messages = remembered_messages
+
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: Dict[Any, TokenBucket] = {}
+        self._pending: List[PendingRequest] = []
+        self._pending_edits: Dict[Tuple, PendingRequest] = {}
+        # (chat_id, message_id) -> содержимое последней успешной правки
+        self._last_content: "OrderedDict[Tuple, Tuple]" = OrderedDict()
+        self._paused_until = 0.0
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def initialize(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+
+    async def shutdown(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for request in self._pending:
+            if not request.granted.done():
+                request.granted.cancel()
+        self._pending.clear()
+        self._pending_edits.clear()
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        chat_id = data.get("chat_id")
+        if chat_id is None or self._worker is None:
+            return await callback(*args, **kwargs)
+
+        edit_key = None
+        content = None
+        if endpoint in EDIT_ENDPOINTS and data.get("message_id") is not None:
+            edit_key = (chat_id, data["message_id"])
+            content = (endpoint, data.get("text"), data.get("caption"), data.get("parse_mode"),
+                       data.get("reply_markup"))
+            if self._last_content.get(edit_key) == content:
+                outbound_skipped.inc(reason="unchanged")
+                return True
+
+        priority = PRIORITY_NORMAL if rate_limit_args is None else rate_limit_args
+
+        for attempt in range(self.max_retries + 1):
+            if not await self._acquire(priority, chat_id, edit_key):
+                # Пока запрос ждал, пришла более новая правка того же сообщения
+                outbound_skipped.inc(reason="coalesced")
+                return True
+
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                outbound_retry_after.inc()
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"Telegram просит подождать {e.retry_after}с перед {endpoint}")
+                self._paused_until = max(self._paused_until, time.monotonic() + float(e.retry_after))
+                continue
+
+            if edit_key is not None:
+                self._remember(edit_key, content)
+            return result
+
+    def _remember(self, edit_key: Tuple, content: Tuple) -> None:
+        self._last_content[edit_key] = content
+        self._last_content.move_to_end(edit_key)
+        while len(self._last_content) > self.remembered_messages:
+            self._last_content.popitem(last=False)
+
+    async def _acquire(self, priority: int, chat_id: Any, edit_key: Optional[Tuple]) -> bool:
+        """Ждет разрешения на отправку; False - запрос вытеснен более новой правкой"""
+        request = PendingRequest(priority, next(self._seq), chat_id, edit_key)
+
+        if edit_key is not None:
+            previous = self._pending_edits.get(edit_key)
+            if previous is not None:
+                # Старая правка уже не нужна: новая займет ее место
+                request.priority = min(request.priority, previous.priority)
+                request.seq = previous.seq
+                self._remove(previous)
+                previous.granted.set_result(False)
+            self._pending_edits[edit_key] = request
+
+        self._pending.append(request)
+        outbound_queue.set(len(self._pending))
+        self._wakeup.set()
+
+        started = time.perf_counter()
+        try:
+            return await request.granted
+        finally:
+            operation_seconds.observe(time.perf_counter() - started, operation="outbound_wait")
+            if not request.granted.done() or request.granted.cancelled():
+                self._remove(request)
+
+    def _remove(self, request: PendingRequest) -> None:
+        if request in self._pending:
+            self._pending.remove(request)
+        if request.edit_key is not None and self._pending_edits.get(request.edit_key) is request:
+            del self._pending_edits[request.edit_key]
+        outbound_queue.set(len(self._pending))
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _pick(self, now: float) -> Tuple[Optional[PendingRequest], Optional[float]]:
+        """Выбирает запрос для отправки или возвращает, сколько ждать до следующей попытки"""
+        if not self._pending:
+            return None, None
+
+        wait = max(self._paused_until - now, self._global.delay(now))
+        if wait > 0:
+            return None, wait
+
+        nearest = None
+        for request in sorted(self._pending, key=lambda r: (r.priority, r.seq)):
+            delay = self._chat_bucket(request.chat_id).delay(now)
+            if delay <= 0:
+                return request, None
+            nearest = delay if nearest is None else min(nearest, delay)
+        return None, nearest
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            request, wait = self._pick(now)
+
+            if request is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._global.take(now)
+            self._chat_bucket(request.chat_id).take(now)
+            self._remove(request)
+            if not request.granted.done():
+                request.granted.set_result(True)
@@ -0,0 +1,145 @@
+"""
+Именованные блокировки ресурсов компьютера для параллельной обработки обновлений
+"""
+
+import asyncio
+import contextlib
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Iterable, Tuple
+
+from metrics import operation_seconds, registry
+
+# Ресурсы, которые нельзя использовать одновременно
+SCREEN = "screen"        # захват экрана
+POWER = "power"          # выключение, перезагрузка, сон, блокировка
+PROCESSES = "processes"  # перечисление и завершение процессов
+WINDOWS = "windows"      # перечисление и активация окон
+SOUND = "sound"          # громкость
+
+
+class ResourceLocks:
+    """
+    Набор asyncio.Lock по имени ресурса
+
+    Независимые действия выполняются параллельно, а действия над одним
+    ресурсом (две команды выключения, завершение процесса во время получения
+    списка процессов) - по очереди. Несколько блокировок всегда берутся в
+    одном порядке (по имени), поэтому взаимной блокировки не возникает.
+    Время ожидания каждой блокировки попадает в метрики как lock_wait:<ресурс>.
+    """
+
+    def __init__(self):
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def get(self, name: str) -> asyncio.Lock:
+        lock = self._locks.get(name)
+        if lock is None:
+            lock = self._locks[name] = asyncio.Lock()
+        return lock
+
+    def is_busy(self, name: str) -> bool:
+        lock = self._locks.get(name)
+        return lock is not None and lock.locked()
+
+    @contextlib.asynccontextmanager
+    async def hold(self, names: Iterable[str]) -> AsyncIterator[None]:
+        """Захватывает блокировки всех перечисленных ресурсов"""
+        acquired = []
+        try:
+            for name in sorted(set(names)):
+                lock = self.get(name)
+                started = time.perf_counter()
+                await lock.acquire()
+                acquired.append(lock)
+                operation_seconds.observe(time.perf_counter() - started, operation=f"lock_wait:{name}")
+            yield
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
+
+
+memory_reserved = registry.gauge(
+    "bot_memory_reserved_bytes", "Память, зарезервированная под данные в обработке", ["budget"])
+
+
+class MemoryReservation:
+    """Резерв памяти, полученный от MemoryBudget.hold"""
+
+    def __init__(self, budget: "MemoryBudget", size: int):
+        self.budget = budget
+        self.size = size
+
+    def shrink(self, size: int) -> None:
+        """Уменьшает резерв до size байт (например, после сжатия кадра), отдавая разницу ожидающим"""
+        size = max(0, min(size, self.size))
+        self.budget.release(self.size - size)
+        self.size = size
+
+
+class MemoryBudget:
+    """
+    Общий бюджет памяти в байтах для крупных данных в обработке
+
+    В отличие от блокировки ресурса, одновременно выполняется столько задач,
+    сколько помещается в бюджет. Ожидающие обслуживаются по очереди, поэтому
+    большой резерв не ждет бесконечно за потоком маленьких. Резерв больше
+    всего бюджета урезается до бюджета - такая задача просто идет одна.
+    Время ожидания попадает в метрики как memory_wait:<имя>.
+    """
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.used = 0
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+
+    async def acquire(self, size: int) -> int:
+        size = min(size, self.limit)
+        if not self._waiters and self.used + size <= self.limit:
+            self._take(size)
+            return size
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((size, future))
+        started = time.perf_counter()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(size)  # Резерв выдан одновременно с отменой
+            else:
+                self.release(0)     # Отмененный первый в очереди мог задерживать следующих
+            raise
+        operation_seconds.observe(time.perf_counter() - started, operation=f"memory_wait:{self.name}")
+        return size
+
+    def release(self, size: int) -> None:
+        self.used -= size
+        memory_reserved.set(self.used, budget=self.name)
+        while self._waiters:
+            size, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if self.used + size > self.limit:
+                break
+            self._waiters.popleft()
+            self._take(size)
+            future.set_result(None)
+
+    def _take(self, size: int) -> None:
+        self.used += size
+        memory_reserved.set(self.used, budget=self.name)
+
+    @contextlib.asynccontextmanager
+    async def hold(self, size: int) -> AsyncIterator[MemoryReservation]:
+        """Резервирует size байт на время блока"""
+        reservation = MemoryReservation(self, await self.acquire(size))
+        try:
+            yield reservation
+        finally:
+            self.release(reservation.size)
+
+
+resource_locks = ResourceLocks()
@@ -12,6 +12,8 @@ import win32gui
 import win32ui
 from PIL import Image, ImageDraw, ImageFont
 
+from metrics import instrument
+
 class WindowsScreenshot:
     """Класс для создания скриншотов в Windows"""
     
@@ -160,12 +162,16 @@ class WindowsScreenshot:
             except:
                 pass
     
+    @staticmethod
+    def _text_size(draw: ImageDraw.ImageDraw, text: str, font) -> Tuple[int, int]:
+        """Размер текста (textsize убран из Pillow 10, остался textbbox)"""
+        left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+        return right - left, bottom - top
+
     def _add_timestamp(self, image: Image.Image) -> Image.Image:
-        """Добавляет временную метку на скриншот"""
+        """Добавляет временную метку на скриншот (рисует прямо на кадре, без копии)"""
         try:
-            # Создаем копию изображения
-            img_with_timestamp = image.copy()
-            draw = ImageDraw.Draw(img_with_timestamp)
+            draw = ImageDraw.Draw(image)
             
             # Получаем текущее время
             timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -177,9 +183,9 @@ class WindowsScreenshot:
                 font = ImageFont.load_default()
             
             # Определяем позицию для текста (правый нижний угол)
-            text_width, text_height = draw.textsize(timestamp, font=font)
-            x = img_with_timestamp.width - text_width - 10
-            y = img_with_timestamp.height - text_height - 10
+            text_width, text_height = self._text_size(draw, timestamp, font)
+            x = image.width - text_width - 10
+            y = image.height - text_height - 10
             
             # Рисуем фон для текста
             draw.rectangle([x-5, y-5, x+text_width+5, y+text_height+5], fill=(0, 0, 0, 128))
@@ -187,18 +193,15 @@ class WindowsScreenshot:
             # Рисуем текст
             draw.text((x, y), timestamp, fill=(255, 255, 255), font=font)
             
-            return img_with_timestamp
-            
         except Exception:
-            # Если не удалось добавить метку, возвращаем оригинал
-            return image
+            # Если не удалось добавить метку, кадр остается без нее
+            pass
+        return image
     
     def _add_window_info(self, image: Image.Image, window_title: str) -> Image.Image:
-        """Добавляет информацию об окне на скриншот"""
+        """Добавляет информацию об окне на скриншот (рисует прямо на кадре, без копии)"""
         try:
-            # Создаем копию изображения
-            img_with_info = image.copy()
-            draw = ImageDraw.Draw(img_with_info)
+            draw = ImageDraw.Draw(image)
             
             # Получаем информацию
             timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -211,7 +214,7 @@ class WindowsScreenshot:
                 font = ImageFont.load_default()
             
             # Определяем позицию для текста (верхний левый угол)
-            text_width, text_height = draw.textsize(info_text, font=font)
+            text_width, text_height = self._text_size(draw, info_text, font)
             
             # Рисуем фон для текста
             draw.rectangle([5, 5, text_width+15, text_height+15], fill=(0, 0, 0, 128))
@@ -219,19 +222,21 @@ class WindowsScreenshot:
             # Рисуем текст
             draw.text((10, 10), info_text, fill=(255, 255, 255), font=font)
             
-            return img_with_info
-            
         except Exception:
-            # Если не удалось добавить информацию, возвращаем оригинал
-            return image
+            # Если не удалось добавить информацию, кадр остается без нее
+            pass
+        return image
     
-    def get_screenshot_as_bytes(self, screenshot_type: str = "full", window_title: Optional[str] = None) -> Tuple[bool, str, Optional[bytes]]:
+    @instrument()
+    def get_screenshot_as_bytes(self, screenshot_type: str = "full", window_title: Optional[str] = None,
+                                hwnd: Optional[int] = None) -> Tuple[bool, str, Optional[bytes]]:
         """
         Создает скриншот и возвращает его как байты для отправки в Telegram
         
         Args:
             screenshot_type: "full" или "window"
             window_title: Заголовок окна (для типа "window")
+            hwnd: Handle окна (для типа "window", точнее поиска по заголовку)
             
         Returns:
             Tuple[bool, str, Optional[bytes]]: (успех, сообщение, данные изображения)
@@ -241,8 +246,9 @@ class WindowsScreenshot:
                 screenshot = pyautogui.screenshot()
                 screenshot_with_info = self._add_timestamp(screenshot)
             else:  # window
-                hwnd = None
-                if window_title:
+                if hwnd:
+                    hwnd = int(hwnd)
+                elif window_title:
                     hwnd = win32gui.FindWindow(None, window_title)
                 else:
                     hwnd = win32gui.GetForegroundWindow()
@@ -265,12 +271,14 @@ class WindowsScreenshot:
                 window_title_actual = win32gui.GetWindowText(hwnd)
                 screenshot_with_info = self._add_window_info(screenshot, window_title_actual)
             
-            # Конвертируем в байты
-            img_bytes = io.BytesIO()
-            screenshot_with_info.save(img_bytes, format='PNG')
-            img_bytes.seek(0)
+            # Кодируем сразу в буфер BytesIO. getvalue() у буфера без открытых представлений
+            # отдает его же объект bytes без копирования, а bytes Telegram загружает как есть
+            # (файловый объект python-telegram-bot сначала прочитал бы целиком)
+            buffer = io.BytesIO()
+            screenshot_with_info.save(buffer, format='PNG')
+            screenshot_with_info.close()  # Кадр больше не нужен - в памяти остается только PNG
             
-            return True, "✅ Скриншот создан", img_bytes.getvalue()
+            return True, "✅ Скриншот создан", buffer.getvalue()
             
         except Exception as e:
             return False, f"❌ Ошибка создания скриншота: {str(e)}", None
@@ -0,0 +1,289 @@
+"""
+Сбор информации о системе: параллельные замеры, кэш и фоновый замер CPU
+"""
+
+import functools
+import getpass
+import logging
+import os
+import platform
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+import psutil
+
+try:
+    import pynvml
+except ImportError:  # Без nvidia-ml-py загрузка GPU просто не замеряется
+    pynvml = None
+
+logger = logging.getLogger(__name__)
+
+GB = 1024 ** 3
+PENDING = "измеряется…"  # Значение поля, для которого еще нет ни одного замера
+
+
+class ResourceSample(NamedTuple):
+    """Один замер загрузки системы"""
+    timestamp: float
+    cpu: float
+    ram: float
+    gpu: Optional[float] = None  # None - нет GPU NVIDIA или драйвера
+    vram: Optional[float] = None  # загрузка контроллера видеопамяти, как в cpumonitor.py
+
+
+class ResourceSampler:
+    """
+    Фоновый замер загрузки CPU, RAM и (если есть NVIDIA) GPU и видеопамяти
+
+    psutil.cpu_percent(interval=None) считает загрузку по приращениям времени
+    CPU с прошлого вызова, поэтому осмысленное значение получается только при
+    регулярных вызовах - их и делает фоновый поток.
+    """
+
+    def __init__(self, interval: float = 1.0, history: int = 600):
+        self.interval = interval
+        self.samples: Deque[ResourceSample] = deque(maxlen=history)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self._gpu_handle = None
+
+    def start(self) -> None:
+        """Запускает фоновый поток (повторный вызов ничего не делает)"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            psutil.cpu_percent(interval=None)  # Первый вызов только задает точку отсчета
+            self._gpu_handle = self._open_gpu()
+            self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    @staticmethod
+    def _open_gpu():
+        if pynvml is None:
+            return None
+        try:
+            pynvml.nvmlInit()
+            return pynvml.nvmlDeviceGetHandleByIndex(0)
+        except Exception as e:
+            logger.info(f"Загрузка GPU не замеряется: {e}")
+            return None
+
+    def _gpu_load(self) -> Tuple[Optional[float], Optional[float]]:
+        """(загрузка GPU, загрузка видеопамяти) одним запросом к NVML"""
+        if self._gpu_handle is None:
+            return None, None
+        try:
+            rates = pynvml.nvmlDeviceGetUtilizationRates(self._gpu_handle)
+            return float(rates.gpu), float(rates.memory)
+        except Exception:
+            return None, None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.samples.append(ResourceSample(
+                    time.time(),
+                    psutil.cpu_percent(interval=None),
+                    psutil.virtual_memory().percent,
+                    *self._gpu_load(),
+                ))
+            except Exception as e:
+                logger.error(f"Ошибка замера ресурсов: {e}")
+
+    def latest(self) -> Optional[ResourceSample]:
+        """Последний замер или None, если замеров еще нет"""
+        return self.samples[-1] if self.samples else None
+
+
+class SystemInfoProvider:
+    """
+    Информация о системе для сообщения "ℹ️ Информация о системе"
+
+    Редко меняющиеся поля (имя компьютера, число ядер, объем RAM) вычисляются
+    один раз за время жизни процесса. Остальные замеры выполняются параллельно
+    в пуле потоков по схеме stale-while-revalidate: ответ всегда собирается из
+    кэша без ожидания, а устаревшие (старше cache_ttl секунд) замеры
+    обновляются в фоне к следующему запросу. Пока замера еще не было, в поле
+    выводится "измеряется…".
+    """
+
+    # Заголовок поля, пока замер еще не выполнялся (диски подписываются точкой монтирования)
+    PROBE_TITLES = {"memory": "RAM", "network": "Сеть", "temperatures": "Температура", "battery": "Батарея"}
+
+    def __init__(self, sampler: Optional[ResourceSampler] = None, cache_ttl: float = 5.0, max_workers: int = 8):
+        self.sampler = sampler or ResourceSampler()
+        self.cache_ttl = cache_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sysinfo")
+        self._lock = threading.Lock()
+        # ключ замера -> (время замера, результат)
+        self._cache: Dict[str, Tuple[float, List[Tuple[str, str]]]] = {}
+        self._running: Dict[str, object] = {}
+        self._partitions_cache: Optional[Tuple[float, Tuple[str, ...]]] = None
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def static_info() -> Tuple[Tuple[str, str], ...]:
+        """Поля, не меняющиеся за время работы процесса"""
+        try:
+            user = os.environ.get('USERNAME') or getpass.getuser()
+        except Exception:
+            user = 'Неизвестно'
+
+        return (
+            ("Компьютер", os.environ.get('COMPUTERNAME') or socket.gethostname()),
+            ("Пользователь", user),
+            ("ОС", platform.platform()),
+        )
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _cpu_cores() -> str:
+        physical = psutil.cpu_count(logical=False)
+        logical = psutil.cpu_count()
+        if physical and physical != logical:
+            return f"{physical} ядер / {logical} потоков"
+        return f"{logical} ядер"
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _boot_time() -> float:
+        return psutil.boot_time()
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _total_memory() -> int:
+        return psutil.virtual_memory().total
+
+    def warm_up(self) -> None:
+        """Запускает фоновый замер CPU и первые замеры, чтобы первый ответ был уже заполнен"""
+        self.sampler.start()
+        self._collect()
+
+    def get_system_info(self) -> Dict[str, str]:
+        """Собирает информацию о системе из кэша, не дожидаясь замеров"""
+        self.sampler.start()
+
+        info = dict(self.static_info())
+        info["Время работы"] = self._get_uptime()
+        info["CPU"] = f"{self._cpu_cores()}, загрузка: {self._get_cpu_load()}"
+
+        for key, value in self._collect():
+            info[key] = value
+        return info
+
+    def _get_uptime(self) -> str:
+        uptime_seconds = time.time() - self._boot_time()
+        hours, remainder = divmod(int(uptime_seconds), 3600)
+        minutes, seconds = divmod(remainder, 60)
+        return f"{hours}ч {minutes}м {seconds}с"
+
+    def _get_cpu_load(self) -> str:
+        # Свой блокирующий замер здесь не делаем: он бы задержал ответ и сбил
+        # точку отсчета psutil.cpu_percent, от которой считает фоновый замер
+        sample = self.sampler.latest()
+        return PENDING if sample is None else f"{sample.cpu}%"
+
+    def _probes(self) -> Dict[str, Callable[[], List[Tuple[str, str]]]]:
+        """Замеры, выполняемые параллельно; каждый возвращает список строк (ключ, значение)"""
+        probes = {"memory": self._probe_memory, "network": self._probe_network}
+        for mountpoint in self._partitions():
+            probes[f"disk:{mountpoint}"] = functools.partial(self._probe_disk, mountpoint)
+        if hasattr(psutil, "sensors_temperatures"):
+            probes["temperatures"] = self._probe_temperatures
+        if hasattr(psutil, "sensors_battery"):
+            probes["battery"] = self._probe_battery
+        return probes
+
+    def _collect(self) -> List[Tuple[str, str]]:
+        """Строки из кэша; устаревшие и отсутствующие замеры запускаются в фоне"""
+        probes = self._probes()
+        now = time.monotonic()
+        rows = []
+
+        with self._lock:
+            for key, probe in probes.items():
+                cached = self._cache.get(key)
+                # Не запускаем замер повторно, пока предыдущий не завершился
+                if (cached is None or now - cached[0] >= self.cache_ttl) and key not in self._running:
+                    self._running[key] = self._executor.submit(self._run_probe, key, probe)
+                if cached is not None:
+                    rows.extend(cached[1])
+                elif key.startswith("disk:"):
+                    rows.append((f"Диск {key[5:]}", PENDING))
+                else:
+                    rows.append((self.PROBE_TITLES.get(key, key), PENDING))
+        return rows
+
+    def _run_probe(self, key: str, probe: Callable[[], List[Tuple[str, str]]]) -> None:
+        try:
+            result = probe()
+        except Exception as e:
+            logger.warning(f"Замер {key} завершился ошибкой: {e}")
+            result = []
+        with self._lock:
+            self._cache[key] = (time.monotonic(), result)
+            self._running.pop(key, None)
+
+    def _partitions(self) -> Tuple[str, ...]:
+        """Смонтированные разделы (без приводов без носителя), список обновляется раз в минуту"""
+        now = time.monotonic()
+        if self._partitions_cache is None or now - self._partitions_cache[0] > 60:
+            mountpoints = tuple(
+                partition.mountpoint
+                for partition in psutil.disk_partitions(all=False)
+                if 'cdrom' not in partition.opts and partition.fstype
+            )
+            self._partitions_cache = (now, mountpoints)
+        return self._partitions_cache[1]
+
+    def _probe_memory(self) -> List[Tuple[str, str]]:
+        memory = psutil.virtual_memory()
+        return [("RAM", f"{memory.used / GB:.1f}GB / {self._total_memory() / GB:.1f}GB ({memory.percent}%)")]
+
+    @staticmethod
+    def _probe_disk(mountpoint: str) -> List[Tuple[str, str]]:
+        disk = psutil.disk_usage(mountpoint)
+        return [(f"Диск {mountpoint}",
+                 f"{disk.used / GB:.1f}GB / {disk.total / GB:.1f}GB ({disk.percent}%)")]
+
+    @staticmethod
+    def _probe_network() -> List[Tuple[str, str]]:
+        stats = psutil.net_if_stats()
+        rows = []
+        for name, addresses in psutil.net_if_addrs().items():
+            if name not in stats or not stats[name].isup:
+                continue
+            ipv4 = [a.address for a in addresses if a.family == socket.AF_INET and not a.address.startswith("127.")]
+            if ipv4:
+                rows.append((f"Сеть {name}", ", ".join(ipv4)))
+        return rows
+
+    @staticmethod
+    def _probe_temperatures() -> List[Tuple[str, str]]:
+        rows = []
+        for name, entries in (psutil.sensors_temperatures() or {}).items():
+            if entries:
+                hottest = max(entry.current for entry in entries)
+                rows.append((f"Температура {name}", f"{hottest:.0f}°C"))
+        return rows
+
+    @staticmethod
+    def _probe_battery() -> List[Tuple[str, str]]:
+        battery = psutil.sensors_battery()
+        if battery is None:
+            return []
+        state = "заряжается" if battery.power_plugged else "от батареи"
+        return [("Батарея", f"{battery.percent:.0f}% ({state})")]
+
+
+system_info_provider = SystemInfoProvider()
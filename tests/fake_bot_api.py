@@ -0,0 +1,132 @@
+"""
+Поддельный Bot API на localhost (как TELEGRAM_API_URL в .env): запоминает вызовы
+методов и отвечает как Telegram
+"""
+
+import asyncio
+import json
+from email.parser import BytesParser
+from email.policy import HTTP
+from typing import Any, Dict, List, Tuple
+from urllib.parse import parse_qsl
+
+from telegram.ext import Application, ApplicationBuilder
+
+from http_server import HttpRequest, HttpResponse, HttpServer
+
+TOKEN = "123:test"
+CHAT_ID = 42
+
+METHODS = ("getMe", "setWebhook", "deleteWebhook", "getUpdates", "sendMessage", "editMessageText", "sendDocument")
+
+
+def message_update(update_id: int, text: str) -> dict:
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "text": text,
+        "chat": {"id": CHAT_ID, "type": "private"},
+        "from": {"id": CHAT_ID, "is_bot": False, "first_name": "user"},
+    }}
+
+
+def parse_form(request: HttpRequest) -> Tuple[Dict[str, str], Dict[str, Tuple[str, bytes]]]:
+    """Параметры запроса и файлы {поле: (имя файла, данные)}"""
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith("multipart/form-data"):
+        # Без файлов python-telegram-bot отправляет параметры обычной формой
+        return dict(parse_qsl(request.body.decode())), {}
+
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + request.body)
+    fields, files = {}, {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        data = part.get_payload(decode=True)
+        if part.get_filename() is not None:
+            files[name] = (part.get_filename(), data)
+        else:
+            fields[name] = data.decode()
+    return fields, files
+
+
+class FakeBotApi:
+    """
+    Поддельный Bot API
+
+    Вызовы (метод, параметры) попадают в очередь calls, загруженные файлы - в
+    documents. getUpdates отдает обновления из очереди updates (long polling).
+    fail(method, number) - number-й вызов метода завершится ошибкой Telegram.
+    """
+
+    def __init__(self):
+        self.calls: asyncio.Queue = asyncio.Queue()
+        self.updates: asyncio.Queue = asyncio.Queue()
+        self.documents: List[Tuple[str, bytes]] = []
+        self.server = HttpServer("127.0.0.1", 0)
+        self._counts: Dict[str, int] = {}
+        self._failures: Dict[str, int] = {}
+        self._message_ids = 1
+        for method in METHODS:
+            self.server.route("POST", f"/bot{TOKEN}/{method}", self._handler(method))
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.port}"
+
+    def builder(self) -> ApplicationBuilder:
+        """Application.builder(), направленный на этот сервер"""
+        return (Application.builder().token(TOKEN)
+                .base_url(f"{self.url}/bot").base_file_url(f"{self.url}/file/bot"))
+
+    def fail(self, method: str, number: int) -> None:
+        self._failures[method] = number
+
+    async def next_call(self, timeout: float = 5.0) -> Tuple[str, Dict[str, str]]:
+        """Следующий вызов, кроме служебных getMe, getUpdates и deleteWebhook"""
+        while True:
+            method, data = await asyncio.wait_for(self.calls.get(), timeout)
+            if method not in ("getMe", "getUpdates", "deleteWebhook"):
+                return method, data
+
+    def _handler(self, method: str):
+        async def handle(request: HttpRequest) -> HttpResponse:
+            data, files = parse_form(request)
+            count = self._counts[method] = self._counts.get(method, 0) + 1
+            if self._failures.get(method) == count:
+                return self._response(500, {"ok": False, "error_code": 500, "description": "Internal Server Error"})
+            if method == "getUpdates":
+                return self._response(200, {"ok": True, "result": await self._get_updates(data)})
+
+            await self.calls.put((method, data))
+            return self._response(200, {"ok": True, "result": self._result(method, data, files)})
+        return handle
+
+    async def _get_updates(self, data: Dict[str, str]) -> List[dict]:
+        try:
+            updates = [await asyncio.wait_for(self.updates.get(), float(data.get("timeout", 0)) or 0.01)]
+        except asyncio.TimeoutError:
+            return []
+        while not self.updates.empty():
+            updates.append(self.updates.get_nowait())
+        return updates
+
+    def _result(self, method: str, data: Dict[str, str], files: Dict[str, Tuple[str, bytes]]) -> Any:
+        if method == "getMe":
+            return {"id": 123, "is_bot": True, "first_name": "bot", "username": "test_bot"}
+        if method not in ("sendMessage", "editMessageText", "sendDocument"):
+            return True
+
+        self._message_ids += 1
+        message = {"message_id": self._message_ids, "date": 0,
+                   "chat": {"id": int(data["chat_id"]), "type": "private"}}
+        if method == "sendDocument":
+            filename, content = files["document"]
+            self.documents.append((filename, content))
+            message["document"] = {"file_id": f"file{self._message_ids}", "file_unique_id": f"u{self._message_ids}",
+                                   "file_name": filename, "file_size": len(content)}
+        else:
+            message["text"] = data["text"]
+        return message
+
+    @staticmethod
+    def _response(status: int, body: dict) -> HttpResponse:
+        return HttpResponse(status, json.dumps(body).encode(), "application/json")
@@ -0,0 +1,79 @@
+"""
+Поиск действий по callback_data: префикс и аргумент разделены ARG_SEPARATOR
+"""
+
+import pytest
+
+from actions import MAX_ARGUMENT_SIZE, MAX_CALLBACK_DATA, Action, ActionRegistry, callback_data
+from agent_hub import parse_agents
+from macros import parse_macro
+from wake_on_lan import WakeHost, WakeHostRegistry
+
+
+def make_registry() -> ActionRegistry:
+    registry = ActionRegistry()
+    for action in (
+        Action("screenshot_window", lambda: "window"),
+        Action("screenshot_window", lambda hwnd: hwnd, prefix=True),
+        Action("macro", lambda name: name, prefix=True),
+        Action("macro_run", lambda name: name, prefix=True),
+        Action("confirm", lambda data: data, prefix=True),
+    ):
+        registry.register(action)
+    return registry
+
+
+def test_macro_name_with_prefix_of_other_action():
+    registry = make_registry()
+
+    action, arg = registry.resolve(callback_data("macro", "run_x"))
+    assert (action.key, arg) == ("macro", "run_x")
+
+    action, arg = registry.resolve(callback_data("macro_run", "x"))
+    assert (action.key, arg) == ("macro_run", "x")
+
+
+def test_exact_and_prefix_with_same_key():
+    registry = make_registry()
+
+    action, arg = registry.resolve("screenshot_window")
+    assert (action.key, action.prefix, arg) == ("screenshot_window", False, None)
+
+    action, arg = registry.resolve(callback_data("screenshot_window", 123))
+    assert (action.key, action.prefix, arg) == ("screenshot_window", True, "123")
+
+
+def test_argument_keeps_separator():
+    registry = make_registry()
+
+    action, arg = registry.resolve(callback_data("confirm", callback_data("macro_run", "x")))
+    assert (action.key, arg) == ("confirm", "macro_run:x")
+    assert registry.resolve(arg)[0].key == "macro_run"
+
+
+def test_unknown_data():
+    registry = make_registry()
+
+    assert registry.resolve("macro_run_x") is None
+    assert registry.resolve(callback_data("unknown", "x")) is None
+
+
+def test_separator_in_key_rejected():
+    with pytest.raises(ValueError):
+        ActionRegistry().register(Action("bad:key", lambda: "", prefix=True))
+
+
+def test_long_names_rejected_before_they_reach_buttons(tmp_path):
+    name = "я" * (MAX_ARGUMENT_SIZE // 2)
+    data = callback_data("confirm", callback_data("agent_shutdown", name))
+    assert len(data.encode("utf-8")) <= MAX_CALLBACK_DATA
+
+    too_long = name + "x"
+    with pytest.raises(ValueError):
+        parse_macro(too_long, {"steps": [{"action": "screen_lock"}]})
+    with pytest.raises(ValueError):
+        parse_agents(f"{too_long}=127.0.0.1:8765")
+    with pytest.raises(ValueError):
+        WakeHostRegistry(str(tmp_path / "hosts.json")).add(WakeHost(too_long, "AA:BB:CC:DD:EE:FF"))
+
+    assert parse_macro(name, {"steps": [{"action": "screen_lock"}]}).name == name
@@ -0,0 +1,159 @@
+"""
+Концентратор и агенты на localhost: настоящие процессы agent.py --fake и рукопожатие HMAC
+"""
+
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from agent_hub import AgentConnection, AgentHub
+from agent_protocol import (AGENT, CHALLENGE_SIZE, ERROR, HELLO, AgentError, decode_json, encode_frame, encode_json,
+                            new_challenge, proof, read_frame)
+from conftest import ROOT
+
+TOKEN = "test-token"
+AGENT_NAMES = ("pc1", "pc2", "pc3")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_listening(port: int, process: subprocess.Popen, timeout: float = 15.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Агент завершился с кодом {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), 0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"Агент на порту {port} не запустился")
+
+
+@pytest.fixture(scope="module")
+def agents():
+    """Запускает по процессу агента на каждое имя; возвращает {имя: (адрес, порт)}"""
+    env = dict(os.environ, AGENT_TOKEN=TOKEN, AGENT_LISTEN="127.0.0.1")
+    processes, addresses = [], {}
+    try:
+        for name in AGENT_NAMES:
+            port = free_port()
+            process = subprocess.Popen([sys.executable, "agent.py", "--fake", name, "--port", str(port)],
+                                       cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            processes.append(process)
+            wait_listening(port, process)
+            addresses[name] = ("127.0.0.1", port)
+        yield addresses
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(10)
+
+
+def test_hub_requests_all_agents_concurrently(agents):
+    async def scenario():
+        hub = AgentHub(agents, TOKEN, timeout=10)
+        try:
+            statuses = await hub.request_all("ping")
+            assert {name: status["name"] for name, status in statuses.items()} == {name: name for name in agents}
+
+            # Скриншоты (потоком кадров) и списки процессов всех агентов одновременно
+            calls = [hub.request(name, "screenshot", "full") for name in agents]
+            calls += [hub.request(name, "processes", 5) for name in agents]
+            results = await asyncio.gather(*calls)
+            for name, (data, meta) in zip(agents, results[:len(agents)]):
+                assert len(data) == meta["size"] == 512 * 1024
+                assert meta["message"] == f"Скриншот {name}"
+            for name, processes in zip(agents, results[len(agents):]):
+                assert [proc["name"] for proc in processes] == [f"{name}-{i}.exe" for i in range(5)]
+        finally:
+            await hub.close()
+
+    asyncio.run(scenario())
+
+
+def test_agent_rejects_wrong_token(agents):
+    async def scenario():
+        host, port = agents["pc1"]
+        connection = AgentConnection("pc1", host, port, "wrong-token")
+        try:
+            with pytest.raises(ConnectionError):
+                await connection.request("ping")
+        finally:
+            await connection.close()
+
+    asyncio.run(scenario())
+
+
+def test_hub_rejects_agent_without_token():
+    """Поддельный агент не знает токена: бот не принимает его, а сам токен по сети не уходит"""
+    received = bytearray()
+
+    async def impostor(reader, writer):
+        writer.write(encode_frame(HELLO, 0, new_challenge()))
+        await writer.drain()
+        _, _, payload = await read_frame(reader)
+        received.extend(payload)
+        writer.write(encode_json(HELLO, 0, {"name": "impostor", "proof": "00" * 32}))
+        await writer.drain()
+
+    async def scenario():
+        server = await asyncio.start_server(impostor, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        connection = AgentConnection("impostor", "127.0.0.1", port, TOKEN)
+        try:
+            with pytest.raises(ConnectionError, match="не подтвердил токен"):
+                await connection.request("ping")
+        finally:
+            await connection.close()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(scenario())
+    assert len(received) == CHALLENGE_SIZE + 32
+    assert TOKEN.encode() not in received
+
+
+def test_error_frames_without_json():
+    """Пустой кадр ERROR - ошибка этого запроса, а испорченный JSON закрывает соединение"""
+    async def agent(reader, writer):
+        challenge = new_challenge()
+        writer.write(encode_frame(HELLO, 0, challenge))
+        await writer.drain()
+        _, _, payload = await read_frame(reader)
+        client_challenge = payload[:CHALLENGE_SIZE]
+        writer.write(encode_json(HELLO, 0, {"name": "broken",
+                                            "proof": proof(TOKEN, AGENT, client_challenge, challenge).hex()}))
+        while True:
+            _, request_id, payload = await read_frame(reader)
+            body = b"" if decode_json(payload)["op"] == "ping" else b"{not json"
+            writer.write(encode_frame(ERROR, request_id, body))
+            await writer.drain()
+
+    async def scenario():
+        server = await asyncio.start_server(agent, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        connection = AgentConnection("broken", "127.0.0.1", port, TOKEN, timeout=5)
+        try:
+            with pytest.raises(AgentError, match="ошибка агента"):
+                await connection.request("ping")
+            assert connection.connected
+
+            with pytest.raises(ConnectionError, match="Некорректный JSON"):
+                await connection.request("processes")
+        finally:
+            await connection.close()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(scenario())
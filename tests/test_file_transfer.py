@@ -0,0 +1,141 @@
+"""
+Передача файлов частями в поддельный Bot API: нумерация частей, склейка gzip,
+продолжение после ошибки отправки и проверка, что файл не изменился
+"""
+
+import asyncio
+import gzip
+import os
+import random
+
+import pytest
+from telegram import Bot
+from telegram.error import TelegramError
+
+from fake_bot_api import CHAT_ID, TOKEN, FakeBotApi
+from file_transfer import KB, Transfer, TransferStore, check_unchanged, run_transfer
+
+PART_SIZE = 128 * KB
+
+
+def write_log(path, lines: int = 40000) -> bytes:
+    """Текст, который сжимается, но не в одну часть"""
+    rng = random.Random(1)
+    data = "".join(f"{i} INFO запрос {rng.getrandbits(32):08x} обработан за {rng.random():.3f} с\n"
+                   for i in range(lines)).encode()
+    path.write_bytes(data)
+    return data
+
+
+async def with_api(scenario):
+    """Запускает scenario(api, send) с Bot, направленным в поддельный Bot API"""
+    api = FakeBotApi()
+    await api.server.start()
+    bot = Bot(TOKEN, base_url=f"{api.url}/bot", base_file_url=f"{api.url}/file/bot")
+
+    async def send(data: bytes, filename: str, transfer: Transfer) -> None:
+        await bot.send_document(CHAT_ID, document=data, filename=filename)
+
+    try:
+        async with bot:
+            return await scenario(api, send)
+    finally:
+        await api.server.stop()
+
+
+def test_parts_are_numbered_and_join_into_gzip(tmp_path):
+    source = write_log(tmp_path / "log.txt")
+    store = TransferStore(str(tmp_path / "transfers.json"))
+
+    async def scenario(api, send):
+        transfer = store.create(str(tmp_path / "log.txt"), PART_SIZE, user_id=7)
+        assert transfer.compress
+        finished = await run_transfer(transfer, store, send)
+        return finished, api.documents
+
+    finished, documents = asyncio.run(with_api(scenario))
+
+    names = [name for name, _ in documents]
+    assert len(names) > 2
+    assert names == [f"log.txt.gz.{part:03d}" for part in range(1, len(names) + 1)]
+    assert all(len(data) <= PART_SIZE for _, data in documents)
+    assert finished.done and finished.part == len(names) + 1
+    assert finished.join_hint().startswith("copy /b log.txt.gz.001+log.txt.gz.002+")
+    # Части - отдельные gzip-блоки: склеенные, они дают обычный .gz
+    assert gzip.decompress(b"".join(data for _, data in documents)) == source
+    assert store.all() == []
+
+
+def test_small_file_sent_without_part_number(tmp_path):
+    (tmp_path / "photo.jpg").write_bytes(os.urandom(10 * KB))
+    store = TransferStore(str(tmp_path / "transfers.json"))
+
+    async def scenario(api, send):
+        await run_transfer(store.create(str(tmp_path / "photo.jpg"), PART_SIZE), store, send)
+        return api.documents
+
+    [(name, data)] = asyncio.run(with_api(scenario))
+    assert name == "photo.jpg"
+    assert data == (tmp_path / "photo.jpg").read_bytes()
+
+
+def test_resume_after_failed_send(tmp_path):
+    source = write_log(tmp_path / "log.txt")
+    path = str(tmp_path / "transfers.json")
+
+    async def scenario(api, send):
+        transfer = TransferStore(path).create(str(tmp_path / "log.txt"), PART_SIZE, user_id=7)
+        api.fail("sendDocument", 3)
+        with pytest.raises(TelegramError):
+            await run_transfer(transfer, TransferStore(path), send)
+
+        # Бот перезапущен: состояние читается из файла, продолжить может только владелец
+        store = TransferStore(path)
+        assert store.get(transfer.id, user_id=8) is None
+        saved = store.get(transfer.id, user_id=7)
+        assert (saved.part, len(api.documents)) == (3, 2)
+        assert 0 < saved.offset < saved.size
+        assert check_unchanged(saved)
+
+        await run_transfer(saved, store, send)
+        return api.documents
+
+    documents = asyncio.run(with_api(scenario))
+    assert [name for name, _ in documents][:4] == [f"log.txt.gz.{part:03d}" for part in range(1, 5)]
+    assert gzip.decompress(b"".join(data for _, data in documents)) == source
+
+
+def test_check_unchanged_rejects_modified_file(tmp_path):
+    log = tmp_path / "log.txt"
+    write_log(log, lines=100)
+    transfer = TransferStore(str(tmp_path / "transfers.json")).create(str(log), PART_SIZE)
+    assert check_unchanged(transfer)
+
+    # Тот же размер, но другое время изменения
+    stat = os.stat(log)
+    os.utime(log, (stat.st_atime, stat.st_mtime + 10))
+    assert not check_unchanged(transfer)
+
+    with open(log, "ab") as f:
+        f.write(b"new line\n")
+    assert not check_unchanged(transfer._replace(mtime=os.stat(log).st_mtime))
+
+    os.remove(log)
+    assert not check_unchanged(transfer)
+
+
+def test_empty_file_refused(tmp_path):
+    empty = tmp_path / "empty.txt"
+    empty.write_bytes(b"")
+    store = TransferStore(str(tmp_path / "transfers.json"))
+
+    with pytest.raises(ValueError, match="пуст"):
+        store.create(str(empty), PART_SIZE)
+    assert store.all() == []
+
+    async def send(data, filename, transfer):
+        raise AssertionError("пустой файл не должен отправляться")
+
+    transfer = Transfer("id", str(empty), 0, os.stat(empty).st_mtime, False, PART_SIZE)
+    with pytest.raises(ValueError, match="пуст"):
+        asyncio.run(run_transfer(transfer, store, send))
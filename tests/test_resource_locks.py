@@ -0,0 +1,88 @@
+"""
+Нагрузочная проверка блокировок ресурсов: задержка меню (p99) при одновременных скриншотах
+
+Скриншот здесь - блокирующая функция в пуле потоков на SCREENSHOT_SECONDS, меню -
+мгновенная корутина без блокировок. Сравниваются три случая: меню без
+скриншотов, меню вместе со скриншотами при блокировках по ресурсам и то же
+с одной общей блокировкой на все действия (так вела себя обработка обновлений
+по одному).
+"""
+
+import asyncio
+import math
+import threading
+import time
+from typing import List
+
+from actions import THREAD, Action, ActionRegistry
+from resource_locks import SCREEN, ResourceLocks
+
+SCREENSHOT_SECONDS = 0.2
+SCREENSHOTS = 4
+MENU_REQUESTS = 60
+MENU_INTERVAL = 0.01
+
+
+def p99(values: List[float]) -> float:
+    return sorted(values)[math.ceil(len(values) * 0.99) - 1]
+
+
+class Screen:
+    """Поддельный захват экрана, запоминает наибольшее число одновременных захватов"""
+
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def capture(self) -> str:
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(SCREENSHOT_SECONDS)
+        with self._lock:
+            self.active -= 1
+        return "✅ Скриншот"
+
+
+async def open_menu() -> str:
+    return "✅ Меню"
+
+
+def run_load(screenshots: int, global_lock: bool = False):
+    """Задержки меню (с) под нагрузкой скриншотами и наибольшее число одновременных захватов"""
+    screen = Screen()
+    registry = ActionRegistry(ResourceLocks())
+    shared = ("all",) if global_lock else ()
+    screenshot = registry.register(Action("screenshot", screen.capture, mode=THREAD, locks=shared or (SCREEN,)))
+    menu = registry.register(Action("menu", open_menu, locks=shared))
+
+    async def scenario() -> List[float]:
+        shots = [asyncio.create_task(registry.run(screenshot)) for _ in range(screenshots)]
+        await asyncio.sleep(0)  # Скриншоты начинаются раньше первого меню
+        latencies = []
+        for _ in range(MENU_REQUESTS):
+            started = time.perf_counter()
+            assert await registry.run(menu) == "✅ Меню"
+            latencies.append(time.perf_counter() - started)
+            await asyncio.sleep(MENU_INTERVAL)
+        await asyncio.gather(*shots)
+        return latencies
+
+    return asyncio.run(scenario()), screen.max_active
+
+
+def test_menu_p99_unaffected_by_concurrent_screenshots():
+    baseline, _ = run_load(screenshots=0)
+    locked, max_active = run_load(screenshots=SCREENSHOTS)
+    serialized, _ = run_load(screenshots=SCREENSHOTS, global_lock=True)
+    print(f"\np99 меню: без скриншотов {p99(baseline) * 1000:.2f} мс, "
+          f"блокировки по ресурсам {p99(locked) * 1000:.2f} мс, "
+          f"общая блокировка {p99(serialized) * 1000:.2f} мс")
+
+    # Меню не ждет скриншотов: задержка на порядок меньше одного захвата экрана
+    assert p99(locked) < SCREENSHOT_SECONDS / 10
+    # Без блокировок по ресурсам меню стоит в очереди за скриншотами
+    assert p99(serialized) > SCREENSHOT_SECONDS / 2
+    # Скриншоты при этом друг с другом не пересекаются
+    assert max_active == 1
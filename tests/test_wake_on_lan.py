@@ -0,0 +1,127 @@
+"""
+Wake-on-LAN на localhost: magic packet принимают UDP сокеты на 127.0.0.1, включение
+проверяется TCP серверами, запущенными только для части компьютеров
+"""
+
+import asyncio
+import socket
+import time
+from typing import List, Tuple
+
+import pytest
+
+from wake_on_lan import WakeHost, WakeOnLan, magic_packet
+
+MAC = "AA:BB:CC:DD:EE:FF"
+
+
+class PacketListener(asyncio.DatagramProtocol):
+    """UDP сокет на 127.0.0.1, запоминающий принятые пакеты"""
+
+    def __init__(self):
+        self.packets: List[bytes] = []
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        self.packets.append(data)
+
+
+async def listen_udp() -> Tuple[asyncio.DatagramTransport, PacketListener, int]:
+    transport, listener = await asyncio.get_running_loop().create_datagram_endpoint(
+        PacketListener, local_addr=("127.0.0.1", 0))
+    return transport, listener, transport.get_extra_info("sockname")[1]
+
+
+def silent_port() -> Tuple[int, List[socket.socket]]:
+    """
+    TCP порт на 127.0.0.1, который не отвечает: очередь подключений заполнена,
+    и новые SYN отбрасываются. Закрытый порт не подходит - отказ в подключении
+    означает, что система работает. Возвращает порт и сокеты, которые нужно закрыть.
+    """
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(0)
+    port = server.getsockname()[1]
+    sockets = [server]
+    while True:
+        client = socket.socket()
+        client.settimeout(0.2)
+        sockets.append(client)
+        try:
+            client.connect(("127.0.0.1", port))
+        except socket.timeout:
+            return port, sockets
+
+
+def test_magic_packet():
+    packet = magic_packet(MAC)
+    assert len(packet) == 102
+    assert packet == b"\xff" * 6 + bytes.fromhex("aabbccddeeff") * 16
+    assert magic_packet("aa-bb-cc-dd-ee-ff") == magic_packet("aabb.ccdd.eeff") == packet
+
+    with pytest.raises(ValueError):
+        magic_packet("AA:BB:CC:DD:EE")
+
+
+def test_packets_repeated_retries_times():
+    async def scenario():
+        transport, listener, port = await listen_udp()
+        try:
+            wol = WakeOnLan(retries=4, retry_interval=0.02)
+            [result] = await wol.wake([WakeHost("pc", MAC, "127.0.0.1", port)])
+            await asyncio.sleep(0.05)
+        finally:
+            transport.close()
+        return result, listener.packets
+
+    result, packets = asyncio.run(scenario())
+    assert result.packets == 4 and result.up is None and result.error is None
+    assert packets == [magic_packet(MAC)] * 4
+
+
+def test_many_hosts_wait_one_deadline():
+    hosts_count = 8
+    deadline = 0.5
+
+    async def scenario():
+        udp = [await listen_udp() for _ in range(hosts_count)]
+        silent, silent_sockets = silent_port()
+        servers = []
+        hosts = []
+        for index, (_, _, udp_port) in enumerate(udp):
+            mac = f"00:11:22:33:44:{index:02x}"
+            if index % 2 == 0:
+                server = await asyncio.start_server(lambda reader, writer: writer.close(), "127.0.0.1", 0)
+                servers.append(server)
+                probe = ("127.0.0.1", server.sockets[0].getsockname()[1])
+            else:
+                probe = ("127.0.0.1", silent)
+            hosts.append(WakeHost(f"pc{index}", mac, "127.0.0.1", udp_port, *probe))
+
+        wol = WakeOnLan(retries=5, retry_interval=0.05, probe_interval=0.05, probe_timeout=0.1, deadline=deadline)
+        started = time.monotonic()
+        try:
+            results = await wol.wake(hosts)
+            elapsed = time.monotonic() - started
+            await asyncio.sleep(0.05)
+        finally:
+            for transport, _, _ in udp:
+                transport.close()
+            for server in servers:
+                server.close()
+                await server.wait_closed()
+            for sock in silent_sockets:
+                sock.close()
+        return results, [listener.packets for _, listener, _ in udp], elapsed
+
+    results, packets, elapsed = asyncio.run(scenario())
+    print(f"\n{hosts_count} компьютеров, deadline {deadline} с: {elapsed:.2f} с")
+
+    assert [result.up for result in results] == [index % 2 == 0 for index in range(hosts_count)]
+    for result, received in zip(results, packets):
+        assert received == [magic_packet(result.host.mac)] * result.packets
+        if result.up:
+            assert result.packets < 5  # Ответившему компьютеру пакеты больше не повторяются
+        else:
+            assert result.packets == 5
+    # Компьютеры ждутся параллельно: около одного deadline, а не hosts_count
+    assert deadline <= elapsed < deadline * 2
@@ -0,0 +1,141 @@
+"""
+Webhook от начала до конца: обновления приходят по HTTP в WebhookServer, ответы
+бота уходят в поддельный Bot API на localhost (как TELEGRAM_API_URL в .env).
+Замер сравнивает задержку "команда - ответ" при webhook и при long polling.
+"""
+
+import asyncio
+import json
+import statistics
+import time
+from typing import Awaitable, Callable, List
+
+from telegram import Update
+from telegram.ext import ContextTypes, MessageHandler, filters
+
+from fake_bot_api import FakeBotApi, message_update
+from webhook import SECRET_HEADER, WebhookServer
+
+SECRET = "webhook-secret"
+
+
+async def post(port: int, path: str, body: bytes, secret: str = SECRET) -> int:
+    """POST на webhook, возвращает код ответа"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n{SECRET_HEADER}: {secret}\r\nConnection: close\r\n\r\n".encode()
+                 + body)
+    await writer.drain()
+    status_line = await reader.readline()
+    writer.close()
+    return int(status_line.split()[1])
+
+
+async def echo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await update.message.reply_text(f"эхо: {update.message.text}")
+
+
+def test_webhook_delivers_updates_to_handlers():
+    async def scenario():
+        api = FakeBotApi()
+        await api.server.start()
+        application = api.builder().updater(None).build()
+        application.add_handler(MessageHandler(filters.TEXT, echo))
+        webhook = WebhookServer(application, "https://example.com/hook", "127.0.0.1", 0, secret_token=SECRET)
+        try:
+            await application.initialize()
+            await application.start()
+            await webhook.start()
+            method, data = await api.next_call()
+            assert (method, data["url"], data["secret_token"]) == ("setWebhook", "https://example.com/hook", SECRET)
+
+            port = webhook.server.port
+            assert await post(port, "/hook", json.dumps(message_update(1, "привет")).encode()) == 200
+            method, data = await api.next_call()
+            assert (method, data["chat_id"], data["text"]) == ("sendMessage", "42", "эхо: привет")
+
+            # Неверный секрет, некорректный JSON и JSON не-объект отклоняются без вызова обработчиков
+            assert await post(port, "/hook", json.dumps(message_update(2, "x")).encode(), "wrong") == 403
+            assert await post(port, "/hook", b"{not json") == 400
+            assert await post(port, "/hook", b"[1, 2]") == 400
+            assert await post(port, "/hook", b"42") == 400
+            await asyncio.sleep(0.2)
+            assert api.calls.empty()
+        finally:
+            await webhook.stop()
+            if application.running:
+                await application.stop()
+            await application.shutdown()
+            await api.server.stop()
+
+    asyncio.run(scenario())
+
+
+COMMANDS = 30
+
+
+async def measure(api: FakeBotApi, deliver: Callable[[dict], Awaitable[None]]) -> List[float]:
+    """Задержки от отправки команды до вызова sendMessage с ответом, в секундах"""
+    latencies = []
+    for update_id in range(1, COMMANDS + 1):
+        started = time.perf_counter()
+        await deliver(message_update(update_id, f"/status {update_id}"))
+        method, data = await api.next_call()
+        latencies.append(time.perf_counter() - started)
+        assert (method, data["text"]) == ("sendMessage", f"эхо: /status {update_id}")
+    return latencies
+
+
+def describe(latencies: List[float]) -> str:
+    ordered = sorted(latencies)
+    return (f"медиана {statistics.median(ordered) * 1000:.1f} мс, "
+            f"p95 {ordered[int(len(ordered) * 0.95) - 1] * 1000:.1f} мс")
+
+
+def test_command_latency_webhook_vs_polling():
+    async def polling() -> List[float]:
+        api = FakeBotApi()
+        await api.server.start()
+        application = api.builder().build()
+        application.add_handler(MessageHandler(filters.TEXT, echo))
+        try:
+            await application.initialize()
+            await application.start()
+            await application.updater.start_polling(timeout=2)
+            return await measure(api, api.updates.put)
+        finally:
+            if application.updater.running:
+                await application.updater.stop()
+            if application.running:
+                await application.stop()
+            await application.shutdown()
+            await api.server.stop()
+
+    async def webhook() -> List[float]:
+        api = FakeBotApi()
+        await api.server.start()
+        application = api.builder().updater(None).build()
+        application.add_handler(MessageHandler(filters.TEXT, echo))
+        server = WebhookServer(application, "https://example.com/hook", "127.0.0.1", 0, secret_token=SECRET)
+
+        async def deliver(update: dict) -> None:
+            assert await post(server.server.port, "/hook", json.dumps(update).encode()) == 200
+
+        try:
+            await application.initialize()
+            await application.start()
+            await server.start()
+            assert (await api.next_call())[0] == "setWebhook"
+            return await measure(api, deliver)
+        finally:
+            await server.stop()
+            if application.running:
+                await application.stop()
+            await application.shutdown()
+            await api.server.stop()
+
+    polling_latencies = asyncio.run(polling())
+    webhook_latencies = asyncio.run(webhook())
+    print(f"\n{COMMANDS} команд, ответ через поддельный Bot API на localhost:"
+          f"\n  polling: {describe(polling_latencies)}\n  webhook: {describe(webhook_latencies)}")
+    assert len(polling_latencies) == len(webhook_latencies) == COMMANDS
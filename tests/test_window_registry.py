@@ -0,0 +1,129 @@
+"""
+Реестр окон на FakeWindowBackend: кэш, инкрементальное обновление, повторное
+использование PID и замер перечисления окон
+"""
+
+import time
+
+from window_registry import FakeWindowBackend, WindowRegistry
+
+
+def make_backend() -> FakeWindowBackend:
+    backend = FakeWindowBackend()
+    backend.start_process(100, "editor.exe")
+    backend.start_process(200, "browser.exe")
+    backend.open_window(1, "Документ", 100)
+    backend.open_window(2, "Вкладка 1", 200)
+    backend.open_window(3, "Вкладка 2", 200)
+    return backend
+
+
+def listing(registry: WindowRegistry, max_age=None):
+    return [(int(window['hwnd']), window['title'], window['process'])
+            for window in registry.get_windows(max_age)]
+
+
+def test_cache_hit_skips_backend():
+    backend = make_backend()
+    registry = WindowRegistry(backend, max_age=60)
+
+    first = listing(registry)
+    calls = backend.identity_calls
+    assert first == [(1, "Документ", "editor.exe"), (2, "Вкладка 1", "browser.exe"),
+                     (3, "Вкладка 2", "browser.exe")]
+    assert calls == 2  # По одному запросу на процесс, а не на окно
+
+    backend.open_window(4, "Новое окно", 100)
+    assert listing(registry) == first  # Кэш еще свежий - бэкенд не опрашивается
+    assert backend.identity_calls == calls
+    assert registry.stats()["hits"] == 1 and registry.stats()["refreshes"] == 1
+
+
+def test_refresh_only_touches_new_and_closed_windows():
+    backend = make_backend()
+    registry = WindowRegistry(backend)
+    registry.refresh()
+    calls = backend.identity_calls
+
+    # Без изменений процессы не запрашиваются вовсе, заголовки обновляются
+    backend.open_window(1, "Документ *", 100)
+    registry.refresh()
+    assert backend.identity_calls == calls
+    assert listing(registry, max_age=60)[0] == (1, "Документ *", "editor.exe")
+
+    # Новое окно нового процесса - один запрос, закрытое окно просто исчезает
+    backend.start_process(300, "player.exe")
+    backend.open_window(5, "Плеер", 300)
+    backend.close_window(2)
+    registry.refresh()
+    assert backend.identity_calls == calls + 1
+    assert listing(registry, max_age=60) == [(1, "Документ *", "editor.exe"), (3, "Вкладка 2", "browser.exe"),
+                                             (5, "Плеер", "player.exe")]
+
+    # Процесс без окон забывается
+    backend.stop_process(300)
+    registry.refresh()
+    assert registry.stats() == {"windows": 2, "processes": 2, "hits": 2, "refreshes": 4}
+
+
+def test_reused_pid_refreshes_process_name():
+    backend = make_backend()
+    registry = WindowRegistry(backend)
+    registry.refresh()
+
+    # editor.exe завершился, его PID достался новому процессу с новым окном;
+    # реестр помнит старое имя, но время создания процесса уже другое
+    backend.stop_process(100)
+    backend.start_process(100, "game.exe")
+    backend.open_window(6, "Игра", 100)
+    registry.refresh()
+
+    assert listing(registry, max_age=60) == [(2, "Вкладка 1", "browser.exe"), (3, "Вкладка 2", "browser.exe"),
+                                             (6, "Игра", "game.exe")]
+
+
+def test_invalidate_forces_refresh():
+    backend = make_backend()
+    registry = WindowRegistry(backend, max_age=60)
+    registry.get_windows()
+
+    backend.close_window(1)
+    assert len(registry.get_windows()) == 3
+    registry.invalidate()
+    assert [hwnd for hwnd, _, _ in listing(registry)] == [2, 3]
+    assert registry.stats()["refreshes"] == 2
+
+
+def test_enumeration_benchmark():
+    """Полное перечисление против инкрементального при 1% изменившихся окон"""
+    processes, windows, rounds = 200, 1000, 50
+    backend = FakeWindowBackend()
+    for pid in range(processes):
+        backend.start_process(pid, f"app{pid}.exe")
+    for hwnd in range(windows):
+        backend.open_window(hwnd, f"Окно {hwnd}", hwnd % processes)
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        WindowRegistry(backend).refresh()
+    cold = (time.perf_counter() - started) / rounds
+    cold_calls = backend.identity_calls / rounds
+
+    registry = WindowRegistry(backend)
+    registry.refresh()
+    backend.identity_calls = 0
+    next_hwnd = windows
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for _ in range(windows // 100):
+            backend.close_window(min(backend.windows))
+            backend.open_window(next_hwnd, f"Окно {next_hwnd}", next_hwnd % processes)
+            next_hwnd += 1
+        registry.refresh()
+    warm = (time.perf_counter() - started) / rounds
+    warm_calls = backend.identity_calls / rounds
+
+    print(f"\n{windows} окон, {processes} процессов: полное обновление {cold * 1000:.2f} мс, "
+          f"{cold_calls:.0f} запросов процессов; инкрементальное {warm * 1000:.2f} мс, {warm_calls:.0f} запросов")
+    assert cold_calls == processes
+    assert warm_calls <= windows // 100
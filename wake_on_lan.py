@@ -0,0 +1,219 @@
+"""
+Wake-on-LAN: реестр компьютеров, параллельная отправка magic packet и проверка включения
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import socket
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from actions import check_argument
+from metrics import operation_errors, operation_seconds
+
+logger = logging.getLogger(__name__)
+
+MAC_PATTERN = re.compile(r"^[0-9a-fA-F]{12}$")
+
+
+class WakeHost(NamedTuple):
+    """Компьютер, который можно разбудить"""
+    name: str
+    mac: str
+    broadcast: str = "255.255.255.255"
+    port: int = 9
+    probe_host: Optional[str] = None  # адрес для проверки включения; None - не проверять
+    probe_port: int = 3389            # любой TCP порт, на котором компьютер отвечает (RDP, SSH, SMB)
+
+
+class WakeResult(NamedTuple):
+    """Итог пробуждения одного компьютера"""
+    host: WakeHost
+    packets: int
+    up: Optional[bool]  # None - адрес проверки не задан
+    elapsed: float
+    error: Optional[str] = None
+
+    def describe(self) -> str:
+        if self.error:
+            return f"❌ {self.host.name} - {self.error}"
+        if self.up is None:
+            return f"📨 {self.host.name} - отправлено пакетов: {self.packets} (проверка не настроена)"
+        if self.up:
+            return f"✅ {self.host.name} - в сети через {self.elapsed:.1f} с"
+        return f"❌ {self.host.name} - не ответил за {self.elapsed:.0f} с"
+
+
+def magic_packet(mac: str) -> bytes:
+    """Magic packet: 6 байт 0xFF и 16 повторов MAC адреса"""
+    digits = re.sub(r"[:\-.\s]", "", mac)
+    if not MAC_PATTERN.match(digits):
+        raise ValueError(f"Некорректный MAC адрес: {mac}")
+    return b"\xff" * 6 + bytes.fromhex(digits) * 16
+
+
+class WakeHostRegistry:
+    """
+    Реестр компьютеров в JSON файле
+
+        {"office-pc": {"mac": "AA:BB:CC:DD:EE:FF", "broadcast": "192.168.1.255",
+                       "probe_host": "192.168.1.20", "probe_port": 3389}}
+
+    Файл читается заново, только если изменилось время его модификации.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._hosts: Dict[str, WakeHost] = {}
+        self._mtime: Optional[float] = None
+
+    def _load(self) -> None:
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            self._hosts, self._mtime = {}, None
+            return
+        if mtime == self._mtime:
+            return
+
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        hosts = {}
+        for name, fields in data.items():
+            host = WakeHost(name=name, **fields)
+            magic_packet(host.mac)  # Проверяем MAC и имя сразу, а не в момент пробуждения
+            check_argument(host.name, "Имя компьютера")
+            hosts[name] = host
+        self._hosts, self._mtime = hosts, mtime
+
+    def _save(self) -> None:
+        data = {name: {key: value for key, value in host._asdict().items() if key != "name"}
+                for name, host in self._hosts.items()}
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        self._mtime = os.path.getmtime(self.path)
+
+    def all(self) -> List[WakeHost]:
+        self._load()
+        return list(self._hosts.values())
+
+    def get(self, name: str) -> Optional[WakeHost]:
+        self._load()
+        return self._hosts.get(name)
+
+    def add(self, host: WakeHost) -> None:
+        magic_packet(host.mac)
+        check_argument(host.name, "Имя компьютера")
+        self._load()
+        self._hosts[host.name] = host
+        self._save()
+
+    def remove(self, name: str) -> bool:
+        self._load()
+        if self._hosts.pop(name, None) is None:
+            return False
+        self._save()
+        return True
+
+
+class WakeOnLan:
+    """
+    Пробуждение компьютеров
+
+    Все magic packet отправляются через один UDP сокет; каждому компьютеру
+    пакет повторяется retries раз с интервалом retry_interval, пока он не
+    ответит. Включение проверяется TCP подключением к probe_host:probe_port:
+    успешное подключение или отказ (RST) означают, что система уже работает.
+    Компьютеры обрабатываются параллельно, поэтому пробуждение любого их числа
+    занимает не дольше одного deadline.
+    """
+
+    def __init__(self, retries: int = 3, retry_interval: float = 1.0, probe_interval: float = 2.0,
+                 probe_timeout: float = 1.0, deadline: float = 120.0):
+        self.retries = retries
+        self.retry_interval = retry_interval
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.deadline = deadline
+
+    async def wake(self, hosts: Iterable[WakeHost], deadline: Optional[float] = None) -> List[WakeResult]:
+        """Будит компьютеры и ждет их включения; результаты в порядке hosts"""
+        hosts = list(hosts)
+        if not hosts:
+            return []
+
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol, family=socket.AF_INET, allow_broadcast=True)
+        try:
+            return list(await asyncio.gather(*(
+                self._wake_host(transport, host, deadline or self.deadline) for host in hosts
+            )))
+        finally:
+            transport.close()
+
+    async def _wake_host(self, transport: asyncio.DatagramTransport, host: WakeHost,
+                         deadline: float) -> WakeResult:
+        started = time.monotonic()
+        try:
+            packet = magic_packet(host.mac)
+        except ValueError as e:
+            return WakeResult(host, 0, None, 0.0, str(e))
+
+        up = asyncio.Event()
+        sender = asyncio.create_task(self._send(transport, host, packet, up))
+        try:
+            if host.probe_host is None:
+                packets = await sender
+                return WakeResult(host, packets, None, time.monotonic() - started)
+
+            try:
+                await asyncio.wait_for(self._wait_up(host, up), deadline)
+            except asyncio.TimeoutError:
+                operation_errors.inc(operation="wol_wake", error="deadline")
+            elapsed = time.monotonic() - started
+            if up.is_set():
+                operation_seconds.observe(elapsed, operation="wol_wake")
+            packets = await sender
+            return WakeResult(host, packets, up.is_set(), elapsed)
+        except OSError as e:
+            operation_errors.inc(operation="wol_wake", error=type(e).__name__)
+            return WakeResult(host, 0, None, time.monotonic() - started, f"ошибка сети: {e}")
+        finally:
+            sender.cancel()
+
+    async def _send(self, transport: asyncio.DatagramTransport, host: WakeHost, packet: bytes,
+                    up: asyncio.Event) -> int:
+        """Отправляет пакеты, пока компьютер не ответил; возвращает их число"""
+        sent = 0
+        for attempt in range(self.retries):
+            if up.is_set():
+                break
+            transport.sendto(packet, (host.broadcast, host.port))
+            sent += 1
+            if attempt + 1 < self.retries:
+                try:
+                    await asyncio.wait_for(up.wait(), self.retry_interval)
+                except asyncio.TimeoutError:
+                    pass
+        return sent
+
+    async def _wait_up(self, host: WakeHost, up: asyncio.Event) -> None:
+        while not await self.probe(host.probe_host, host.probe_port, self.probe_timeout):
+            await asyncio.sleep(self.probe_interval)
+        up.set()
+
+    @staticmethod
+    async def probe(address: str, port: int, timeout: float) -> bool:
+        """True, если на адресе работает система (TCP порт принял или отклонил подключение)"""
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(address, port), timeout)
+        except ConnectionRefusedError:
+            return True
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        return True
@@ -0,0 +1,103 @@
+"""
+Режим webhook: Telegram сам присылает обновления на встроенный HTTP сервер
+
+Используется вместо long polling, если в .env задан WEBHOOK_URL.
+"""
+
+import asyncio
+import hmac
+import json
+import logging
+import secrets
+from typing import List, Optional
+from urllib.parse import urlparse
+
+from telegram import Update
+from telegram.ext import Application
+
+from http_server import HttpRequest, HttpResponse, HttpServer
+from metrics import track
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+
+class WebhookServer:
+    """
+    Прием обновлений Telegram по HTTP
+
+    Запрос принимается только с правильным заголовком
+    X-Telegram-Bot-Api-Secret-Token, обновление кладется в очередь
+    приложения и обрабатывается так же, как при polling.
+    """
+
+    def __init__(self, application: Application, url: str, listen: str = "0.0.0.0", port: int = 8443,
+                 secret_token: Optional[str] = None, allowed_updates: Optional[List[str]] = None):
+        self.application = application
+        self.url = url
+        self.path = urlparse(url).path or "/"
+        # Секрет можно не задавать - тогда он генерируется заново при каждом запуске
+        self.secret_token = secret_token or secrets.token_urlsafe(32)
+        self.allowed_updates = allowed_updates
+        self.server = HttpServer(listen, port)
+        self.server.route("POST", self.path, self._handle_update)
+
+    async def start(self) -> None:
+        await self.server.start()
+        await self.application.bot.set_webhook(
+            url=self.url,
+            secret_token=self.secret_token,
+            allowed_updates=self.allowed_updates,
+        )
+        logger.info(f"Webhook установлен: {self.url}")
+
+    async def stop(self) -> None:
+        await self.server.stop()
+
+    async def _handle_update(self, request: HttpRequest) -> HttpResponse:
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+            logger.warning("Запрос к webhook с неверным секретом отклонен")
+            return HttpResponse(403, b"Forbidden")
+
+        with track("webhook_update"):
+            try:
+                data = json.loads(request.body)
+                # Обновление - JSON объект; массив или число в теле - ошибка клиента, а не сервера
+                if not isinstance(data, dict):
+                    raise ValueError(f"ожидался объект, получен {type(data).__name__}")
+                update = Update.de_json(data, self.application.bot)
+            except (ValueError, TypeError, KeyError) as e:
+                logger.warning(f"Некорректное обновление в webhook: {e}")
+                return HttpResponse(400, b"Bad Request")
+
+            if update is not None:
+                await self.application.update_queue.put(update)
+        return HttpResponse(200, b"")
+
+
+def run_webhook(application: Application, webhook: WebhookServer) -> None:
+    """Запускает приложение в режиме webhook до остановки процесса (Ctrl+C)"""
+
+    async def serve() -> None:
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        await webhook.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await webhook.stop()
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+            await application.shutdown()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        logger.info("Бот остановлен")
@@ -10,12 +10,22 @@
 появится схожая проблема вынесу все значения в конфиг и улучшу логирование.
 """
 
+import http.client
+import queue
+import re
 import subprocess
+import sys
+import threading
 import time
 import socket
+import urllib.parse
+
 import psutil
 
+from outages import OUTAGES_FILE, Outage, append_outage
+
 WIFI_ADAPTER_NAME = 'Беспроводная сеть' # У меня он так называется
+WIFI_LOG_FILE = '/logs/wifi_log.txt'
 
 """Лишняя работа, kill_process() справляется самостоятельно"""
 # def check_process(process_name) -> bool | None:
@@ -51,41 +61,178 @@ def kill_process(process_name) -> bool | None:
         pass
     return True
 
-def check_internet_connection(host="8.8.8.8", port=53, timeout=5):
-    """
-    Проверяет наличие интернет-соединения, пытаясь подключиться к указанному хосту
-    По умолчанию проверяет соединение с dns сервером Google
-    """
+# Цели проверки связи. Проверяются одновременно, достаточно ответа любой из них,
+# поэтому заблокированный или упавший сервер не дает ложного "нет интернета"
+PROBE_TCP_HOSTS = [("8.8.8.8", 53), ("1.1.1.1", 53)]
+PROBE_DNS_NAME = "www.msftconnecttest.com"
+PROBE_HTTP_URL = "http://www.msftconnecttest.com/connecttest.txt"
+PROBE_HTTP_EXPECTED = b"Microsoft Connect Test"
+
+
+def probe_tcp(host, port, timeout):
+    """Проверка TCP подключением; отказ в подключении тоже означает, что узел ответил"""
     try:
-        # Попытка создать сокет-соединение с хостом и портом
-        socket.create_connection((host, port), timeout)
+        socket.create_connection((host, port), timeout).close()
+        return True
+    except ConnectionRefusedError:
         return True
     except OSError:
         return False
 
-def toggle_wifi_adapter(adapter_name, max_retries=10):
+
+def resolve(name, port, timeout):
+    """
+    Разрешение имени со сроком: getaddrinfo не принимает timeout и может висеть
+    десятки секунд, поэтому он идет в отдельном фоновом потоке, который просто
+    бросается, если не успел. Возвращает первый адрес или None
     """
-    Отключает и включает wi-fi адаптер, повторяя попытки, если интернет не появляется
+    result = []
+
+    def lookup():
+        try:
+            result.append(socket.getaddrinfo(name, port, socket.AF_INET, socket.SOCK_STREAM)[0][4][0])
+        except (OSError, IndexError):
+            pass
+
+    thread = threading.Thread(target=lookup, name="probe-dns", daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return result[0] if result else None
+
+
+def probe_dns(name, timeout):
+    """Проверка разрешения имени не дольше timeout секунд"""
+    return resolve(name, 80, timeout) is not None
+
+
+def probe_http(url, timeout):
     """
-    if check_internet_connection():
+    Проверка HTTP запросом к странице проверки подключения Windows.
+    Имя разрешается заранее со сроком, затем запрос идет прямо на адрес:
+    urlopen разрешал бы имя сам, без ограничения по времени
+    """
+    started = time.monotonic()
+    parts = urllib.parse.urlsplit(url)
+    port = parts.port or 80
+    address = resolve(parts.hostname, port, timeout)
+    remaining = timeout - (time.monotonic() - started)
+    if address is None or remaining <= 0:
+        return False
+    connection = http.client.HTTPConnection(address, port, timeout=remaining)
+    try:
+        connection.request("GET", parts.path or "/", headers={"Host": parts.netloc})
+        return PROBE_HTTP_EXPECTED in connection.getresponse().read(256)
+    except (OSError, http.client.HTTPException):
+        return False
+    finally:
+        connection.close()
+
+
+def get_default_gateway():
+    """Основной шлюз из таблицы маршрутов (None, если маршрута по умолчанию нет)"""
+    try:
+        output = subprocess.run(['route', 'print', '-4', '0.0.0.0'], capture_output=True, timeout=5).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = re.search(rb"^\s*0\.0\.0\.0\s+0\.0\.0\.0\s+(\d+\.\d+\.\d+\.\d+)", output, re.MULTILINE)
+    return match.group(1).decode() if match else None
+
+
+def check_internet_connection(timeout=2, gateway=None):
+    """
+    Проверяет наличие сети, одновременно опрашивая несколько целей:
+    TCP к публичным DNS серверам, разрешение имени, HTTP страницу проверки и (если задан) шлюз.
+    Возвращает True при первом успешном ответе, не дожидаясь остальных.
+
+    Ответ шлюза означает, что адаптер и Wi-Fi работают - именно это и чинит модуль,
+    даже если сам провайдер в этот момент недоступен.
+    Каждая проверка идет в своем фоновом потоке: зависшая проверка не занимает общий
+    пул и не задерживает следующие вызовы, ее поток просто бросается по истечении срока.
+    """
+    probes = [(probe_tcp, host, port, timeout) for host, port in PROBE_TCP_HOSTS]
+    probes.append((probe_dns, PROBE_DNS_NAME, timeout))
+    probes.append((probe_http, PROBE_HTTP_URL, timeout))
+    if gateway:
+        probes.append((probe_tcp, gateway, 53, timeout))
+
+    results = queue.Queue()
+    for probe, *args in probes:
+        threading.Thread(target=lambda probe=probe, args=args: results.put(probe(*args)),
+                         name="probe", daemon=True).start()
+
+    deadline = time.monotonic() + timeout + 1
+    for _ in probes:
+        try:
+            if results.get(timeout=max(0.0, deadline - time.monotonic())):
+                return True
+        except queue.Empty:
+            break
+    return False
+
+
+def wait_for_connection(timeout=30, interval=0.5, max_interval=4, backoff=1.5, gateway=None):
+    """
+    Опрашивает сеть, пока она не появится или не истечет timeout.
+    Сначала часто (interval), затем все реже - до max_interval между проверками.
+    Возвращает время до появления сети в секундах или None.
+    """
+    started = time.monotonic()
+    deadline = started + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if check_internet_connection(timeout=max(0.5, min(2, remaining)), gateway=gateway):
+            return time.monotonic() - started
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        time.sleep(min(interval, remaining))
+        interval = min(interval * backoff, max_interval)
+
+
+def wait_for_adapter_state(adapter_name, is_up, timeout=10, interval=0.2):
+    """Ждет, пока адаптер перейдет в состояние is_up; True - дождались"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = psutil.net_if_stats().get(adapter_name)
+        # Отключенный адаптер может вовсе пропасть из списка интерфейсов
+        if (stats is not None and stats.isup) == is_up:
+            return True
+        time.sleep(interval)
+    return False
+
+
+def toggle_wifi_adapter(adapter_name, max_retries=10, connect_timeout=30, check_first=True):
+    """
+    Отключает и включает wi-fi адаптер, повторяя попытки, если интернет не появляется.
+    После включения сеть проверяется часто и с нарастающим интервалом, поэтому функция
+    возвращается сразу, как только соединение появилось, а не через фиксированную паузу.
+    check_first=False - адаптер переключается без предварительной проверки сети, и
+    True означает, что связь вернулась именно после переключения
+    """
+    if check_first and check_internet_connection():
         return True
+    # Шлюз запоминаем до отключения: сразу после включения адаптера маршрута еще нет
+    gateway = get_default_gateway()
     for attempt in range(1, max_retries + 1):
         print(f"\nПопытка {attempt}/{max_retries}:")
         print(f"Попытка отключить адаптер: {adapter_name}")
         try:
             # Отключение адаптера
             subprocess.run(['netsh', 'interface', 'set', 'interface', adapter_name, 'disable'], check=True)
-            print(f"Адаптер {adapter_name} отключен. Ожидание 3 секунды...")
-            time.sleep(3) # Даем время на полное отключение
+            if not wait_for_adapter_state(adapter_name, is_up=False, timeout=5):
+                print(f"Адаптер {adapter_name} не сообщил об отключении за 5 секунд, продолжаем")
+            else:
+                print(f"Адаптер {adapter_name} отключен.")
 
             # Включение адаптера
             print(f"Попытка включить адаптер: {adapter_name}")
             subprocess.run(['netsh', 'interface', 'set', 'interface', adapter_name, 'enable'], check=True)
-            print(f"Адаптер {adapter_name} включен. Ожидание 30 секунд для появления соединения...") # TODO вынести время ожидания в параметр функции и выводить в этой строке
-            time.sleep(30) # Ждем 30 секунд для появления соединения
+            print(f"Адаптер {adapter_name} включен. Ожидание соединения до {connect_timeout} секунд...")
+            wait_for_adapter_state(adapter_name, is_up=True, timeout=connect_timeout)
 
-            if check_internet_connection():
-                print("Интернет-соединение установлено успешно!")
+            elapsed = wait_for_connection(timeout=connect_timeout, gateway=gateway)
+            if elapsed is not None:
+                print(f"Интернет-соединение установлено успешно за {elapsed:.1f} с!")
                 return True
             else:
                 print("Интернет-соединение не обнаружено после включения адаптера.")
@@ -104,6 +251,94 @@ def toggle_wifi_adapter(adapter_name, max_retries=10):
             return False # Выход при непредвиденной ошибке
     return False # Должно быть достигнуто, если все попытки исчерпаны
 
+def log_error(message):
+    """Пишет ошибку в консоль и в лог-файл"""
+    print(message)
+    try:
+        with open(WIFI_LOG_FILE, 'a+') as f:
+            f.write(f"{message}\n")
+    except OSError:
+        pass
+
+
+def link_looks_up(adapter_name):
+    """Дешевая проверка без сетевых запросов: адаптер включен и подключен"""
+    stats = psutil.net_if_stats().get(adapter_name)
+    return stats is not None and stats.isup
+
+
+def received_bytes(adapter_name):
+    counters = psutil.net_io_counters(pernic=True).get(adapter_name)
+    return counters.bytes_recv if counters is not None else None
+
+
+def watch_connection(adapter_name, check_interval=10, probe_interval=300, quiet_period=60,
+                     repair_interval=60, history_path=OUTAGES_FILE):
+    """
+    Сторож сети: работает постоянно и чинит соединение, если оно пропало.
+
+    Каждые check_interval секунд выполняется только дешевая проверка состояния адаптера и
+    счетчика принятых байт (без сетевых запросов). Активная проверка связи запускается,
+    если адаптер отключился, если за quiet_period не пришло ни одного байта, или раз в
+    probe_interval секунд на случай "адаптер подключен, а интернета нет".
+    Подтвержденный перебой чинится закрытием WireGuard и перезапуском адаптера (не чаще
+    раза в repair_interval), а после восстановления записывается в историю перебоев.
+    """
+    last_probe = time.monotonic()
+    last_bytes = received_bytes(adapter_name)
+    last_traffic = time.monotonic()
+    outage_started = None
+    last_repair = 0.0
+    repaired = False
+
+    while True:
+        time.sleep(check_interval)
+        try:
+            now = time.monotonic()
+
+            current_bytes = received_bytes(adapter_name)
+            if current_bytes != last_bytes:
+                last_bytes, last_traffic = current_bytes, now
+
+            suspicious = (
+                outage_started is not None
+                or not link_looks_up(adapter_name)
+                or now - last_traffic > quiet_period
+                or now - last_probe > probe_interval
+            )
+            if not suspicious:
+                continue
+
+            last_probe = now
+            # Один неудачный ответ - еще не перебой: перепроверяем с частым опросом
+            online = check_internet_connection() or (
+                outage_started is None and wait_for_connection(timeout=10) is not None
+            )
+            if online:
+                last_traffic = now  # Трафик появится сам; не перепроверяем на следующем шаге
+                if outage_started is not None:
+                    outage = Outage(outage_started, time.time(), repaired)
+                    append_outage(outage, history_path)
+                    print(f"Связь восстановлена: {outage.describe()}")
+                    outage_started, repaired = None, False
+                continue
+
+            if outage_started is None:
+                outage_started = time.time() - check_interval
+                print("Связь пропала, начинаю восстановление")
+
+            if now - last_repair >= repair_interval:
+                last_repair = now
+                kill_process('wireguard.exe')
+                if check_internet_connection():
+                    continue  # Связь вернулась без переключения адаптера - это не починка
+                if toggle_wifi_adapter(adapter_name, max_retries=1, check_first=False):
+                    repaired = True
+                    last_repair = 0.0
+        except Exception as watch_error:
+            # Сторож не должен останавливаться из-за одного сбоя: пишем ошибку и следим дальше
+            log_error(f"Ошибка сторожа сети: {watch_error}")
+
 if __name__ == "__main__":
     try:
         # if check_process('wireguard.exe'):
@@ -113,6 +348,9 @@ if __name__ == "__main__":
             print("Скрипт завершен успешно: интернет-соединение восстановлено.")
         else:
             print("Скрипт завершен: не удалось восстановить интернет-соединение.")
+
+        # Дальше следим за сетью постоянно; "--once" - только починка при запуске
+        if "--once" not in sys.argv:
+            watch_connection(WIFI_ADAPTER_NAME)
     except Exception as wifi_error:
-        with open('/logs/wifi_log.txt', 'a+') as f:
-            f.write(f"Ошибка wifi_fixer: {wifi_error}\n")
\ No newline at end of file
+        log_error(f"Ошибка wifi_fixer: {wifi_error}")
\ No newline at end of file
@@ -0,0 +1,173 @@
+"""
+Реестр окон с кэшированием имен процессов и инкрементальным обновлением
+"""
+
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class WindowBackend(ABC):
+    """Интерфейс доступа к окнам и процессам ОС"""
+
+    @abstractmethod
+    def enum_windows(self) -> List[Tuple[int, str, int]]:
+        """Возвращает (hwnd, заголовок, pid) для всех видимых окон с заголовком"""
+
+    @abstractmethod
+    def process_identity(self, pid: int) -> Tuple[str, float]:
+        """
+        Возвращает (имя процесса, время создания)
+
+        Время создания позволяет отличить новый процесс от старого с тем же PID.
+        Если процесса нет или к нему нет доступа - бросает LookupError.
+        """
+
+    def process_create_time(self, pid: int) -> float:
+        """Возвращает время создания процесса (LookupError если процесса нет)"""
+        return self.process_identity(pid)[1]
+
+
+class FakeWindowBackend(WindowBackend):
+    """Фейковый бэкенд для проверки и замеров реестра без Win32"""
+
+    def __init__(self):
+        self.windows: Dict[int, Tuple[str, int]] = {}
+        self.processes: Dict[int, Tuple[str, float]] = {}
+        self.identity_calls = 0
+        self._clock = 0.0
+
+    def start_process(self, pid: int, name: str) -> None:
+        """Запускает (или перезапускает с тем же PID) процесс"""
+        self._clock += 1.0
+        self.processes[pid] = (name, self._clock)
+
+    def stop_process(self, pid: int) -> None:
+        """Завершает процесс вместе со всеми его окнами"""
+        self.processes.pop(pid, None)
+        for hwnd in [h for h, (_, p) in self.windows.items() if p == pid]:
+            del self.windows[hwnd]
+
+    def open_window(self, hwnd: int, title: str, pid: int) -> None:
+        self.windows[hwnd] = (title, pid)
+
+    def close_window(self, hwnd: int) -> None:
+        self.windows.pop(hwnd, None)
+
+    def enum_windows(self) -> List[Tuple[int, str, int]]:
+        return [(hwnd, title, pid) for hwnd, (title, pid) in self.windows.items()]
+
+    def process_identity(self, pid: int) -> Tuple[str, float]:
+        self.identity_calls += 1
+        try:
+            return self.processes[pid]
+        except KeyError:
+            raise LookupError(f"Процесс {pid} не найден") from None
+
+
+class WindowRegistry:
+    """
+    Кэш списка видимых окон
+
+    При обновлении сравнивает результат EnumWindows с предыдущим: имя процесса
+    запрашивается только для новых окон, а для уже известных PID дополнительно
+    проверяется время создания процесса, чтобы не перепутать процессы при
+    повторном использовании PID.
+    """
+
+    def __init__(self, backend: WindowBackend, max_age: float = 2.0):
+        self.backend = backend
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._windows: Dict[int, Dict[str, str]] = {}
+        self._order: List[int] = []
+        # pid -> (имя процесса, время создания)
+        self._processes: Dict[int, Tuple[str, float]] = {}
+        self._refreshed_at: Optional[float] = None
+        self.hits = 0
+        self.refreshes = 0
+
+    def get_windows(self, max_age: Optional[float] = None) -> List[Dict[str, str]]:
+        """Возвращает список окон, обновляя его только если кэш устарел"""
+        max_age = self.max_age if max_age is None else max_age
+        with self._lock:
+            if self._refreshed_at is None or time.monotonic() - self._refreshed_at > max_age:
+                self._refresh_locked()
+            else:
+                self.hits += 1
+            return [dict(self._windows[hwnd]) for hwnd in self._order]
+
+    def refresh(self) -> None:
+        """Принудительно обновляет реестр"""
+        with self._lock:
+            self._refresh_locked()
+
+    def invalidate(self) -> None:
+        """Помечает кэш устаревшим (например, после закрытия окна ботом)"""
+        with self._lock:
+            self._refreshed_at = None
+
+    def _refresh_locked(self) -> None:
+        records = self.backend.enum_windows()
+        windows: Dict[int, Dict[str, str]] = {}
+        order: List[int] = []
+        verified: Dict[int, bool] = {}
+
+        for hwnd, title, pid in records:
+            known = self._windows.get(hwnd)
+            if known is not None and known['pid'] == str(pid):
+                # Окно уже известно - обновляем только заголовок
+                if known['title'] != title:
+                    known = dict(known, title=title)
+                windows[hwnd] = known
+            else:
+                windows[hwnd] = {
+                    'hwnd': str(hwnd),
+                    'title': title,
+                    'process': self._process_name(pid, verified),
+                    'pid': str(pid),
+                }
+            order.append(hwnd)
+
+        # Забываем процессы, у которых не осталось окон
+        alive = {int(window['pid']) for window in windows.values()}
+        for pid in list(self._processes):
+            if pid not in alive:
+                del self._processes[pid]
+
+        self._windows = windows
+        self._order = order
+        self._refreshed_at = time.monotonic()
+        self.refreshes += 1
+
+    def _process_name(self, pid: int, verified: Dict[int, bool]) -> str:
+        """Имя процесса из кэша с проверкой на повторное использование PID"""
+        cached = self._processes.get(pid)
+        try:
+            if cached is not None:
+                if pid not in verified:
+                    verified[pid] = self.backend.process_create_time(pid) == cached[1]
+                if verified[pid]:
+                    return cached[0]
+
+            name, create_time = self.backend.process_identity(pid)
+            self._processes[pid] = (name, create_time)
+            verified[pid] = True
+            return name
+        except LookupError as e:
+            logger.debug(f"Не удалось получить процесс {pid}: {e}")
+            self._processes.pop(pid, None)
+            return 'Unknown'
+
+    def stats(self) -> Dict[str, int]:
+        """Статистика работы кэша"""
+        return {
+            "windows": len(self._order),
+            "processes": len(self._processes),
+            "hits": self.hits,
+            "refreshes": self.refreshes,
+        }
@@ -4,75 +4,70 @@
 Модуль для управления Windows системой
 """
 
+import math
 import os
-import time
-from typing import List, Dict
-
-import dotenv
-from dotenv import load_dotenv
-load_dotenv()
+from typing import List, Dict, Optional, Tuple
 
 import psutil
 import win32con
 import win32gui
 import win32process
+
+from command_runner import command_runner
+from metrics import instrument
+from system_info import system_info_provider
+from window_registry import WindowBackend, WindowRegistry
+
+# .env уже загружен в bot.py до первого обращения к этому модулю
 screen_password = os.getenv("UNLOCK_PASSWORD")
-import pyautogui
-pyautogui.FAILSAFE = False
 
 class WindowsSystemController:
     """Расширенный класс для управления Windows системой"""
     
     @staticmethod
-    def shutdown(force: bool = False) -> str:
+    async def shutdown(force: bool = False) -> str:
         """Выключение компьютера"""
-        try:
-            if force:
-                os.system("shutdown /s /f /t 0")
-            else:
-                os.system("shutdown /s /t 0")
+        args = ["shutdown", "/s", "/f", "/t", "0"] if force else ["shutdown", "/s", "/t", "0"]
+        result = await command_runner.run(*args)
+        if result.ok:
             return "✅ Команда выключения отправлена"
-        except Exception as e:
-            return f"❌ Ошибка выключения: {str(e)}"
+        return f"❌ Ошибка выключения: {result.describe()}"
     
     @staticmethod
-    def restart(force: bool = False) -> str:
+    async def restart(force: bool = False) -> str:
         """Перезагрузка компьютера"""
-        try:
-            if force:
-                os.system("shutdown /r /f /t 0")
-            else:
-                os.system("shutdown /r /t 0")
+        args = ["shutdown", "/r", "/f", "/t", "0"] if force else ["shutdown", "/r", "/t", "0"]
+        result = await command_runner.run(*args)
+        if result.ok:
             return "✅ Команда перезагрузки отправлена"
-        except Exception as e:
-            return f"❌ Ошибка перезагрузки: {str(e)}"
+        return f"❌ Ошибка перезагрузки: {result.describe()}"
     
     @staticmethod
-    def sleep() -> str:
+    async def sleep() -> str:
         """Переход в режим сна"""
-        try:
-            os.system("rundll32.exe powrprof.dll,SetSuspendState 0,1,0")
+        # SetSuspendState возвращает управление только после пробуждения,
+        # поэтому таймаут не ограничиваем - цикл событий при этом не блокируется
+        result = await command_runner.run("rundll32.exe", "powrprof.dll,SetSuspendState", "0,1,0",
+                                          timeout=math.inf)
+        if result.ok:
             return "✅ Компьютер переходит в режим сна"
-        except Exception as e:
-            return f"❌ Ошибка перехода в сон: {str(e)}"
+        return f"❌ Ошибка перехода в сон: {result.describe()}"
     
     @staticmethod
-    def hibernate() -> str:
+    async def hibernate() -> str:
         """Переход в режим гибернации"""
-        try:
-            os.system("shutdown /h")
+        result = await command_runner.run("shutdown", "/h", timeout=math.inf)
+        if result.ok:
             return "✅ Компьютер переходит в режим гибернации"
-        except Exception as e:
-            return f"❌ Ошибка гибернации: {str(e)}"
+        return f"❌ Ошибка гибернации: {result.describe()}"
     
     @staticmethod
-    def lock_screen() -> str:
+    async def lock_screen() -> str:
         """Блокировка экрана"""
-        try:
-            os.system("rundll32.exe user32.dll,LockWorkStation")
+        result = await command_runner.run("rundll32.exe", "user32.dll,LockWorkStation")
+        if result.ok:
             return "✅ Экран заблокирован"
-        except Exception as e:
-            return f"❌ Ошибка блокировки: {str(e)}"
+        return f"❌ Ошибка блокировки: {result.describe()}"
 
     # @staticmethod
     # def unlock_screen() -> str:
@@ -92,61 +87,21 @@ class WindowsSystemController:
     """
     
     @staticmethod
+    @instrument()
     def get_system_info() -> Dict[str, str]:
         """Получение информации о системе"""
         try:
-            info = {
-                "Компьютер": os.environ.get('COMPUTERNAME', 'Неизвестно'),
-                "Пользователь": os.environ.get('USERNAME', 'Неизвестно'),
-                "ОС": f"{os.name} {os.sys.platform}",
-                "Время работы": WindowsSystemController._get_uptime(),
-                "CPU": f"{psutil.cpu_count()} ядер, загрузка: {psutil.cpu_percent()}%",
-                "RAM": WindowsSystemController._get_memory_info(),
-                "Диск": WindowsSystemController._get_disk_info()
-            }
-            return info
+            return system_info_provider.get_system_info()
         except Exception as e:
             return {"Ошибка": str(e)}
-    
-    @staticmethod
-    def _get_uptime() -> str:
-        """Получение времени работы системы"""
-        try:
-            uptime_seconds = time.time() - psutil.boot_time()
-            hours, remainder = divmod(int(uptime_seconds), 3600)
-            minutes, seconds = divmod(remainder, 60)
-            return f"{hours}ч {minutes}м {seconds}с"
-        except:
-            return "Неизвестно"
-    
-    @staticmethod
-    def _get_memory_info() -> str:
-        """Получение информации о памяти"""
-        try:
-            memory = psutil.virtual_memory()
-            total_gb = memory.total / (1024**3)
-            used_gb = memory.used / (1024**3)
-            return f"{used_gb:.1f}GB / {total_gb:.1f}GB ({memory.percent}%)"
-        except:
-            return "Неизвестно"
-    
-    @staticmethod
-    def _get_disk_info() -> str:
-        """Получение информации о диске"""
-        try:
-            disk = psutil.disk_usage('C:')
-            total_gb = disk.total / (1024**3)
-            used_gb = disk.used / (1024**3)
-            return f"{used_gb:.1f}GB / {total_gb:.1f}GB ({disk.percent}%)"
-        except:
-            return "Неизвестно"
 
 class WindowsProcessManager:
     """Класс для управления процессами Windows"""
     
     @staticmethod
-    def get_running_processes(limit: int = 20) -> List[Dict[str, str]]:
-        """Получение списка запущенных процессов"""
+    @instrument()
+    def get_running_processes(limit: Optional[int] = 20) -> List[Dict[str, str]]:
+        """Получение списка запущенных процессов (limit=None - все процессы)"""
         try:
             processes = []
             for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent']):
@@ -164,12 +119,13 @@ class WindowsProcessManager:
             
             # Сортируем по использованию CPU
             processes.sort(key=lambda x: float(x['cpu'].replace('%', '')), reverse=True)
-            return processes[:limit]
+            return processes if limit is None else processes[:limit]
         
         except Exception as e:
             return [{'error': str(e)}]
     
     @staticmethod
+    @instrument()
     def kill_process(pid: int) -> str:
         """Завершение процесса по PID"""
         try:
@@ -205,44 +161,56 @@ class WindowsProcessManager:
         except Exception as e:
             return f"❌ Ошибка завершения процесса: {str(e)}"
 
-class WindowsWindowManager:
-    """Класс для управления окнами Windows"""
-    
-    @staticmethod
-    def get_visible_windows() -> List[Dict[str, str]]:
-        """Получение списка видимых окон"""
+class Win32WindowBackend(WindowBackend):
+    """Бэкенд реестра окон на Win32 API"""
+
+    def enum_windows(self) -> List[Tuple[int, str, int]]:
         windows = []
-        
+
         def enum_windows_callback(hwnd, windows_list):
             if win32gui.IsWindowVisible(hwnd):
                 window_text = win32gui.GetWindowText(hwnd)
                 if window_text:  # Только окна с заголовком
-                    try:
-                        # Получаем информацию о процессе
-                        _, pid = win32process.GetWindowThreadProcessId(hwnd)
-                        process = psutil.Process(pid)
-                        
-                        windows_list.append({
-                            'hwnd': str(hwnd),
-                            'title': window_text[:50],  # Ограничиваем длину заголовка
-                            'process': process.name(),
-                            'pid': str(pid)
-                        })
-                    except:
-                        windows_list.append({
-                            'hwnd': str(hwnd),
-                            'title': window_text[:50],
-                            'process': 'Unknown',
-                            'pid': 'Unknown'
-                        })
-        
+                    _, pid = win32process.GetWindowThreadProcessId(hwnd)
+                    windows_list.append((hwnd, window_text, pid))
+
+        win32gui.EnumWindows(enum_windows_callback, windows)
+        return windows
+
+    def process_identity(self, pid: int) -> Tuple[str, float]:
+        try:
+            process = psutil.Process(pid)
+            return process.name(), process.create_time()
+        except psutil.Error as e:
+            raise LookupError(str(e)) from e
+
+    def process_create_time(self, pid: int) -> float:
+        try:
+            return psutil.Process(pid).create_time()
+        except psutil.Error as e:
+            raise LookupError(str(e)) from e
+
+
+window_registry = WindowRegistry(Win32WindowBackend())
+
+
+class WindowsWindowManager:
+    """Класс для управления окнами Windows"""
+    
+    @staticmethod
+    @instrument()
+    def get_visible_windows(limit: Optional[int] = None) -> List[Dict[str, str]]:
+        """Получение списка видимых окон (из кэша реестра окон, limit=None - все окна)"""
         try:
-            win32gui.EnumWindows(enum_windows_callback, windows)
-            return windows[:20]  # Ограничиваем количество окон
+            windows = window_registry.get_windows()
+            for window in windows:
+                window['title'] = window['title'][:50]  # Ограничиваем длину заголовка
+            return windows if limit is None else windows[:limit]
         except Exception as e:
             return [{'error': str(e)}]
     
     @staticmethod
+    @instrument()
     def activate_window(hwnd: int) -> str:
         """Активация окна по handle"""
         try:
@@ -281,6 +249,7 @@ class WindowsWindowManager:
             if win32gui.IsWindow(hwnd):
                 window_title = win32gui.GetWindowText(hwnd)
                 win32gui.PostMessage(hwnd, win32con.WM_CLOSE, 0, 0)
+                window_registry.invalidate()
                 return f"✅ Команда закрытия отправлена окну '{window_title}'"
             else:
                 return "❌ Окно не найдено"
@@ -291,33 +260,29 @@ class WindowsVolumeController:
     """Класс для управления звуком"""
     
     @staticmethod
-    def set_volume(level: int) -> str:
+    async def set_volume(level: int) -> str:
         """Установка уровня громкости (0-100)"""
-        try:
-            if 0 <= level <= 100:
-                # Используем nircmd для управления звуком
-                os.system(f"nircmd.exe setsysvolume {int(level * 655.35)}")
-                return f"✅ Громкость установлена на {level}%"
-            else:
-                return "❌ Уровень громкости должен быть от 0 до 100"
-        except Exception as e:
-            return f"❌ Ошибка установки громкости: {str(e)}"
+        if not 0 <= level <= 100:
+            return "❌ Уровень громкости должен быть от 0 до 100"
+
+        # Используем nircmd для управления звуком
+        result = await command_runner.run("nircmd.exe", "setsysvolume", str(int(level * 655.35)), timeout=5)
+        if result.ok:
+            return f"✅ Громкость установлена на {level}%"
+        return f"❌ Ошибка установки громкости: {result.describe()}"
     
     @staticmethod
-    def mute() -> str:
+    async def mute() -> str:
         """Отключение звука"""
-        try:
-            os.system("nircmd.exe mutesysvolume 1")
+        result = await command_runner.run("nircmd.exe", "mutesysvolume", "1", timeout=5)
+        if result.ok:
             return "✅ Звук отключен"
-        except Exception as e:
-            return f"❌ Ошибка отключения звука: {str(e)}"
+        return f"❌ Ошибка отключения звука: {result.describe()}"
     
     @staticmethod
-    def unmute() -> str:
+    async def unmute() -> str:
         """Включение звука"""
-        try:
-            os.system("nircmd.exe mutesysvolume 0")
+        result = await command_runner.run("nircmd.exe", "mutesysvolume", "0", timeout=5)
+        if result.ok:
             return "✅ Звук включен"
-        except Exception as e:
-            return f"❌ Ошибка включения звука: {str(e)}"
-
+        return f"❌ Ошибка включения звука: {result.describe()}"